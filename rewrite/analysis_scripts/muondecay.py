@@ -3,6 +3,8 @@
 import sys
 import gzip
 
+from ..lib.analyzers.ClockModel import ClockModel, NS_PER_DAY
+
 # IMPORTANT
 # The order of the szintillators is 0->2->1
 ######
@@ -20,24 +22,10 @@ BIT2 = 1 << 2  # GPS data possible corrupted
 BIT3 = 1 << 3  # Current or last 1PPS rate not within range
 
 
-def time_to_seconds(time, correction):
-    '''
-    Convert hhmmss,xxx string int seconds since day start
-    '''
-#    print time,correction
-    tfields = time.split(".")
-    t = tfields[0]
-    secs_since_day_start = int(t[0:2])*3600+int(t[2:4])*60+int(t[4:6])
-    evt_time = secs_since_day_start + \
-        int(tfields[1])/1000.0+int(correction)/1000.0
-    return round(evt_time)
-
-
 for filename in files:
 
     muon = {0: False, 1: False, 2: False, "Time": 0.}
-    freq = 25e6  # 25 MHz
-    last_onepps = 0
+    clock = ClockModel()
     last_muon = 0
     wait_fe0 = False
     time_ch0 = 0.
@@ -59,11 +47,6 @@ for filename in files:
     decay_start_time_ch1 = 0.
     decay_waiting_ch1 = False
     last_seconds = 0.
-    last_time = 0.
-    last_triggercount = 0
-    switched_onepps = False
-    last_onepps = 0
-    onepps_count = 0
 
     if filename.endswith('.gz'):
         f = gzip.open(filename)
@@ -102,32 +85,12 @@ for filename in files:
         fe_1 = (fields[4] != "00")
         re_2 = (fields[5] != "00")
         fe_2 = (fields[6] != "00")
-        if last_onepps != onepps_count:
-            if onepps_count > last_onepps:
-                freq = float(onepps_count - last_onepps)
-            else:
-                freq = float(0xFFFFFFFF + onepps_count - last_onepps)
-#        print "Freq:",freq
-            prevlast_onepps = last_onepps
-            last_onepps = onepps_count
-            switched_onepps = True
-        time = fields[10]
-        correction = fields[15]
-        seconds = time_to_seconds(time, correction) + \
-            (trigger_count - onepps_count)/freq
-        if time == last_time and switched_onepps:
-            print("Correcting delayed onepps switch:", seconds, line)
-            seconds = time_to_seconds(
-                time, correction)+(trigger_count - prevlast_onepps)/freq
-        else:
-            last_time = time
-            switched_onepps = False
-
-        if trigger_count < last_triggercount and not switched_onepps:
-            print("Correcting trigger count rollover:", seconds, line)
-            seconds += int(0xFFFFFFFF)/freq
-        else:
-            last_triggercount = trigger_count
+        # the clock model corrects for counter rollovers and delayed 1PPS
+        # switches
+        ns = clock.timestamp(trigger_count, onepps_count, fields[10],
+                             fields[11], fields[15])
+        # seconds since day start, small enough to keep ns resolution
+        seconds = (ns % NS_PER_DAY) * 1e-9
 
         if last_seconds > seconds:
             print("Wrong event order", seconds, line)
@@ -4,6 +4,12 @@ import gzip
 import bz2
 from operator import itemgetter
 
+import numpy as np
+
+from ..lib.analyzers.TriggerLines import iter_file
+from ..lib.analyzers.ClockModel import ClockModel, NS_PER_DAY
+from ..lib.analyzers.Coincidence import CoincidenceFinder, mask_channels
+
 BIT0_4 = 31
 BIT5 = 1 << 5
 BIT7 = 1 << 7
@@ -63,65 +69,60 @@ class Pulse(object):
             raise ValueError()
 
 
-def coroutine(func):
-    def start(*args, **kwargs):
-        cr = func(*args, **kwargs)
-        next(cr)
-        return cr
-    return start
-
-
-@coroutine
-def muon_finder(muon_callback, muon=((0, 2), (0, 3), (1, 2), (1, 3))):
-    def reset(d):
-        for key in d.keys():
-            d[key] = 0.
-
-    def coincidence_found(channels, muon):
-        for comb in muon:
-            coinc = True
-            for ch in comb:
-                if channels[ch] == 0.:
-                    coinc = False
-                    break
-            if coinc:
-                return True
-        return False
-
-    channels = {0: 0., 1: 0., 2: 0., 3: 0.}
-    lastpulse_time = 0.
-    while True:
-        pulse = (yield)
-        ch = pulse[0]
-        time = pulse[1]
-        if 0 < time - lastpulse_time < MUON_WIND or lastpulse_time == 0.:
-            channels[ch] = time
-            lastpulse_time = time
-        else:
-            if coincidence_found(channels, muon):
-                muon_callback(channels)
-            reset(channels)
-            channels[ch] = time
-            lastpulse_time = time
-
-
-def muon_printer(channels):
-    muon_time = min([t for t in channels.values() if t != 0.])
-    print("MUON %10.3f" % muon_time, [k for k, v in channels.items() if v != 0.0])
-
-
-def analyze_files(filelist, callback=muon_printer):
+def muon_printer(coincidence):
+    muon_time, mask, _ = coincidence
+    print("MUON %10.3f" % muon_time, mask_channels(mask))
+
+
+def legacy_line_times(lines):
+    """
+    Line times in seconds since day start like former versions computed
+    them: the GPS time rounded to full seconds plus the counts since the
+    last 1PPS at a fixed freq, without counter rollovers.
+    """
+    seconds = np.round(lines["gps_time"] + lines["correction"] / 1000.0)
+    return seconds + (lines["trigger_count"].astype(np.int64) -
+                      lines["one_pps"].astype(np.int64)) / freq
+
+
+def analyze_files(filelist, callback=muon_printer,
+                  muon=((0, 2), (0, 3), (1, 2), (1, 3)), legacy_clock=False,
+                  strict_order=False, flush=True):
+    """
+    Find muons in raw DAQ files.
+
+    The defaults differ from former versions of this script in three ways,
+    each can be switched back to reproduce their counts:
+
+    - legacy_clock: line times from a fixed 25 MHz counter, instead of the
+      ClockModel with measured frequency and counter rollovers
+    - strict_order: pulses with the same time as the pulse before or
+      slightly out of order start a new cluster
+    - flush: if False the last cluster is never reported
+
+    :param filelist: raw files, may be compressed with gzip or bzip2
+    :type filelist: list of str
+    :param callback: called with every muon (time, channel mask, pulses)
+    :type callback: callable
+    :param muon: channel combinations which are a muon
+    :type muon: list of tuple of int
+    :param legacy_clock: use the clock of former versions
+    :type legacy_clock: bool
+    :param strict_order: cluster like former versions
+    :type strict_order: bool
+    :param flush: report the last cluster
+    :type flush: bool
+    :returns: None
+    """
 
     verbose = False
-    pulse0 = Pulse(0)
-    pulse1 = Pulse(1)
-    pulse2 = Pulse(2)
-    pulse3 = Pulse(3)
+    pulses_by_channel = [Pulse(0), Pulse(1), Pulse(2), Pulse(3)]
 
     pulse_counter = 0
-    muon_decay = muon_finder(callback, muon=((0, 2), (0, 3), (1, 2), (1, 3)))
+    muon_finder = CoincidenceFinder(muon, MUON_WIND,
+                                    strict_order=strict_order)
     last_onepps_count = 0
-    gps_valid = True
+    clock = ClockModel()
 
     for filename in filelist:
         if filename.endswith('.bz2'):
@@ -129,146 +130,83 @@ def analyze_files(filelist, callback=muon_printer):
         elif filename.endswith('.gz'):
             f = gzip.open(filename)
         else:
-            f = open(filename)
-        all_pulses = []
-        for line in f:
-            if verbose:
-                print(line)
-            fields = line.rstrip("\n").split(" ")
-            # Ignore malformed lines
-            if len(fields) != 16:
-                continue
-            # Ignore everything that is not trigger data
-            if len(fields[0]) != 8:
-                continue
-            # Check if GPS data is valid
-#            if fields[12] != "A":
-#                if gps_valid: print "Error: GPS data not valid"
-#                gps_valid = False
-#                continue
-            gps_valid = True
-            # Another check, sometimes lines are mixed,
-            # try if we can convert the last field to an int
-            try:
-                int(fields[len(fields)-1])
-            except ValueError:
-                continue
-#        Check if error bits are set
-            if fields[14] != "0":
-                err = int(fields[14], 16)
-                if (err & BIT0) != 0:
-                    print('Error: 1 PPS interrupt pending', end=' ')
-                if (err & BIT1) != 0:
-                    #                    print 'Error: Trigger interrupt pending',
-                    pass
-                if (err & BIT2) != 0:
-                    print('Error: GPS data corrupt', end=' ')
-                if (err & BIT3) != 0:
-                    #                    print 'Error: 1PPS rate not within range',
-                    pass
-#                print line.rstrip('\n')
-#                continue
-            trigger_count = int(fields[0], 16)
-            onepps_count = int(fields[9], 16)
-            if onepps_count != last_onepps_count:
-                if verbose:
-                    print("PPS:", onepps_count - last_onepps_count)
-                last_onepps_count = onepps_count
-
-            trigger = (int(fields[1], 16) & BIT7) != 0
-
-            time = fields[10]
-            correction = fields[15]
-            seconds = time_to_seconds(time, correction)
-            line_time = seconds + (trigger_count - onepps_count)/freq
-            if trigger:
-                if verbose:
-                    print("Trigger: %10.12f" % (line_time,))
-                pulse0.invalidate()
-                pulse1.invalidate()
-                pulse2.invalidate()
-                pulse3.invalidate()
-
-            re0 = int(fields[1], 16)
-            if re0 & BIT5 != 0:
-                time = line_time + (re0 & BIT0_4) * MINI_TICK
-                pulse0.rise(time)
-                if verbose:
-                    print("0> %10.12f" % (time,))
-            fe0 = int(fields[2], 16)
-            if fe0 & BIT5 != 0:
-                time = line_time + (fe0 & BIT0_4) * MINI_TICK
-                pulse0.fall(time)
+            f = open(filename, 'rb')
+        # malformed lines and everything that is not trigger data are
+        # dropped by the parser
+        for lines in iter_file(f):
+            if legacy_clock:
+                line_times = legacy_line_times(lines)
+            else:
+                ns, _ = clock.timestamps(lines)
+                # seconds since day start, small enough to keep ns
+                # resolution
+                line_times = (ns % NS_PER_DAY) * 1e-9
+            triggers = (lines["edges"][:, 0] & BIT7) != 0
+            # rising and falling edges of all channels
+            edges = lines["edges"]
+            edge_seen = (edges & BIT5) != 0
+            edge_times = line_times[:, None] + (edges & BIT0_4) * MINI_TICK
+
+            for i in range(len(lines)):
                 if verbose:
-                    print("0< %10.12f" % (time,))
-            re1 = int(fields[3], 16)
-            if re1 & BIT5 != 0:
-                time = line_time + (re1 & BIT0_4) * MINI_TICK
-                pulse1.rise(time)
-                if verbose:
-                    print("1> %10.12f" % (time,))
-            fe1 = int(fields[4], 16)
-            if fe1 & BIT5 != 0:
-                time = line_time + (fe1 & BIT0_4) * MINI_TICK
-                pulse1.fall(time)
-                if verbose:
-                    print("1< %10.12f" % (time,))
-            re2 = int(fields[5], 16)
-            if re2 & BIT5 != 0:
-                time = line_time + (re2 & BIT0_4) * MINI_TICK
-                pulse2.rise(time)
-                if verbose:
-                    print("2> %10.12f" % (time,))
-            fe2 = int(fields[6], 16)
-            if fe2 & BIT5 != 0:
-                time = line_time + (fe2 & BIT0_4) * MINI_TICK
-                pulse2.fall(time)
-                if verbose:
-                    print("2< %10.12f" % (time,))
-            re3 = int(fields[7], 16)
-            if re3 & BIT5 != 0:
-                time = line_time + (re3 & BIT0_4) * MINI_TICK
-                pulse3.rise(time)
-                if verbose:
-                    print("3> %10.12f" % (time,))
-            fe3 = int(fields[8], 16)
-            if fe3 & BIT5 != 0:
-                time = line_time + (fe3 & BIT0_4) * MINI_TICK
-                pulse3.fall(time)
-                if verbose:
-                    print("3< %10.12f" % (time,))
-
-            pulses = []
-
-            if pulse0.valid:
-                width = pulse0.width()
-                if verbose:
-                    print("0:", width)
-                pulses.append((0, pulse0.rise_time, width))
-                pulse0.invalidate()
-            if pulse1.valid:
-                width = pulse1.width()
-                if verbose:
-                    print("1:", width)
-                pulses.append((1, pulse1.rise_time, width))
-                pulse1.invalidate()
-            if pulse2.valid:
-                width = pulse2.width()
-                if verbose:
-                    print("2:", width)
-                pulses.append((2, pulse2.rise_time, width))
-                pulse2.invalidate()
-            if pulse3.valid:
-                width = pulse3.width()
-                if verbose:
-                    print("3:", width)
-                pulses.append((3, pulse3.rise_time, width))
-                pulse3.invalidate()
-
-            pulses.sort(key=itemgetter(1))
-            for pulse in pulses:
-                if pulse[2] > 2.0:
-                    muon_decay.send(pulse)
+                    print(lines[i])
+#        Check if error bits are set
+                err = lines["status"][i]
+                if err != 0:
+                    if (err & BIT0) != 0:
+                        print('Error: 1 PPS interrupt pending', end=' ')
+                    if (err & BIT1) != 0:
+                        #                    print 'Error: Trigger interrupt pending',
+                        pass
+                    if (err & BIT2) != 0:
+                        print('Error: GPS data corrupt', end=' ')
+                    if (err & BIT3) != 0:
+                        #                    print 'Error: 1PPS rate not within range',
+                        pass
+                onepps_count = int(lines["one_pps"][i])
+                if onepps_count != last_onepps_count:
+                    if verbose:
+                        print("PPS:", onepps_count - last_onepps_count)
+                    last_onepps_count = onepps_count
+
+                if triggers[i]:
+                    if verbose:
+                        print("Trigger: %10.12f" % (line_times[i],))
+                    for pulse in pulses_by_channel:
+                        pulse.invalidate()
+
+                for ch, pulse in enumerate(pulses_by_channel):
+                    if edge_seen[i, 2 * ch]:
+                        time = edge_times[i, 2 * ch]
+                        pulse.rise(time)
+                        if verbose:
+                            print("%d> %10.12f" % (ch, time))
+                    if edge_seen[i, 2 * ch + 1]:
+                        time = edge_times[i, 2 * ch + 1]
+                        pulse.fall(time)
+                        if verbose:
+                            print("%d< %10.12f" % (ch, time))
+
+                pulses = []
+
+                for ch, pulse in enumerate(pulses_by_channel):
+                    if pulse.valid:
+                        width = pulse.width()
+                        if verbose:
+                            print("%d:" % ch, width)
+                        pulses.append((ch, pulse.rise_time, width))
+                        pulse.invalidate()
+
+                pulses.sort(key=itemgetter(1))
+                for pulse in pulses:
+                    if pulse[2] > 2.0:
+                        muon = muon_finder.add(pulse[0], pulse[1])
+                        if muon is not None:
+                            callback(muon)
+
+    muon = muon_finder.flush()
+    if flush and muon is not None:
+        callback(muon)
 
 
 def main(argv=None):
@@ -0,0 +1,71 @@
+"""
+Compare DecayTriggerThorough.trigger with DecaySearch.search.
+
+Run from the rewrite directory::
+
+    python3 -m benchmarks.decay_search [events]
+
+The events are random, with up to three pulses per channel.
+"""
+import logging
+import sys
+from time import perf_counter
+
+import numpy as np
+
+from lib.analyzers.DecaySearch import DecaySearch
+from lib.analyzers.DecayTrigger import DecayTriggerThorough
+from lib.analyzers.PulseExtractor import PULSE_DTYPE
+
+
+def random_pulses(n, seed=1):
+    """
+    PULSE_DTYPE rows of n events
+    """
+    rng = np.random.default_rng(seed)
+    per_channel = rng.choice([0, 0, 1, 1, 2, 3], size=(n, 4))
+    counts = per_channel.ravel()
+    pulses = np.zeros(counts.sum(), dtype=PULSE_DTYPE)
+    pulses["event_id"] = np.repeat(np.arange(n), per_channel.sum(axis=1))
+    pulses["channel"] = np.repeat(np.tile(np.arange(4), n), counts)
+    pulses["rising"] = rng.integers(0, 400, len(pulses)) * 25.0
+    pulses["falling"] = pulses["rising"] + rng.choice([5, 20, 40, 9000],
+                                                      len(pulses))
+    pulses.sort(order=["event_id", "channel", "rising"])
+    return pulses
+
+
+def as_events(pulses, n):
+    """
+    The pulses in the format of PulseExtractor.extract
+    """
+    events = [["", [], [], [], []] for _ in range(n)]
+    for event_id, channel, rising, falling, _ in pulses.tolist():
+        events[event_id][channel + 1].append((rising, falling))
+    return events
+
+
+def run(n=200000):
+    pulses = random_pulses(n)
+    events = as_events(pulses, n)
+
+    trigger = DecayTriggerThorough(logging.getLogger())
+    start = perf_counter()
+    for event in events:
+        trigger.trigger(event)
+    scalar = n / (perf_counter() - start)
+
+    search = DecaySearch()
+    start = perf_counter()
+    search.search(pulses)
+    batch = n / (perf_counter() - start)
+
+    print(f"{n} events, {search.decays} decays")
+    print(f"{'trigger':20s} {scalar:12.0f} events/s")
+    print(f"{'search':20s} {batch:12.0f} events/s")
+    print(f"speedup {batch / scalar:.1f}")
+    return scalar, batch
+
+
+if __name__ == "__main__":
+    run(*[int(a) for a in sys.argv[1:2]])
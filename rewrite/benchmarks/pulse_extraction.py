@@ -0,0 +1,44 @@
+"""
+Compare PulseExtractor.extract with PulseExtractor.extract_many.
+
+Run from the rewrite directory::
+
+    python3 -m benchmarks.pulse_extraction [raw_daq_file] [repetitions]
+
+The lines are taken from a raw DAQ file (default: test/data/daq.txt).
+"""
+import logging
+import sys
+from time import perf_counter
+
+from lib.analyzers.PulseExtractor import PulseExtractor
+
+
+def run(filename="test/data/daq.txt", repetitions=20):
+    with open(filename) as f:
+        lines = f.read().splitlines() * repetitions
+
+    pe = PulseExtractor(logging.getLogger(), "unused")
+    start = perf_counter()
+    for line in lines:
+        try:
+            pe.extract(line)
+        except (IndexError, ValueError):
+            pass
+    scalar = len(lines) / (perf_counter() - start)
+
+    pe = PulseExtractor(logging.getLogger(), "unused")
+    start = perf_counter()
+    pe.extract_many(lines)
+    batch = len(lines) / (perf_counter() - start)
+
+    print(f"{len(lines)} lines from {filename}")
+    print(f"{'extract':20s} {scalar:12.0f} lines/s")
+    print(f"{'extract_many':20s} {batch:12.0f} lines/s")
+    print(f"speedup {batch / scalar:.1f}")
+    return scalar, batch
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run(*args[:1], *[int(a) for a in args[1:2]])
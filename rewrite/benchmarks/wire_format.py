@@ -0,0 +1,55 @@
+"""
+Compare the binary wire format with jsonpickle.
+
+Run from the rewrite directory::
+
+    python3 -m benchmarks.wire_format [recorded_file] [repetitions]
+
+The records are taken from a file written by WriterToFile
+(default: test/data/raw.txt).
+"""
+import sys
+from time import perf_counter
+
+import jsonpickle
+
+from lib.common.WireFormat import encode_record, decode_record
+
+
+def measure(func, items, repetitions):
+    """
+    Apply func to all items repetitions times.
+
+    :returns: float -- items per second
+    """
+    start = perf_counter()
+    for _ in range(repetitions):
+        for item in items:
+            func(item)
+    return len(items) * repetitions / (perf_counter() - start)
+
+
+def run(filename="test/data/raw.txt", repetitions=20):
+    with open(filename) as f:
+        records = [jsonpickle.decode(line) for line in f if line.strip()]
+
+    as_json = [jsonpickle.encode(rec) for rec in records]
+    as_binary = [encode_record(rec) for rec in records]
+
+    results = [
+        ("jsonpickle encode", measure(jsonpickle.encode, records, repetitions)),
+        ("jsonpickle decode", measure(jsonpickle.decode, as_json, repetitions)),
+        ("binary encode", measure(encode_record, records, repetitions)),
+        ("binary decode", measure(decode_record, as_binary, repetitions)),
+    ]
+    print(f"{len(records)} records from {filename}")
+    print(f"mean size: jsonpickle {sum(map(len, as_json)) / len(as_json):.0f} "
+          f"bytes, binary {sum(map(len, as_binary)) / len(as_binary):.0f} bytes")
+    for name, rate in results:
+        print(f"{name:20s} {rate:12.0f} records/s")
+    return results
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    run(*args[:1], *[int(a) for a in args[1:2]])
@@ -0,0 +1,271 @@
+"""
+Run several analyses on one record stream in one process.
+
+The separate analyzer scripts each subscribe to the DAQ server and decode
+every message themselves. The AnalysisHost receives the records once on a
+single SUB socket and passes the decoded batches to a configured set of
+plugins (see AnalysisPlugins)::
+
+    host = AnalysisHost.from_config(["rates", "pulses", "decays",
+                                     "archive"])
+    with host:
+        host.serve_forever()
+
+The CPU time every plugin takes is measured, see stats() and report(), so
+the analyses which are worth moving to a process of their own can be
+found.
+"""
+import logging
+import threading
+from time import monotonic, thread_time, time
+
+import zmq
+
+from ..utils.Stream import DEFAULT_ADDRESS, connect_subscriber, recv_waiting
+from .AnalysisPlugins import load_plugin
+
+
+class PluginStats(object):
+    """
+    Calls, records and CPU time of one plugin in an AnalysisHost.
+    """
+
+    __slots__ = ("calls", "records", "cpu_time", "errors")
+
+    def __init__(self):
+        self.calls = 0
+        self.records = 0
+        self.cpu_time = 0.0
+        self.errors = 0
+
+    def to_dict(self):
+        """
+        :returns: dict -- the counters by name
+        """
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+class AnalysisHost(object):
+    """
+    Receives the records of a DAQ server and passes them to the plugins.
+
+    Every message is decoded once. The messages waiting at the socket are
+    received together, up to MAX_BATCH records or MAX_DELAY seconds, and a
+    plugin gets the records of its record_types as one list. Records derived
+    by a plugin are passed in the same way to the plugins which name their
+    type in record_types, plugins which take all records do not get them, so
+    e.g. the ArchivePlugin only writes what the DAQ server sent. on_tick is
+    called every tick_interval seconds and finalize once on server_close().
+
+    An exception in a plugin is logged and counted, the other plugins keep
+    running. Records can also be passed to process() directly, e.g. when
+    reading a file.
+
+    Can be used as context manager like the ControlServer.
+
+    :param plugins: the plugins
+    :type plugins: list of AnalysisPlugin
+    :param address: address of the DAQ server
+    :type address: str
+    :param tick_interval: seconds between the calls of on_tick
+    :type tick_interval: float
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    # time the loop blocks before checking for shutdown and ticks
+    POLL_TIMEOUT = 500  # milliseconds
+    # limits of the records processed together
+    MAX_BATCH = 10000
+    MAX_DELAY = 0.05  # seconds
+
+    def __init__(self, plugins=(), address=DEFAULT_ADDRESS,
+                 tick_interval=1.0, logger=None):
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        self.address = address
+        self.tick_interval = tick_interval
+        self.plugins = []
+        self._stats = {}
+        self._finalized = False
+        self._stop = threading.Event()
+        self.context = zmq.Context()
+        for plugin in plugins:
+            self.add(plugin)
+
+    @classmethod
+    def from_config(cls, specs, options=None, **kwargs):
+        """
+        Create a host with the plugins of a configuration.
+
+        :param specs: plugin names or classes, see load_plugin
+        :type specs: list of str
+        :param options: constructor arguments by plugin name
+        :type options: dict
+        :param kwargs: passed on to the constructor of the host
+        :returns: AnalysisHost
+        """
+        if options is None:
+            options = {}
+        return cls([load_plugin(spec, **options.get(spec, {}))
+                    for spec in specs], **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def add(self, plugin):
+        """
+        Add a plugin. Must be called before serve_forever().
+
+        :param plugin: the plugin
+        :type plugin: AnalysisPlugin
+        :raises: ValueError
+        :returns: AnalysisPlugin -- the plugin
+        """
+        if plugin.name in self._stats:
+            raise ValueError("There already is a plugin named %s" %
+                             plugin.name)
+        self.plugins.append(plugin)
+        self._stats[plugin.name] = PluginStats()
+        return plugin
+
+    def record_types(self):
+        """
+        :returns: set of RecordType or None -- the types any plugin wants,
+                  None if some plugin wants all records
+        """
+        types = set()
+        for plugin in self.plugins:
+            if plugin.record_types is None:
+                return None
+            types.update(plugin.record_types)
+        return types
+
+    def _call(self, plugin, method, *args):
+        """
+        Call a method of a plugin and account its CPU time.
+        """
+        stats = self._stats[plugin.name]
+        stats.calls += 1
+        start = thread_time()
+        try:
+            return getattr(plugin, method)(*args)
+        except Exception:
+            stats.errors += 1
+            self.logger.exception("%s.%s failed" % (plugin.name, method))
+            return None
+        finally:
+            stats.cpu_time += thread_time() - start
+
+    def process(self, records):
+        """
+        Pass records to the plugins of their types, followed by the records
+        the plugins derived from them.
+
+        :param records: the records
+        :type records: list of Record
+        :returns: None
+        """
+        derived_round = False
+        while records:
+            types = set(rec.type for rec in records)
+            derived = []
+            for plugin in self.plugins:
+                wanted = plugin.record_types
+                if wanted is None and derived_round:
+                    continue
+                if wanted is None or types.issubset(wanted):
+                    batch = records
+                elif types.isdisjoint(wanted):
+                    continue
+                else:
+                    batch = [rec for rec in records if rec.type in wanted]
+                self._stats[plugin.name].records += len(batch)
+                result = self._call(plugin, "on_batch", batch)
+                if result:
+                    derived += result
+            records = derived
+            derived_round = True
+
+    def tick(self, now=None):
+        """
+        Call on_tick of all plugins.
+
+        :param now: the time passed to the plugins, the current time if None
+        :type now: float
+        :returns: None
+        """
+        if now is None:
+            now = time()
+        for plugin in self.plugins:
+            self._call(plugin, "on_tick", now)
+
+    def stats(self):
+        """
+        Calls, records, CPU time in seconds and errors of every plugin.
+
+        :returns: dict -- dict of counters by plugin name
+        """
+        return {name: stats.to_dict() for name, stats in self._stats.items()}
+
+    def report(self):
+        """
+        The CPU time of the plugins as table, most expensive first.
+
+        :returns: str
+        """
+        lines = ["%-20s %10s %12s %10s %6s" %
+                 ("plugin", "calls", "records", "cpu [s]", "errors")]
+        for name, stats in sorted(self._stats.items(),
+                                  key=lambda item: -item[1].cpu_time):
+            lines.append("%-20s %10d %12d %10.3f %6d" %
+                         (name, stats.calls, stats.records, stats.cpu_time,
+                          stats.errors))
+        return "\n".join(lines)
+
+    def serve_forever(self):
+        """
+        Receive and process records until shutdown() is called.
+
+        :returns: None
+        """
+        self._stop.clear()
+        sock = connect_subscriber(self.context, self.record_types(),
+                                  self.address)
+        next_tick = monotonic() + self.tick_interval
+        try:
+            while not self._stop.is_set():
+                if sock.poll(self.POLL_TIMEOUT):
+                    self.process(recv_waiting(sock, self.MAX_BATCH,
+                                              self.MAX_DELAY))
+                if monotonic() >= next_tick:
+                    self.tick()
+                    next_tick = monotonic() + self.tick_interval
+        finally:
+            sock.close(linger=0)
+
+    def shutdown(self):
+        """
+        Make serve_forever() return.
+
+        :returns: None
+        """
+        self._stop.set()
+
+    def server_close(self):
+        """
+        Finalize the plugins, log their CPU time and close the context.
+
+        :returns: None
+        """
+        if self._finalized:
+            return
+        self._finalized = True
+        for plugin in self.plugins:
+            self._call(plugin, "finalize")
+        self.logger.info("CPU time of the analyses:\n%s" % self.report())
+        self.context.term()
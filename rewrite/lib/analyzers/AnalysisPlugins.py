@@ -0,0 +1,323 @@
+"""
+Analyses which run inside an AnalysisHost.
+
+A plugin gets the decoded records it is interested in batch by batch and
+never touches a socket itself::
+
+    class MaxTemperature(AnalysisPlugin):
+        record_types = (RecordType.TEMPERATURE,)
+
+        def __init__(self):
+            self.maximum = None
+
+        def on_batch(self, records):
+            for rec in records:
+                if self.maximum is None or \\
+                        rec.payload.temperature > self.maximum:
+                    self.maximum = rec.payload.temperature
+
+The plugins shipped with muonic are registered by name in PLUGINS, so a
+host can be configured with a list like ["rates", "pulses", "decays",
+"archive"].
+"""
+import importlib
+import logging
+from datetime import datetime
+
+import jsonpickle
+import numpy as np
+
+from ..common.Record import RecordType
+from ..common.PressureRecord import PressureType
+from .DecaySearch import DecaySearch
+from .PulseService import PulseRecords
+
+
+def _starttime():
+    return datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
+
+class AnalysisPlugin(object):
+    """
+    Base class of the analyses run by an AnalysisHost. All methods are
+    called from the thread of the host, one plugin after the other.
+
+    Records a plugin derives from its input, e.g. the pulses extracted from
+    DATA records, can be returned from on_batch. The host passes them on to
+    the plugins which name their type in record_types, so a plugin can build
+    on the work of another one. Plugins with record_types None get only the
+    records of the DAQ server.
+
+    :param name: name used in the statistics of the host, the class name if
+                 None
+    :type name: str
+    """
+
+    # types of the records passed to on_batch, all records of the DAQ
+    # server if None
+    record_types = None
+
+    def __init__(self, name=None):
+        self.name = name if name is not None else type(self).__name__
+
+    def on_batch(self, records):
+        """
+        Analyse the records of one message.
+
+        :param records: the records of the plugin's types, in the order
+                        they arrived
+        :type records: list of Record
+        :returns: list of Record or None -- derived records
+        """
+        return None
+
+    def on_tick(self, now):
+        """
+        Called regularly, also when no records arrive, e.g. to flush files
+        or to publish results.
+
+        :param now: the current time in seconds since the epoch
+        :type now: float
+        :returns: None
+        """
+        pass
+
+    def finalize(self):
+        """
+        Called once when the host stops, e.g. to close files.
+
+        :returns: None
+        """
+        pass
+
+
+class RatePlugin(AnalysisPlugin):
+    """
+    Calculates the rates of the channels and the trigger from the
+    differences of successive COUNTER records and writes them to a rate
+    file in the format of the RateAnalyzer.
+
+    :param filename: name of the rate file, <start time>_R.txt if None
+    :type filename: str
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    record_types = (RecordType.COUNTER, RecordType.PRESSURE,
+                    RecordType.TEMPERATURE)
+
+    HEADER = ("Date Time Rate_0 Rate_1 Rate_2 Rate_3 Rate_trigger "
+              "Counts_0 Counts_1 Counts_2 Counts_3 Trigger Delta_time "
+              "Pressure [mBar] Temperature [C]")
+
+    def __init__(self, filename=None, logger=None, name=None):
+        AnalysisPlugin.__init__(self, name)
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        if filename is None:
+            filename = _starttime() + "_R.txt"
+        self.filename = filename
+        self.file = None
+        self.pressure = 99
+        self.temperature = 20
+        self.counts = None
+        self.previous_time = None
+        # rates of the last interval, None before the second COUNTER record
+        self.rates = None
+
+    def _write(self, line):
+        if self.file is None:
+            self.logger.info("Starting to write data to file %s" %
+                             self.filename)
+            self.file = open(self.filename, "a")
+            self.file.write(self.HEADER + "\n")
+        self.file.write(line + "\n")
+
+    def on_batch(self, records):
+        for rec in records:
+            payload = rec.payload
+            if not payload.valid:
+                continue
+            if rec.type == RecordType.PRESSURE:
+                if payload.pressure_type == PressureType.MBAR:
+                    self.pressure = payload.pressure
+            elif rec.type == RecordType.TEMPERATURE:
+                self.temperature = payload.temperature
+            else:
+                self._count(rec)
+
+    def _count(self, rec):
+        cnt = rec.payload
+        counts = np.array([cnt.counts_ch0, cnt.counts_ch1, cnt.counts_ch2,
+                           cnt.counts_ch3, cnt.counts_trigger])
+        previous_counts, previous_time = self.counts, self.previous_time
+        self.counts, self.previous_time = counts, rec.timestamp
+        if previous_counts is None:
+            return
+        # the server measures the exact time between its polls, records of
+        # older servers only have their timestamps
+        delta_time = getattr(cnt, "delta_time", None)
+        if delta_time is None:
+            delta_time = rec.timestamp - previous_time
+        if delta_time <= 0:
+            return
+        self.rates = (counts - previous_counts) / delta_time
+        when = datetime.fromtimestamp(rec.timestamp).strftime(
+            "%Y-%m-%d %H:%M:%S")
+        self._write(" ".join(str(v) for v in
+                             [when] + self.rates.tolist() +
+                             counts.tolist() +
+                             [delta_time, self.pressure, self.temperature]))
+
+    def on_tick(self, now):
+        if self.file is not None:
+            self.file.flush()
+
+    def finalize(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class PulsePlugin(AnalysisPlugin):
+    """
+    Extracts the pulses of DATA records with the PulseRecords of the
+    PulseService and returns them as PULSES records, which the host passes on, e.g. to the
+    DecayPlugin.
+
+    :param pulse_file: file the pulses are written to, not written if None
+    :type pulse_file: str
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    record_types = (RecordType.DATA,)
+
+    def __init__(self, pulse_file=None, logger=None, name=None):
+        AnalysisPlugin.__init__(self, name)
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        self.pulses = PulseRecords(pulse_file, self.logger)
+
+    def on_batch(self, records):
+        rec = self.pulses.process([rec.payload.msg for rec in records])
+        if rec is None:
+            return None
+        return [rec]
+
+    def finalize(self):
+        self.pulses.finish()
+
+
+class DecayPlugin(AnalysisPlugin):
+    """
+    Searches the PULSES records for muon decays with a DecaySearch and
+    writes the decay times in microseconds to a file in the format of the
+    lifetime measurement of the GUI.
+
+    :param filename: name of the decay file, <start time>_L.txt if None
+    :type filename: str
+    :param logger: logger object
+    :type logger: logging.Logger
+    :param search_options: passed on to DecaySearch
+    """
+
+    record_types = (RecordType.PULSES,)
+
+    def __init__(self, filename=None, logger=None, name=None,
+                 **search_options):
+        AnalysisPlugin.__init__(self, name)
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        if filename is None:
+            filename = _starttime() + "_L.txt"
+        self.filename = filename
+        self.search = DecaySearch(**search_options)
+        self.file = open(self.filename, "a")
+        self.file.write("# new decay measurement run from: %s\n" %
+                        datetime.now().strftime("%a %d %b %Y %H:%M:%S"))
+
+    def on_batch(self, records):
+        for rec in records:
+            for decay in self.search.search(rec.payload.pulses):
+                when = datetime.fromtimestamp(decay["event_time"] / 1e9)
+                self.file.write("%s Decay %s\n" % (
+                    repr(when.strftime("%Y-%m-%d %H:%M:%S")),
+                    repr(decay["decay_time"] / 1000)))
+
+    def on_tick(self, now):
+        self.file.flush()
+
+    def finalize(self):
+        self.logger.info("Found %d decays in %d events" %
+                         (self.search.decays, self.search.events))
+        self.file.write("# stopped run on: %s\n" %
+                        datetime.now().strftime("%a %d %b %Y %H:%M:%S"))
+        self.file.close()
+
+
+class ArchivePlugin(AnalysisPlugin):
+    """
+    Writes the records of the DAQ server as jsonpickle lines, like the
+    WriterToFile, so the file can be replayed with the ReaderFromFile.
+    Derived records like PULSES are only written if their type is given in
+    record_types.
+
+    :param filename: name of the file, <start time>_F.txt if None
+    :type filename: str
+    :param record_types: types to archive, all records of the DAQ server if
+                         None
+    :type record_types: iterable of RecordType
+    """
+
+    def __init__(self, filename=None, record_types=None, name=None):
+        AnalysisPlugin.__init__(self, name)
+        if filename is None:
+            filename = _starttime() + "_F.txt"
+        if record_types is not None:
+            self.record_types = tuple(record_types)
+        self.filename = filename
+        self.file = open(self.filename, "a")
+
+    def on_batch(self, records):
+        self.file.write("".join(jsonpickle.encode(rec) + "\n"
+                                for rec in records))
+
+    def on_tick(self, now):
+        self.file.flush()
+
+    def finalize(self):
+        self.file.close()
+
+
+# plugins which can be configured by name
+PLUGINS = {
+    "rates": RatePlugin,
+    "pulses": PulsePlugin,
+    "decays": DecayPlugin,
+    "archive": ArchivePlugin,
+}
+
+
+def load_plugin(spec, **options):
+    """
+    Create a plugin from its configuration.
+
+    :param spec: name of a plugin in PLUGINS or the class of any other
+                 plugin as "package.module:Class"
+    :type spec: str
+    :param options: passed on to the constructor of the plugin
+    :raises: ValueError
+    :returns: AnalysisPlugin
+    """
+    if spec in PLUGINS:
+        return PLUGINS[spec](**options)
+    module_name, sep, class_name = spec.partition(":")
+    if not sep:
+        raise ValueError("Unknown analysis plugin %s, expected one of %s "
+                         "or module:Class" % (spec, ", ".join(PLUGINS)))
+    cls = getattr(importlib.import_module(module_name), class_name)
+    return cls(**options)
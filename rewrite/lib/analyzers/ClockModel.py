@@ -0,0 +1,314 @@
+"""
+Absolute event times from the counters of the DAQ card.
+
+The card has a free running 32 bit counter (nominally 25 MHz). Every trigger
+line carries the counter value at the trigger and the value latched at the
+last 1PPS pulse of the GPS receiver, together with the GPS time (hhmmss.sss)
+and date (ddmmyy) of that pulse and a correction in ms::
+
+    B9C05556 00 27 00 00 00 00 00 00 00000002 000000.000 000000 V 00 8 +0000
+
+The time of a line is the GPS second plus the counts since the 1PPS latch
+divided by the oscillator frequency. ClockModel estimates that frequency
+from the 1PPS latches and converts lines into nanoseconds since the epoch
+(UTC). Without a valid GPS date the times count from the start of the day.
+"""
+import datetime
+from collections import deque
+
+import numpy as np
+
+# nominal frequency of the card's counter
+DEFAULT_FREQUENCY = 25.0e6
+
+COUNTER_MASK = 0xFFFFFFFF
+
+_EPOCH = datetime.date(1970, 1, 1).toordinal()
+NS_PER_DAY = 86400 * 10 ** 9
+
+
+def day_ns(date):
+    """
+    Start of a GPS date in ns since the epoch, 0 if the date is not valid.
+
+    :param date: date as sent by the card (ddmmyy)
+    :type date: int
+    :returns: int
+    """
+    try:
+        day = datetime.date(2000 + date % 100, date // 100 % 100,
+                            date // 10000).toordinal()
+    except ValueError:
+        return 0
+    return (day - _EPOCH) * NS_PER_DAY
+
+
+def gps_milliseconds(time):
+    """
+    Milliseconds since day start of a GPS time string (hhmmss.sss).
+
+    :param time: GPS time as sent by the card
+    :type time: str
+    :raises: ValueError
+    :returns: int
+    """
+    hms, ms = time.split(".")
+    return ((int(hms[0:2]) * 3600 + int(hms[2:4]) * 60 + int(hms[4:6])) *
+            1000 + int(ms))
+
+
+class ClockModel(object):
+    """
+    Model of the card's oscillator, fitted to the 1PPS latches.
+
+    The unwrapped counter values of the last window latches are fitted
+    with a quadratic function of the GPS second by least squares. The sums
+    of the fit are updated when a latch enters or leaves the window, so a
+    latch costs O(1). frequency is the slope of the fit at the latest latch,
+    drift its change per second.
+
+    Rollovers of the 32 bit counter are handled by working with counter
+    differences modulo 2**32. If the trigger counter passes the 1PPS latch
+    of the current second, e.g. without GPS, the rollovers are counted.
+    Missed 1PPS pulses are detected from the number of counts between two
+    latches. Latches which do not fit the
+    nominal frequency within a factor of 1.5 restart the fit.
+
+    The GPS second of the lines is parsed once per second and cached, so
+    timestamp() is O(1) per line. timestamps() converts whole arrays of
+    lines parsed with TriggerLines.
+
+    :param window: number of 1PPS latches in the fit
+    :type window: int
+    :param nominal_frequency: frequency used until there are two latches
+    :type nominal_frequency: float
+    """
+
+    def __init__(self, window=16, nominal_frequency=DEFAULT_FREQUENCY):
+        self.window = window
+        self.nominal_frequency = nominal_frequency
+        self.reset()
+
+    def reset(self):
+        """
+        Forget all latches.
+
+        :returns: None
+        """
+        self.frequency = float(self.nominal_frequency)  # Hz
+        self.drift = 0.0  # Hz/s
+        # raw value and unwrapped count of the last latch, and its second
+        # relative to the first latch
+        self.one_pps = None
+        self._count = 0
+        self._second = 0
+        self._latches = deque()
+        # latch all coordinates of the fit are relative to
+        self._origin = (0, 0)
+        # n, sum(x), ..., sum(x^4), sum(y), sum(x y), sum(x^2 y)
+        self._sums = [0] * 8
+        # GPS second of the lines as (ms since day start, ddmmyy), its time
+        # in ns and the raw value of the latch it belongs to
+        self._time = None
+        self._date = None
+        self._key = None
+        self._second_ns = 0
+        self._second_pps = 0
+        # counts of the last line since the latch, modulo 2**32, and the
+        # number of trigger counter rollovers since then
+        self._counts = 0
+        self._wraps = 0
+
+    def _sane(self, frequency):
+        """
+        Check a frequency against the nominal one.
+        """
+        return (0.5 * frequency < self.nominal_frequency <
+                1.5 * frequency)
+
+    def _accumulate(self, second, count, sign):
+        x = second - self._origin[0]
+        y = count - self._origin[1]
+        sums = self._sums
+        for i, value in enumerate((1, x, x * x, x ** 3, x ** 4,
+                                   y, x * y, x * x * y)):
+            sums[i] += sign * value
+
+    def _rebase(self):
+        """
+        Make the oldest latch in the window the origin of the fit, keeping
+        the numbers small enough for the solution in floating point.
+        """
+        self._origin = self._latches[0]
+        self._sums = [0] * 8
+        for second, count in self._latches:
+            self._accumulate(second, count, 1)
+
+    def _fit(self):
+        """
+        Update frequency and drift from the latches in the window.
+        """
+        n, sx, sx2, sx3, sx4, sy, sxy, sx2y = self._sums
+        x = self._second - self._origin[0]
+        if n < 2:
+            return
+        if n == 2:
+            (s0, c0), (s1, c1) = self._latches
+            frequency, drift = (c1 - c0) / (s1 - s0), 0.0
+        else:
+            a = np.array([[n, sx, sx2], [sx, sx2, sx3], [sx2, sx3, sx4]],
+                         dtype=np.float64)
+            b = np.array([sy, sxy, sx2y], dtype=np.float64)
+            _, slope, curvature = np.linalg.solve(a, b)
+            frequency = float(slope + 2.0 * curvature * x)
+            drift = float(2.0 * curvature)
+        if self._sane(frequency):
+            self.frequency, self.drift = frequency, drift
+        else:
+            self.frequency, self.drift = float(self.nominal_frequency), 0.0
+
+    def latch(self, one_pps):
+        """
+        Add the 1PPS counter value of a line. Nothing is done if it did not
+        change since the last line.
+
+        :param one_pps: raw 1PPS counter value
+        :type one_pps: int
+        :returns: bool -- True if the value was a new latch
+        """
+        if one_pps == self.one_pps:
+            return False
+        if self.one_pps is None:
+            count, second = one_pps, 0
+        else:
+            counts = (one_pps - self.one_pps) & COUNTER_MASK
+            count = self._count + counts
+            seconds = 1
+            if len(self._latches) >= 2:
+                seconds = max(1, int(round(counts / self.frequency)))
+            second = self._second + seconds
+            if not self._sane(counts / seconds):
+                self._latches.clear()
+        self.one_pps, self._count, self._second = one_pps, count, second
+
+        self._latches.append((second, count))
+        if len(self._latches) == 1:
+            self._rebase()
+        else:
+            self._accumulate(second, count, 1)
+        if len(self._latches) > self.window:
+            self._accumulate(*self._latches.popleft(), -1)
+            if self._latches[0][0] - self._origin[0] > 4 * self.window:
+                self._rebase()
+        self._fit()
+        return True
+
+    def elapsed_ns(self, counts):
+        """
+        Convert a number of counts into ns with the current frequency.
+
+        :param counts: counter difference
+        :type counts: int
+        :returns: float
+        """
+        seconds = counts / self.frequency
+        seconds -= 0.5 * self.drift * seconds * seconds / self.frequency
+        return seconds * 1e9
+
+    def timestamp(self, trigger_count, one_pps, time, date, correction=0):
+        """
+        Time of a line. Lines have to be passed in the order they were
+        read.
+
+        If the 1PPS counter switches while the GPS time still shows the
+        previous second, the time is counted from the previous latch.
+
+        :param trigger_count: raw trigger counter value
+        :type trigger_count: int
+        :param one_pps: raw 1PPS counter value
+        :type one_pps: int
+        :param time: GPS time (hhmmss.sss)
+        :type time: str
+        :param date: GPS date (ddmmyy)
+        :type date: str
+        :param correction: time correction in ms
+        :type correction: int
+        :raises: ValueError
+        :returns: int -- ns since the epoch (UTC)
+        """
+        self.latch(one_pps)
+        if time != self._time or date != self._date:
+            key = (gps_milliseconds(time), int(date))
+            self._time, self._date = time, date
+            if key != self._key:
+                self._key = key
+                self._second_ns = day_ns(key[1]) + key[0] * 1000000
+                self._second_pps = self.one_pps
+                self._counts = self._wraps = 0
+        counts = (trigger_count - self._second_pps) & COUNTER_MASK
+        if counts < self._counts:
+            self._wraps += 1
+        self._counts = counts
+        counts += self._wraps << 32
+        return (self._second_ns + int(correction) * 1000000 +
+                int(round(self.elapsed_ns(counts))))
+
+    def timestamps(self, lines):
+        """
+        Time of all lines of a batch, same as timestamp() for every line.
+
+        :param lines: parsed lines
+        :type lines: numpy.ndarray of TriggerLines.TRIGGER_DTYPE
+        :returns: tuple of numpy.ndarray -- ns since the epoch (UTC) and
+                  frequency used for every line
+        """
+        if not len(lines):
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        index = np.arange(len(lines))
+
+        # the latches are few, one per second
+        one_pps = lines["one_pps"].astype(np.int64)
+        previous = -1 if self.one_pps is None else self.one_pps
+        changed = one_pps != np.concatenate(([previous], one_pps[:-1]))
+        frequencies, drifts = [self.frequency], [self.drift]
+        for value in one_pps[changed].tolist():
+            self.latch(value)
+            frequencies.append(self.frequency)
+            drifts.append(self.drift)
+        latches = np.cumsum(changed)
+        frequency = np.array(frequencies)[latches]
+        drift = np.array(drifts)[latches]
+
+        # GPS second of every line and the latch it belongs to
+        ms = np.rint(lines["gps_time"] * 1000).astype(np.int64)
+        dates = lines["date"].astype(np.int64)
+        last_ms, last_date = (-1, -1) if self._key is None else self._key
+        new = ((ms != np.concatenate(([last_ms], ms[:-1]))) |
+               (dates != np.concatenate(([last_date], dates[:-1]))))
+        start = np.maximum.accumulate(np.where(new, index, -1))
+        days, inverse = np.unique(dates, return_inverse=True)
+        second_ns = (np.array([day_ns(int(d)) for d in days],
+                              dtype=np.int64)[inverse] + ms * 1000000)
+        second_ns = np.where(start >= 0, second_ns[start], self._second_ns)
+        second_pps = np.where(start >= 0, one_pps[start], self._second_pps)
+
+        counts = (lines["trigger_count"].astype(np.int64) - second_pps) & \
+            COUNTER_MASK
+        wrapped = (counts < np.concatenate(([self._counts], counts[:-1]))) & \
+            ~new
+        wraps = np.cumsum(wrapped)
+        wraps = np.where(start >= 0, wraps - wraps[start], wraps + self._wraps)
+        self._counts, self._wraps = int(counts[-1]), int(wraps[-1])
+        counts = counts + (wraps << 32)
+        seconds = counts / frequency
+        seconds -= 0.5 * drift * seconds * seconds / frequency
+        ns = (second_ns + lines["correction"].astype(np.int64) * 1000000 +
+              np.rint(seconds * 1e9).astype(np.int64))
+
+        if new.any():
+            self._key = (int(ms[-1]), int(dates[-1]))
+            self._second_ns = int(second_ns[-1])
+            self._second_pps = int(second_pps[-1])
+            # parse the next line passed to timestamp()
+            self._time = self._date = None
+        return ns, frequency
@@ -0,0 +1,227 @@
+"""
+Find coincident pulses in several channels.
+
+Pulses are grouped into clusters, a pulse belongs to the cluster of the
+pulse before if it follows that one within the coincidence window. A
+cluster is a coincidence if its channels contain one of the configured
+channel combinations, e.g. for a muon telescope with two scintillators of
+two channels each::
+
+    finder = CoincidenceFinder(((0, 2), (0, 3), (1, 2), (1, 3)), window=200)
+
+Times may be in any unit as long as window is given in the same one.
+"""
+import itertools
+
+import numpy as np
+
+COINCIDENCE_DTYPE = np.dtype([
+    ("time", np.float64),  # time of the first pulse
+    ("channels", np.uint8),  # bit mask of the channels with pulses
+    ("pulses", np.uint32),  # number of pulses
+])
+
+
+def channel_mask(channels):
+    """
+    :param channels: channel numbers
+    :type channels: iterable of int
+    :returns: int -- bit mask of the channels
+    """
+    mask = 0
+    for channel in channels:
+        mask |= 1 << channel
+    return mask
+
+
+def mask_channels(mask):
+    """
+    :param mask: bit mask of channels
+    :type mask: int
+    :returns: list of int -- channel numbers in the mask
+    """
+    return [channel for channel in range(8) if mask >> channel & 1]
+
+
+class CoincidenceFinder(object):
+    """
+    Finds coincidences in time sorted pulses in a single sweep.
+
+    Pulses can be added one by one with add(), or as arrays with process().
+    Both can be mixed, and clusters which are still open at the end of a
+    call are continued by the next one. flush() closes the last cluster.
+
+    :param combinations: channel combinations which are a coincidence, all
+                         combinations of fold channels if None
+    :type combinations: list of tuple of int
+    :param window: maximum time between two pulses of a cluster
+    :type window: float
+    :param fold: number of channels for the default combinations
+    :type fold: int
+    :param channels: number of channels for the default combinations
+    :type channels: int
+    :param strict_order: start a new cluster with every pulse which is not
+                         later than the pulse before, like the former
+                         muon_finder of simple_reader
+    :type strict_order: bool
+    """
+
+    def __init__(self, combinations=None, window=200.0, fold=2, channels=4,
+                 strict_order=False):
+        if combinations is None:
+            combinations = itertools.combinations(range(channels), fold)
+        self.combinations = [channel_mask(c) for c in combinations]
+        self.window = window
+        self.strict_order = strict_order
+        self._reset()
+
+    def _continues(self, gap):
+        """
+        Whether a pulse gap after the pulse before continues its cluster.
+        """
+        if self.strict_order:
+            return (gap > 0) & (gap < self.window)
+        return gap < self.window
+
+    def _reset(self):
+        # the open cluster
+        self._time = 0.0
+        self._last = 0.0
+        self._mask = 0
+        self._pulses = 0
+
+    def is_coincidence(self, mask):
+        """
+        :param mask: bit mask of the channels of a cluster
+        :type mask: int
+        :returns: bool
+        """
+        return any(mask & c == c for c in self.combinations)
+
+    def _close(self):
+        """
+        Coincidence of the open cluster, None if it is none.
+        """
+        if self._pulses and self.is_coincidence(self._mask):
+            return (self._time, self._mask, self._pulses)
+        return None
+
+    def add(self, channel, time):
+        """
+        Add a pulse. It must not be earlier than the pulses before.
+
+        :param channel: channel number
+        :type channel: int
+        :param time: time of the pulse
+        :type time: float
+        :returns: tuple or None -- time, channel mask and number of pulses
+                  of the coincidence completed by the pulse
+        """
+        if self._pulses and self._continues(time - self._last):
+            self._mask |= 1 << channel
+            self._pulses += 1
+            self._last = time
+            return None
+        done = self._close()
+        self._time = self._last = time
+        self._mask = 1 << channel
+        self._pulses = 1
+        return done
+
+    def flush(self):
+        """
+        Close the open cluster.
+
+        :returns: tuple or None -- the coincidence, like add()
+        """
+        done = self._close()
+        self._reset()
+        return done
+
+    def process(self, times):
+        """
+        Add the pulses of all channels. Every channel must be sorted by
+        time and must not be earlier than the pulses added before.
+
+        :param times: pulse times for every channel, index is the channel
+        :type times: list of numpy.ndarray
+        :returns: numpy.ndarray of COINCIDENCE_DTYPE -- the coincidences
+                  completed by the pulses
+        """
+        channels = np.concatenate(
+            [np.full(len(t), ch, dtype=np.uint8)
+             for ch, t in enumerate(times)] + [np.zeros(0, dtype=np.uint8)])
+        times = np.concatenate([np.asarray(t, dtype=np.float64)
+                                for t in times] + [np.zeros(0)])
+        # the stable sort merges the sorted channels in linear time
+        order = np.argsort(times, kind="stable")
+        return self.sweep(times[order], channels[order])
+
+    def sweep(self, times, channels):
+        """
+        Add pulses which are already merged.
+
+        :param times: pulse times, sorted
+        :type times: numpy.ndarray
+        :param channels: channel of every pulse
+        :type channels: numpy.ndarray
+        :returns: numpy.ndarray of COINCIDENCE_DTYPE -- the coincidences
+                  completed by the pulses
+        """
+        n = len(times)
+        if not n:
+            return np.zeros(0, dtype=COINCIDENCE_DTYPE)
+        last = self._last if self._pulses else -np.inf
+        gaps = np.diff(times, prepend=last)
+        starts = np.flatnonzero(~self._continues(gaps))
+        bits = np.left_shift(1, channels.astype(np.uint8)).astype(np.uint8)
+
+        # pulses continuing the open cluster
+        head = starts[0] if len(starts) else n
+        if head:
+            self._mask |= int(np.bitwise_or.reduce(bits[:head]))
+            self._pulses += int(head)
+            self._last = float(times[head - 1])
+        if not len(starts):
+            return np.zeros(0, dtype=COINCIDENCE_DTYPE)
+
+        clusters = np.zeros(len(starts) + 1, dtype=COINCIDENCE_DTYPE)
+        clusters[0] = (self._time, self._mask, self._pulses)
+        clusters["time"][1:] = times[starts]
+        clusters["channels"][1:] = np.bitwise_or.reduceat(bits, starts)
+        clusters["pulses"][1:] = np.diff(np.append(starts, n))
+        if not self._pulses:
+            clusters = clusters[1:]
+
+        # the last cluster stays open
+        self._time, self._mask, self._pulses = clusters[-1].tolist()
+        self._last = float(times[-1])
+        done = clusters[:-1]
+
+        found = np.zeros(len(done), dtype=bool)
+        for c in self.combinations:
+            found |= done["channels"] & c == c
+        return done[found]
+
+
+def find_coincidences(times, combinations=None, window=200.0, fold=2,
+                      channels=4, strict_order=False):
+    """
+    Find all coincidences in the pulses of several channels.
+
+    :param times: sorted pulse times for every channel, index is the channel
+    :type times: list of numpy.ndarray
+    :param combinations: see CoincidenceFinder
+    :param window: see CoincidenceFinder
+    :param fold: see CoincidenceFinder
+    :param channels: see CoincidenceFinder
+    :param strict_order: see CoincidenceFinder
+    :returns: numpy.ndarray of COINCIDENCE_DTYPE
+    """
+    finder = CoincidenceFinder(combinations, window, fold, channels,
+                               strict_order)
+    found = finder.process(times)
+    last = finder.flush()
+    if last is not None:
+        found = np.append(found, np.array([last], dtype=COINCIDENCE_DTYPE))
+    return found
@@ -0,0 +1,224 @@
+"""
+Search for muon decays in a stream of pulses, across trigger windows.
+
+DecayTriggerThorough and DecaySearch only look at the pulses of one event,
+so a decay is lost if the electron comes after the next trigger. The
+DecayDetector keeps the stopped muons of the last max_decay_time ns in a
+time sorted buffer and matches every later pulse against it, no matter to
+which event the pulses belong. Channels are numbered from 0 like in
+PULSE_DTYPE.
+"""
+from bisect import bisect_left, bisect_right
+
+import numpy as np
+
+MATCH_DTYPE = np.dtype([
+    ("muon_event", np.int64),  # event id of the stopped muon
+    ("decay_event", np.int64),  # event id of the decay
+    ("muon_time", np.int64),  # nsec since the epoch (UTC)
+    ("decay_time", np.float64),  # nsec
+])
+
+
+class DecayDetector(object):
+    """
+    Finds decays in time ordered pulses. A pulse in the single channel is
+    a stopped muon, unless there is a pulse in the veto channel within the
+    coincidence window, then the muon went through. A later pulse in the
+    single channel is the decay of the last stopped muon which is more than
+    min_decay_time and less than max_decay_time ns before it. Pulses which
+    are no decay are stopped muons themselves. The pulse widths of muons
+    and decays must be within the limits (exclusive). Pulses right after a
+    veto pulse are ignored, but a veto pulse only removes muons, not decays
+    found before it.
+
+    Stopped muons expire after max_decay_time ns. At most capacity muons
+    are waiting, the oldest ones are dropped if there are more. For n
+    waiting muons, looking up and expiring muons takes O(log n) and
+    dropping the oldest one amortized O(1). Removing a matched muon from
+    the middle of the buffer takes O(n) list moves, cheap as n is limited
+    by capacity, and removing k vetoed muons from its end O(k).
+
+    Pulses are added with add() one by one, or with process() as batches
+    of PulseExtractor.extract_many. Waiting muons are kept between calls,
+    so both work on live streams as well as on files read in chunks.
+
+    :param single_channel: channel of the stopped muons and the decays
+    :type single_channel: int
+    :param veto_channel: veto channel, None for no veto
+    :type veto_channel: int
+    :param min_decay_time: minimum decay time in ns
+    :type min_decay_time: float
+    :param max_decay_time: maximum decay time in ns
+    :type max_decay_time: float
+    :param min_pulse_width: minimum pulse width in ns
+    :type min_pulse_width: float
+    :param max_pulse_width: maximum pulse width in ns
+    :type max_pulse_width: float
+    :param coincidence_window: maximum time between a muon and a veto pulse
+                               in ns
+    :type coincidence_window: float
+    :param capacity: maximum number of waiting muons
+    :type capacity: int
+    :param origin: ns since the epoch of time 0 for add(), the event time
+                   of the first batch of process() if None
+    :type origin: int
+    """
+
+    def __init__(self, single_channel=1, veto_channel=None, min_decay_time=0,
+                 max_decay_time=20000, min_pulse_width=0,
+                 max_pulse_width=12000, coincidence_window=100,
+                 capacity=1024, origin=None):
+        self.single_channel = single_channel
+        self.veto_channel = veto_channel
+        self.min_decay_time = min_decay_time
+        self.max_decay_time = max_decay_time
+        self.min_pulse_width = min_pulse_width
+        self.max_pulse_width = max_pulse_width
+        self.coincidence_window = coincidence_window
+        self.capacity = capacity
+        self.origin = origin
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the waiting muons and reset the counters.
+
+        :returns: None
+        """
+        # times and event ids of the waiting muons, sorted by time, the
+        # entries before _head are expired or used up
+        self._times = []
+        self._events = []
+        self._head = 0
+        self._last_veto = -np.inf
+        self.muons = 0
+        self.decays = 0
+        self.vetoed = 0
+        self.expired = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._times) - self._head
+
+    def _compact(self):
+        """
+        Remove the entries before _head once they are the larger part.
+        """
+        if self._head > len(self._times) // 2:
+            del self._times[:self._head]
+            del self._events[:self._head]
+            self._head = 0
+
+    def _expire(self, time):
+        """
+        Expire the muons which are too long ago for a decay at time.
+        """
+        head = bisect_right(self._times, time - self.max_decay_time,
+                            self._head)
+        self.expired += head - self._head
+        self._head = head
+        self._compact()
+
+    def _veto(self, time):
+        """
+        Remove the muons which are coincident with a veto pulse at time.
+        """
+        start = bisect_left(self._times, time - self.coincidence_window,
+                            self._head)
+        self.vetoed += len(self._times) - start
+        self.muons -= len(self._times) - start
+        del self._times[start:]
+        del self._events[start:]
+        self._last_veto = time
+
+    def _match(self, time):
+        """
+        Index of the last muon which can have decayed at time, None if
+        there is none.
+        """
+        index = bisect_left(self._times, time - self.min_decay_time,
+                            self._head) - 1
+        if index < self._head:
+            return None
+        return index
+
+    def add(self, channel, time, width, event_id=-1):
+        """
+        Add a pulse. It must not be earlier than the pulses before.
+
+        :param channel: channel of the pulse
+        :type channel: int
+        :param time: rising edge in ns since origin
+        :type time: float
+        :param width: pulse width in ns
+        :type width: float
+        :param event_id: id of the event of the pulse
+        :type event_id: int
+        :returns: tuple or None -- muon event, decay event, muon time and
+                  decay time like MATCH_DTYPE if the pulse is a decay
+        """
+        if self.origin is None:
+            self.origin = 0
+        if channel == self.veto_channel:
+            self._veto(time)
+            return None
+        if channel != self.single_channel:
+            return None
+        if not self.min_pulse_width < width < self.max_pulse_width:
+            return None
+        if time - self._last_veto < self.coincidence_window:
+            self.vetoed += 1
+            return None
+        self._expire(time)
+
+        index = self._match(time)
+        if index is not None:
+            muon_time = self._times[index]
+            match = (self._events[index], event_id,
+                     self.origin + int(round(muon_time)), time - muon_time)
+            del self._times[index]
+            del self._events[index]
+            self.decays += 1
+            return match
+
+        if len(self) >= self.capacity:
+            self._head += 1
+            self.dropped += 1
+            self._compact()
+        self._times.append(time)
+        self._events.append(event_id)
+        self.muons += 1
+        return None
+
+    def process(self, pulses):
+        """
+        Add the pulses of a batch. The events must be in time order and
+        must not be earlier than the pulses added before.
+
+        :param pulses: pulses sorted by event, as returned by
+                       PulseExtractor.extract_many
+        :type pulses: numpy.ndarray of PulseExtractor.PULSE_DTYPE
+        :returns: numpy.ndarray of MATCH_DTYPE -- the decays found
+        """
+        channels = [self.single_channel]
+        if self.veto_channel is not None:
+            channels.append(self.veto_channel)
+        pulses = pulses[np.isin(pulses["channel"], channels)]
+        if not len(pulses):
+            return np.zeros(0, dtype=MATCH_DTYPE)
+        if self.origin is None:
+            self.origin = int(pulses["event_time"][0])
+
+        # the offsets to the origin are small enough for ns resolution
+        times = (pulses["event_time"] - self.origin) + pulses["rising"]
+        widths = pulses["falling"] - pulses["rising"]
+        order = np.argsort(times, kind="stable")
+        found = []
+        for channel, time, width, event_id in zip(
+                pulses["channel"][order].tolist(), times[order].tolist(),
+                widths[order].tolist(), pulses["event_id"][order].tolist()):
+            match = self.add(channel, time, width, event_id)
+            if match is not None:
+                found.append(match)
+        return np.array(found, dtype=MATCH_DTYPE)
@@ -0,0 +1,167 @@
+"""
+Search for muon decays in batches of extracted pulses.
+
+Applies the selection of DecayTriggerThorough to all events of a
+PulseExtractor.extract_many batch at once. Channels are numbered from 0
+like in PULSE_DTYPE, not from 1 like the pulse tuples DecayTriggerThorough
+works on.
+"""
+import numpy as np
+
+DECAY_DTYPE = np.dtype([
+    ("event_id", np.int64),
+    ("event_time", np.int64),  # nsec since the epoch (UTC)
+    ("decay_time", np.float64),  # nsec
+])
+
+# reasons why events are rejected, in the order they are checked
+REJECTION_REASONS = (
+    "too_few_pulses",  # less than two pulses in single and double channel
+    "veto",  # pulses in the veto channel
+    "multiplicity",  # wrong number of single or double pulses
+    "pulse_width",  # single or double pulse width out of range
+    "decay_time",  # decay time out of range or at the end of the window
+)
+
+
+class DecaySearch(object):
+    """
+    Finds decays in the pulses of an event: a muon stops in the detector,
+    giving one pulse in the single channel, and the decay gives a second
+    pulse in the double channel. The decay time is the difference of the
+    rising edges of the first and the last pulse in the double channel.
+
+    Events are rejected if there are less than two pulses in single and
+    double channel or any pulse in the veto channel. If single and double
+    channel differ, the single channel must have exactly one pulse,
+    otherwise at least two, and the double channel at least two. The width
+    of the first single and of the last double pulse must be within the
+    limits (exclusive). The decay time must be above min_decay_time and
+    1000 ns before the end of the trigger window, where there is an
+    artifact.
+
+    Accepted and rejected events are counted over all calls of search().
+
+    :param single_channel: channel of the stopping muon
+    :type single_channel: int
+    :param double_channel: channel of the decay
+    :type double_channel: int
+    :param veto_channel: veto channel, None for no veto
+    :type veto_channel: int
+    :param min_decay_time: minimum decay time in ns
+    :type min_decay_time: float
+    :param min_single_pulse_width: minimum single pulse width in ns
+    :type min_single_pulse_width: float
+    :param max_single_pulse_width: maximum single pulse width in ns
+    :type max_single_pulse_width: float
+    :param min_double_pulse_width: minimum double pulse width in ns
+    :type min_double_pulse_width: float
+    :param max_double_pulse_width: maximum double pulse width in ns
+    :type max_double_pulse_width: float
+    :param trigger_window: trigger window of the DAQ card in ns
+    :type trigger_window: float
+    """
+
+    def __init__(self, single_channel=1, double_channel=2, veto_channel=3,
+                 min_decay_time=0, min_single_pulse_width=0,
+                 max_single_pulse_width=12000, min_double_pulse_width=0,
+                 max_double_pulse_width=12000, trigger_window=10000):
+        self.single_channel = single_channel
+        self.double_channel = double_channel
+        self.veto_channel = veto_channel
+        self.min_decay_time = min_decay_time
+        self.min_single_pulse_width = min_single_pulse_width
+        self.max_single_pulse_width = max_single_pulse_width
+        self.min_double_pulse_width = min_double_pulse_width
+        self.max_double_pulse_width = max_double_pulse_width
+        self.trigger_window = trigger_window
+        self.reset()
+
+    def reset(self):
+        """
+        Reset the counters.
+
+        :returns: None
+        """
+        self.events = 0
+        self.decays = 0
+        self.rejected = dict.fromkeys(REJECTION_REASONS, 0)
+
+    def search(self, pulses):
+        """
+        Search the events of a batch. Events without pulses are not in the
+        batch, so they are not counted.
+
+        :param pulses: pulses sorted by event, channel and rising edge, as
+                       returned by PulseExtractor.extract_many
+        :type pulses: numpy.ndarray of PulseExtractor.PULSE_DTYPE
+        :returns: numpy.ndarray of DECAY_DTYPE -- the decays found
+        """
+        if not len(pulses):
+            return np.zeros(0, dtype=DECAY_DTYPE)
+        event_ids = pulses["event_id"]
+        new = np.diff(event_ids, prepend=event_ids[0] - 1) != 0
+        # first pulse of every event
+        starts = np.flatnonzero(new)
+        nevents = len(starts)
+        event = np.cumsum(new) - 1
+
+        # pulses per event and channel, and the index of the first one,
+        # the pulses are sorted by event and channel
+        counts = np.bincount(event * 8 + pulses["channel"],
+                             minlength=8 * nevents)
+        first = np.cumsum(counts) - counts
+        counts = counts.reshape(nevents, 8)
+        first = first.reshape(nevents, 8)
+
+        singles = counts[:, self.single_channel]
+        doubles = counts[:, self.double_channel]
+        vetos = np.zeros(nevents, dtype=np.int64)
+        if self.veto_channel is not None:
+            vetos = counts[:, self.veto_channel]
+
+        too_few = singles + doubles < 2
+        veto = ~too_few & (vetos > 0)
+        if self.single_channel == self.double_channel:
+            multiplicity = (doubles >= 2) & (singles >= 2)
+        else:
+            multiplicity = (doubles >= 2) & (singles == 1)
+        checked = ~too_few & ~veto & multiplicity
+        multiplicity = ~too_few & ~veto & ~multiplicity
+
+        # widths and decay times only of the remaining events
+        candidates = np.flatnonzero(checked)
+        rising = pulses["rising"]
+        falling = pulses["falling"]
+        first_single = first[candidates, self.single_channel]
+        first_double = first[candidates, self.double_channel]
+        last_double = first_double + doubles[candidates] - 1
+        single_width = falling[first_single] - rising[first_single]
+        double_width = falling[last_double] - rising[last_double]
+        widths_ok = ((self.min_single_pulse_width < single_width) &
+                     (single_width < self.max_single_pulse_width) &
+                     (self.min_double_pulse_width < double_width) &
+                     (double_width < self.max_double_pulse_width))
+        pulse_width = np.zeros(nevents, dtype=bool)
+        pulse_width[candidates[~widths_ok]] = True
+
+        decay_time = rising[last_double] - rising[first_double]
+        time_ok = widths_ok & (self.min_decay_time < decay_time) & \
+            (decay_time < self.trigger_window - 1000)
+        accepted = np.zeros(nevents, dtype=bool)
+        accepted[candidates[time_ok]] = True
+        checked &= ~pulse_width
+
+        for reason, mask in (("too_few_pulses", too_few), ("veto", veto),
+                             ("multiplicity", multiplicity),
+                             ("pulse_width", pulse_width),
+                             ("decay_time", checked & ~accepted)):
+            self.rejected[reason] += int(np.count_nonzero(mask))
+        self.events += nevents
+        self.decays += int(np.count_nonzero(accepted))
+
+        decays = np.zeros(np.count_nonzero(accepted), dtype=DECAY_DTYPE)
+        decays["event_id"] = event_ids[starts[accepted]]
+        decays["event_time"] = pulses["event_time"][starts[accepted]]
+        decays["decay_time"] = decay_time[time_ok]
+        return decays
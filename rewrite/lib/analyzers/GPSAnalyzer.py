@@ -1,8 +1,9 @@
 import logging
-import jsonpickle
+from ..common.Record import RecordType
+from ..utils.Control import ControlProxy
+from ..utils.Stream import connect_subscriber, recv_record
 import zmq
 from datetime import datetime
-import xmlrpc.client
 
 class GPSAnalyzer():
     """
@@ -15,12 +16,10 @@ class GPSAnalyzer():
         self.logger = logger
 
         self.ctx = zmq.Context()
-        self.sock = self.ctx.socket(zmq.SUB)
-        self.sock.connect("tcp://127.0.0.1:1234")
-        self.sock.subscribe("")
+        self.sock = connect_subscriber(self.ctx, [RecordType.GPS])
 
         if headless:
-            self.server = xmlrpc.client.ServerProxy("http://localhost:5556")
+            self.server = ControlProxy()
 
         self.starttime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
         self.filename = self.starttime+"_GPS.txt"
@@ -30,6 +29,5 @@ class GPSAnalyzer():
     def getGPSInfos(self):
         self.server.setRunning(True)
         self.server.get_gps_info()
-        msg = self.sock.recv_string()
-        obj = jsonpickle.decode(msg)
+        obj = recv_record(self.sock)
         print(f"Got GPS: {obj}")
\ No newline at end of file
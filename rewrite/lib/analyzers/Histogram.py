@@ -0,0 +1,142 @@
+"""
+Histogram with fixed bins that is filled incrementally.
+"""
+import numpy as np
+
+
+class Histogram(object):
+    """
+    Counts values in fixed bins. Values below the first edge are counted
+    as underflow, values above the last edge (and NaN) as overflow. Bins
+    include their lower edge, the last bin also its upper edge, like
+    numpy.histogram.
+
+    Filling is one searchsorted and one bincount per batch, so the cost
+    only depends on the number of new values, not on the values counted
+    before.
+
+    :param edges: bin edges, increasing
+    :type edges: list or tuple or numpy.ndarray
+    :raises: ValueError
+    """
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=np.float64)
+        if self.edges.ndim != 1 or len(self.edges) < 2 or \
+                np.any(np.diff(self.edges) <= 0):
+            raise ValueError("Bin edges must increase and need at least "
+                             "two entries")
+        self.reset()
+
+    def reset(self):
+        """
+        Clear all counts.
+
+        :returns: None
+        """
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+
+    @property
+    def nbins(self):
+        """
+        :returns: int -- number of bins
+        """
+        return len(self.counts)
+
+    @property
+    def entries(self):
+        """
+        :returns: int -- number of values filled, including outliers
+        """
+        return int(self.counts.sum()) + self.underflow + self.overflow
+
+    @property
+    def centers(self):
+        """
+        :returns: numpy.ndarray -- bin centers
+        """
+        return (self.edges[1:] + self.edges[:-1]) / 2.0
+
+    @property
+    def widths(self):
+        """
+        :returns: numpy.ndarray -- bin widths
+        """
+        return np.diff(self.edges)
+
+    @property
+    def errors(self):
+        """
+        :returns: numpy.ndarray -- statistical error of every bin
+        """
+        return np.sqrt(self.counts)
+
+    def fill(self, values):
+        """
+        Count values.
+
+        :param values: the values
+        :type values: float or list or numpy.ndarray
+        :returns: None
+        """
+        values = np.ravel(np.asarray(values, dtype=np.float64))
+        index = np.searchsorted(self.edges, values, side="right") - 1
+        # the upper edge belongs to the last bin
+        index[values == self.edges[-1]] = self.nbins - 1
+        inside = (index >= 0) & (index < self.nbins)
+        self.underflow += int(np.count_nonzero(index < 0))
+        self.overflow += int(np.count_nonzero(index >= self.nbins))
+        self.counts += np.bincount(index[inside], minlength=self.nbins)
+
+    def merge(self, other):
+        """
+        Add the counts of another histogram with the same edges.
+
+        :param other: the other histogram
+        :type other: Histogram
+        :returns: Histogram -- self
+        :raises: ValueError
+        """
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError("Histograms with different bins can not be "
+                             "merged")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        return self
+
+    def to_dict(self):
+        """
+        Plain Python representation, e.g. for JSON.
+
+        :returns: dict
+        """
+        return {"edges": self.edges.tolist(),
+                "counts": self.counts.tolist(),
+                "underflow": self.underflow,
+                "overflow": self.overflow}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create a histogram from the output of to_dict.
+
+        :param data: histogram as returned by to_dict
+        :type data: dict
+        :returns: Histogram
+        :raises: ValueError
+        """
+        histogram = cls(data["edges"])
+        counts = np.asarray(data["counts"], dtype=np.int64)
+        if counts.shape != histogram.counts.shape:
+            raise ValueError("Number of counts does not match the bins")
+        histogram.counts = counts
+        histogram.underflow = int(data["underflow"])
+        histogram.overflow = int(data["overflow"])
+        return histogram
+
+    def __repr__(self):
+        return "Histogram(%d bins from %g to %g, %d entries)" % (
+            self.nbins, self.edges[0], self.edges[-1], self.entries)
@@ -2,32 +2,47 @@ from .PulseExtractor import PulseExtractor
 from time import time, sleep
 import threading
 import logging
-import jsonpickle
-import xmlrpc.client
 import zmq
 from datetime import datetime
 from ..common.Record import RecordType, Record
 from ..common.DataRecord import DataRecord
+from ..utils.Control import ControlProxy
+from ..utils.Stream import connect_subscriber, recv_records
+from ..utils.Time import getLocalTime
 
 
 class PulseAnalyzer():
     """
     Class that manages the measurement of pulses from the DAQ card.
+
+    The DATA records are received on an own socket, or from a
+    RecordDispatcher shared with other consumers if one is given. With a
+    pulse_address the pulses are not extracted here, but taken from the
+    PULSES records of a PulseService, which also writes the pulse file.
     """
 
-    def __init__(self, logger=None, headless=True):
+    def __init__(self, logger=None, headless=True, dispatcher=None,
+                 pulse_address=None):
         if logger is None:
             logger = logging.getLogger()
         self.logger = logger
 
-        self.ctx = zmq.Context()
-        self.sock = self.ctx.socket(zmq.SUB)
-        self.sock.connect("tcp://127.0.0.1:1234")
-        self.sock.subscribe("")  # Subscribe to all topics
+        self.pulse_address = pulse_address
+        if pulse_address is not None:
+            dispatcher = None
+        self.dispatcher = dispatcher
+        self.consumer = None
+        if pulse_address is not None:
+            self.ctx = zmq.Context()
+            self.sock = connect_subscriber(self.ctx, [RecordType.PULSES],
+                                           pulse_address)
+        elif dispatcher is None:
+            self.ctx = zmq.Context()
+            self.sock = connect_subscriber(self.ctx, [RecordType.DATA])
 
         # Setup the DAQ Card
         if headless:
-            self.server = xmlrpc.client.ServerProxy("http://localhost:5556")
+            self.server = ControlProxy()
             self.server.setup_channel(True, True, True, True, 'threefold')
             self.server.set_threashold(110, 110, 180, 110)
 
@@ -38,11 +53,64 @@ class PulseAnalyzer():
 
     # def runDaemon(self):
 
+    def _receive(self):
+        """
+        Wait for the next DATA records.
+
+        :returns: list of Record
+        """
+        if self.consumer is not None:
+            # do not block forever, so the measurement time is checked
+            return self.consumer.get_many(timeout=1.0)
+        return recv_records(self.sock)
+
+    def _events(self, pe, records):
+        """
+        The events completed by the records, in the format of
+        PulseExtractor.extract.
+
+        :returns: list of tuple
+        """
+        events = []
+        for obj in records:
+            if obj.type == RecordType.DATA:
+                event = pe.extract(obj.payload.msg)
+                if event is not None:
+                    events.append(event)
+            elif obj.type == RecordType.PULSES:
+                now = str(getLocalTime())
+                events += [(now, *channels)
+                           for channels in obj.payload.channel_pulses()]
+        return events
+
+    def _extractor(self, filename):
+        """
+        The extractor writing the pulse file, None if the pulses come from
+        a PulseService.
+        """
+        if self.pulse_address is not None:
+            return None
+        pe = PulseExtractor(self.logger, filename)
+        pe.write_pulses(True)
+        return pe
+
     def measure_pulses(self, meastime=None):
         """
         Measure pulses (rising and falling edge times) of trigger events. Using PulseExtractor from muonic.
         :param meastime: Total measurement time in minutes. Default is None.
         """
+        if self.dispatcher is None:
+            return self._measure_pulses(meastime)
+        # only queue records while measuring
+        self.consumer = self.dispatcher.register([RecordType.DATA],
+                                                 name="pulse analyzer")
+        try:
+            return self._measure_pulses(meastime)
+        finally:
+            self.dispatcher.unregister(self.consumer)
+            self.consumer = None
+
+    def _measure_pulses(self, meastime):
         self.server.setRunning(True)
         self.server.reset_scalars()
 
@@ -60,20 +128,16 @@ class PulseAnalyzer():
 
             filename_pulses = self.starttime+"_P.txt"
 
-            pe = PulseExtractor(self.logger, filename_pulses)
-            pe.write_pulses(True)
+            pe = self._extractor(filename_pulses)
 
             t = 0
             start_t = time()
 
             try:
                 while t < (meastime*60):
-                    msg = self.sock.recv_string()
-                    obj = jsonpickle.decode(msg)
-                    if obj.type == RecordType.DATA:
-                        # print(f"PULSE OBJ: {obj}")
-                        toEmit = pe.extract(obj.payload.msg)
-                        if not self.headless and isinstance(toEmit, tuple):
+                    # a single message may carry a whole batch of lines
+                    for toEmit in self._events(pe, self._receive()):
+                        if not self.headless:
                             # print(f"Emitting: {toEmit}")
                             self.progress.emit(toEmit)
                             # self.progressBar.emit((100.*t/(meastime*60)))
@@ -112,16 +176,12 @@ class PulseAnalyzer():
 
             filename_pulses = self.starttime+"_P.txt"
 
-            pe = PulseExtractor(self.logger, filename_pulses)
-            pe.write_pulses(True)
+            pe = self._extractor(filename_pulses)
 
             try:
                 while self.running:
-                    msg = self.sock.recv_string()
-                    obj = jsonpickle.decode(msg)
-                    if obj.type == RecordType.DATA:
-                        toEmit = pe.extract(obj.payload.msg)
-                        if not self.headless and isinstance(toEmit, tuple):
+                    for toEmit in self._events(pe, self._receive()):
+                        if not self.headless:
                             self.progress.emit(toEmit)
 
             except (KeyboardInterrupt, SystemExit):
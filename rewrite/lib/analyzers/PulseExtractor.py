@@ -5,10 +5,15 @@ edges of the pulses.
 """
 import datetime
 import os
+from array import array
 
+import numpy as np
 
-from ..utils.WrappedFile import WrappedFile
-from ..utils.Time import getLocalTime
+from ..utils.WrappedFile import WrappedFile, rename_muonic_file
+from ..utils.Time import getLocalTime, get_hours_from_duration
+from ..common.PulseRecord import PULSE_DTYPE, PulseRecord
+from .TriggerLines import TRIGGER_DTYPE, parse_block, parse_line, parse_lines
+from .ClockModel import ClockModel, COUNTER_MASK
 
 # for the pulses
 # 8 bits give a hex number
@@ -32,7 +37,93 @@ BIT3 = 1 << 3  # Current or last 1PPS rate not within range
 TMC_TICK = 1.25  # nsec
 # MAX_TRIGGER_WINDOW = 60.0  # nsec
 MAX_TRIGGER_WINDOW = 9960.0  # nsec for mudecay!
-DEFAULT_FREQUENCY = 25.0e6
+
+
+class EdgeBuffer(object):
+    """
+    Edge times of the four channels of one event.
+
+    The times are stored in a single preallocated array of doubles, one
+    block of capacity entries per channel. The buffer is cleared and reused
+    for the next event, it only grows if a channel has more edges than fit
+    into its block.
+
+    :param capacity: number of edges per channel
+    :type capacity: int
+    """
+
+    __slots__ = ("capacity", "counts", "times")
+
+    CHANNELS = 4
+
+    def __init__(self, capacity=8):
+        self.capacity = capacity
+        self.counts = [0] * self.CHANNELS
+        self.times = array("d", bytes(8 * capacity * self.CHANNELS))
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def _grow(self):
+        """
+        Double the capacity, keeping the stored edges.
+        """
+        capacity = 2 * self.capacity
+        times = array("d", bytes(8 * capacity * self.CHANNELS))
+        for channel, count in enumerate(self.counts):
+            start = channel * self.capacity
+            times[channel * capacity:channel * capacity + count] = \
+                self.times[start:start + count]
+        self.capacity = capacity
+        self.times = times
+
+    def append(self, channel, time):
+        """
+        Add an edge.
+
+        :param channel: channel number 0 to 3
+        :type channel: int
+        :param time: time of the edge in ns
+        :type time: float
+        :returns: None
+        """
+        count = self.counts[channel]
+        if count == self.capacity:
+            self._grow()
+        self.times[channel * self.capacity + count] = time
+        self.counts[channel] = count + 1
+
+    def get(self, channel):
+        """
+        :param channel: channel number 0 to 3
+        :type channel: int
+        :returns: list of float -- edge times of the channel in the order
+                  they were added
+        """
+        start = channel * self.capacity
+        return self.times[start:start + self.counts[channel]].tolist()
+
+    def set(self, channel, times):
+        """
+        Replace the edges of a channel.
+
+        :param channel: channel number 0 to 3
+        :type channel: int
+        :param times: edge times in ns
+        :type times: list of float
+        :returns: None
+        """
+        self.counts[channel] = 0
+        for time in times:
+            self.append(channel, time)
+
+    def clear(self):
+        """
+        Remove all edges, keeping the memory.
+
+        :returns: None
+        """
+        self.counts[:] = [0] * self.CHANNELS
 
 
 class PulseExtractor:
@@ -43,45 +134,44 @@ class PulseExtractor:
 
     :param logger: logger object
     :type logger: logging.Logger
-    :param filename: filename of the pulse file
+    :param filename: filename of the pulse file, no pulses are written if
+                     None
     :type filename: str
     """
 
-    def __init__(self, logger, filename):
+    # smallest batch extract_many uses the array operations for
+    VECTOR_MIN_LINES = 64
+
+    def __init__(self, logger, filename=None):
         self.logger = logger
-        self.pulse_file = WrappedFile(filename)
+        self.pulse_file = None if filename is None else WrappedFile(filename)
         self._write_pulses = False
 
         # start time and duration
         self.start_time = getLocalTime()
         self.measurement_duration = datetime.timedelta()
 
-        # TODO change to dictionaries, they might be faster
-        self.re = {"ch0": [], "ch1": [], "ch2": [], "ch3": []}
-        self.fe = {"ch0": [], "ch1": [], "ch2": [], "ch3": []}
-        self.last_re = {"ch0": [], "ch1": [], "ch2": [], "ch3": []}
-        self.last_fe = {"ch0": [], "ch1": [], "ch2": [], "ch3": []}
+        # edges of the open event and of the event completed last, the
+        # buffers are swapped on every trigger
+        self.re = EdgeBuffer()
+        self.fe = EdgeBuffer()
+        self.last_re = EdgeBuffer()
+        self.last_fe = EdgeBuffer()
 
         # ini will be False if we have seen the first trigger
         # store items if Events are longer than one line
         self.ini = True
-        self.last_one_pps = 0
+        # ns since the epoch
         self.last_trigger_time = 0
-        self.trigger_count = 0
-        self.last_time = 0
 
-        # store the actual value of the trigger counter
-        # to correct trigger counter rollover
+        # raw trigger counter of the previous line
         self.last_trigger_count = 0
 
-        # TODO find a generic way to account for the fact that the default
-        # cna be either 25 or 41 MHz variables for DAQ frequency calculation
-        self.last_frequency_poll_time = 0
-        self.last_frequency_poll_triggers = 0
-        self.calculated_frequency = DEFAULT_FREQUENCY
-        self.last_one_pps_poll = 0
-        self.passed_one_pps = 0
-        self.prev_last_one_pps = 0
+        # oscillator frequency and absolute time of the lines
+        self.clock = ClockModel()
+
+        # number of events returned so far
+        self.event_count = 0
 
     def write_pulses(self, write_pulses):
         """
@@ -124,7 +214,8 @@ class PulseExtractor:
             self.pulse_file.close()
 
         # only rename if file actually exists
-        if os.path.exists(self.pulse_file.get_filename()):
+        if self.pulse_file is not None and \
+                os.path.exists(self.pulse_file.get_filename()):
             try:
                 self.logger.info(("The pulse extraction measurement was " +
                                   "active for %f hours") %
@@ -148,23 +239,16 @@ class PulseExtractor:
         :return: None
         """
 
-        rising_edges = {
-            "ch0": int(line[1], 16), "ch1": int(line[3], 16),
-            "ch2": int(line[5], 16), "ch3": int(line[7], 16)
-        }
-        falling_edges = {
-            "ch0": int(line[2], 16), "ch1": int(line[4], 16),
-            "ch2": int(line[6], 16), "ch3": int(line[8], 16)
-        }
-
-        for ch in ["ch0", "ch1", "ch2", "ch3"]:
-            re = rising_edges[ch]
-            fe = falling_edges[ch]
+        for channel in range(4):
+            re = int(line[1 + 2 * channel], 16)
+            fe = int(line[2 + 2 * channel], 16)
 
             if re & BIT5:
-                self.re[ch].append(counter_diff + (re & BIT0_4) * TMC_TICK)
+                self.re.append(channel,
+                               counter_diff + (re & BIT0_4) * TMC_TICK)
             if fe & BIT5:
-                self.fe[ch].append(counter_diff + (fe & BIT0_4) * TMC_TICK)
+                self.fe.append(channel,
+                               counter_diff + (fe & BIT0_4) * TMC_TICK)
 
     def _order_and_clean_pulses(self):
         """
@@ -178,11 +262,12 @@ class PulseExtractor:
         """
         pulses = {"ch0": [], "ch1": [], "ch2": [], "ch3": []}
 
-        for ch in ["ch0", "ch1", "ch2", "ch3"]:
-            for index, re in enumerate(self.last_re[ch]):
+        for channel, ch in enumerate(["ch0", "ch1", "ch2", "ch3"]):
+            falling_edges = self.last_fe.get(channel)
+            for index, re in enumerate(self.last_re.get(channel)):
                 # add the virtual falling edge if necessary
                 try:
-                    fe = self.last_fe[ch][index]
+                    fe = falling_edges[index]
                     if fe < re:
                         fe = MAX_TRIGGER_WINDOW
                 except IndexError:
@@ -200,32 +285,6 @@ class PulseExtractor:
             #         self.pulses[ch] = (i[0],MAX_TRIGGER_WINDOW)
         return pulses
 
-    def _get_evt_time(self, time, correction, trigger_count, one_pps):
-        """
-        Get the absolute event time in seconds since day start
-        If gps is not available, only relative event time based on counts
-        is returned
-
-        :param time: event time
-        :param correction:
-        :param trigger_count:
-        :param one_pps:
-        :returns: float
-        """
-        time_fields = time.split(".")
-        t = time_fields[0]
-
-        secs_since_day_start = (int(t[0:2]) * 3600 +
-                                int(t[2:4]) * 60 + int(t[4:6]))
-
-        # FIXME: Why time_fields[1] / 1000?
-        gps_time = float(secs_since_day_start + int(time_fields[1]) / 1000.0 +
-                         int(correction) / 1000.0)
-
-        line_time = gps_time + float((trigger_count - one_pps) /
-                                     self.calculated_frequency)
-        return line_time
-
     def extract(self, line):
         """
         Analyze subsequent lines (one per call)
@@ -247,59 +306,17 @@ class PulseExtractor:
             trigger_count = int(line[0], 16)
         except:
             pass
-        time = line[10]
-
-        # correct for trigger count rollover
-        if trigger_count < self.last_trigger_count:
-            trigger_count += int(0xFFFFFFFF)  # counter offset
-
-        self.trigger_count = trigger_count
-
-        if one_pps != self.last_one_pps:
-            self.passed_one_pps += 1
-            # poll every x lines for the frequency
-            # check for one_pps counter rollover
-            if one_pps < self.last_one_pps:
-                one_pps += int(0xFFFFFFFF)
-
-            # calculate the frequency every x one_pps
-            if not self.passed_one_pps % 5:
-                self.calculated_frequency = ((one_pps - self.last_one_pps_poll) /
-                                             float(self.passed_one_pps))
-                self.passed_one_pps = 0
-                self.last_one_pps_poll = one_pps
-
-                # check if calculated_frequency is sane,
-                # assuming the daq frequency is somewhat stable
-                if not (0.5 * self.calculated_frequency <
-                        DEFAULT_FREQUENCY < 1.5 * self.calculated_frequency):
-                    self.calculated_frequency = DEFAULT_FREQUENCY
-
-            if time == self.last_time:
-                # correcting for delayed one_pps switch
-                line_time = self._get_evt_time(line[10], line[15],
-                                               trigger_count,
-                                               self.last_one_pps)
-            else:
-                line_time = self._get_evt_time(line[10], line[15],
-                                               trigger_count, one_pps)
-        else:
-            line_time = self._get_evt_time(line[10], line[15],
-                                           trigger_count, one_pps)
-
-        # storing the last two one_pps switches
-        self.prev_last_one_pps = self.last_one_pps
-        self.last_one_pps = one_pps
 
-        self.last_time = time
+        line_time = self.clock.timestamp(trigger_count, one_pps, line[10],
+                                         line[11], line[15])
 
         if int(line[1], 16) & BIT7:  # a trigger flag!
             self.ini = False
 
             # a new trigger! we have to evaluate the
             # last one and get the new pulses
-            self.last_re = self.re
-            self.last_fe = self.fe
+            self.last_re, self.re = self.re, self.last_re
+            self.last_fe, self.fe = self.fe, self.last_fe
 
             pulses = self._order_and_clean_pulses()
             # utcTime = getLocalTime()
@@ -314,17 +331,17 @@ class PulseExtractor:
 
             extracted_pulses = ( str(getLocalTime()), pulses["ch0"],
                                 pulses["ch1"], pulses["ch2"], pulses["ch3"])
+            self.event_count += 1
             # print(f"extracted: {extracted_pulses}")
             if self._write_pulses:
                 # print("Writing pulses to file")
                 self.pulse_file.write(repr(extracted_pulses) + '\n')
 
             # as the pulses for the last event are done,
-            # reinitialize data structures
-            # for the next event
+            # reuse the buffers for the next event
             self.last_trigger_time = line_time
-            self.re = {"ch0": [], "ch1": [], "ch2": [], "ch3": []}
-            self.fe = {"ch0": [], "ch1": [], "ch2": [], "ch3": []}
+            self.re.clear()
+            self.fe.clear()
 
             # calculate edges of the new pulses
             self._calculate_edges(line)
@@ -334,18 +351,190 @@ class PulseExtractor:
         else:
             # we do have a previous trigger and are now
             # adding more pulses to the event
-            if self.ini:
-                self.last_one_pps = int(line[9], 16)
-            else:
-                counter_diff = (self.trigger_count - self.last_trigger_count)
-                # print(counter_diff, counter_diff > int(0xffffffff))
-                # FIXME: is this correct?
-                if counter_diff > int(0xffffffff):
-                    counter_diff -= int(0xffffffff)
-
-                counter_diff /= self.calculated_frequency
+            if not self.ini:
+                # counter difference, also across a rollover
+                counter_diff = ((trigger_count - self.last_trigger_count) &
+                                COUNTER_MASK)
+                counter_diff /= self.clock.frequency
 
                 self._calculate_edges(line, counter_diff=counter_diff * 1e9)
 
         # end of if trigger flag
         self.last_trigger_count = trigger_count
+
+    def extract_many(self, lines):
+        """
+        Analyze a batch of lines at once. Same as calling extract for
+        every line, and both can be mixed, but the pulses of all events
+        completed by the batch are returned in one array, one row per
+        pulse, sorted by event, channel and rising edge. Events without
+        pulses have no rows, but still use up an event id.
+
+        event_time is the time of the trigger which opened the event in ns
+        since the epoch, see ClockModel (0 for the event before the first
+        trigger).
+
+        Lines which are no valid trigger lines are skipped.
+
+        The array operations have a fixed cost of about a millisecond, so
+        batches of less than VECTOR_MIN_LINES messages are passed to extract
+        line by line instead.
+
+        :param lines: DAQ messages or lines parsed with TriggerLines
+        :type lines: list of str or bytes, or numpy.ndarray of TRIGGER_DTYPE
+        :returns: numpy.ndarray of PULSE_DTYPE
+        """
+        if isinstance(lines, np.ndarray) and lines.dtype == TRIGGER_DTYPE:
+            pass
+        elif all(isinstance(line, str) for line in lines):
+            if len(lines) < self.VECTOR_MIN_LINES:
+                return self._extract_lines(lines)
+            lines = parse_block("\n".join(lines).encode("ascii", "replace"))
+        else:
+            lines = parse_lines([line.encode("ascii", "replace")
+                                 if isinstance(line, str) else line
+                                 for line in lines])
+        if not len(lines):
+            return np.zeros(0, dtype=PULSE_DTYPE)
+
+        line_times, offsets, counted = self._update_counters(lines)
+        triggers = (lines["edges"][:, 0] & BIT7) != 0
+        ntriggers = int(np.count_nonzero(triggers))
+
+        trigger_times = line_times[triggers]
+        event_times = np.concatenate(([self.last_trigger_time],
+                                      trigger_times))
+
+        # events are the lines from one trigger to the next, event 0 is
+        # the one opened before this batch
+        events = np.cumsum(triggers)
+        edges = lines["edges"]
+        edge_times = offsets[:, None] + (edges & BIT0_4) * TMC_TICK
+        edge_seen = ((edges & BIT5) != 0) & counted[:, None]
+
+        columns = []
+        for index in range(4):
+            re_events, re_times = self._edges_of_events(
+                self.re.get(index), events, edge_seen[:, 2 * index],
+                edge_times[:, 2 * index])
+            fe_events, fe_times = self._edges_of_events(
+                self.fe.get(index), events, edge_seen[:, 2 * index + 1],
+                edge_times[:, 2 * index + 1])
+
+            # keep the edges of the event which is still open
+            self.re.set(index, re_times[re_events == ntriggers].tolist())
+            self.fe.set(index, fe_times[fe_events == ntriggers].tolist())
+
+            done = re_events < ntriggers
+            re_events, re_times = re_events[done], re_times[done]
+            columns.append((re_events, np.full(len(re_events), index),
+                            re_times, self._falling_edges(
+                                re_events, re_times, fe_events, fe_times)))
+
+        event, channel, rising, falling = [np.concatenate(c)
+                                           for c in zip(*columns)]
+        order = np.lexsort((falling, rising, channel, event))
+        pulses = np.zeros(len(order), dtype=PULSE_DTYPE)
+        pulses["event_id"] = self.event_count + event[order]
+        pulses["channel"] = channel[order]
+        pulses["rising"] = rising[order]
+        pulses["falling"] = falling[order]
+        pulses["event_time"] = event_times[event[order]]
+
+        if ntriggers:
+            self.last_trigger_time = int(trigger_times[-1])
+        if self._write_pulses:
+            self._write_events(pulses, ntriggers)
+        self.event_count += ntriggers
+        return pulses
+
+    def _extract_lines(self, lines):
+        """
+        Run extract for every valid line and collect the pulses like
+        extract_many.
+        """
+        rows = []
+        for line in lines:
+            if parse_line(line.encode("ascii", "replace")) is None:
+                continue
+            event_id = self.event_count
+            event_time = self.last_trigger_time
+            event = self.extract(line)
+            if event is None:
+                continue
+            for channel in range(4):
+                for rising, falling in event[channel + 1]:
+                    rows.append((event_id, channel, rising, falling,
+                                 event_time))
+        return np.array(rows, dtype=PULSE_DTYPE)
+
+    def _update_counters(self, lines):
+        """
+        Line times and edge offsets of extract for all lines at once.
+
+        :returns: tuple of numpy.ndarray -- line times in ns since the
+                  epoch, time offsets of the edges in ns, mask of lines
+                  whose edges are counted
+        """
+        triggers = (lines["edges"][:, 0] & BIT7) != 0
+        # lines before the first trigger, their edges are ignored
+        ini = self.ini & (np.cumsum(triggers) == 0)
+        counted = ~ini
+
+        line_times, frequencies = self.clock.timestamps(lines)
+
+        # counter difference to the line before, also across a rollover
+        raw = lines["trigger_count"].astype(np.int64)
+        counter_diff = (raw - np.concatenate(([self.last_trigger_count],
+                                              raw[:-1]))) & COUNTER_MASK
+        offsets = np.where(counted & ~triggers,
+                           counter_diff / frequencies * 1e9, 0.0)
+
+        self.last_trigger_count = int(raw[-1])
+        self.ini = bool(ini[-1]) and not triggers[-1]
+        return line_times, offsets, counted
+
+    @staticmethod
+    def _edges_of_events(pending, events, seen, times):
+        """
+        Edges of one kind and channel with the event they belong to,
+        including the edges of the open event from before the batch.
+
+        :returns: tuple of numpy.ndarray -- events, edge times
+        """
+        return (np.concatenate((np.zeros(len(pending), dtype=np.int64),
+                                events[seen])),
+                np.concatenate((np.asarray(pending, dtype=np.float64),
+                                times[seen])))
+
+    @staticmethod
+    def _falling_edges(re_events, re_times, fe_events, fe_times):
+        """
+        Pair the n-th rising with the n-th falling edge of an event and add
+        virtual falling edges like _order_and_clean_pulses.
+
+        :returns: numpy.ndarray -- falling edge of every rising edge
+        """
+        def keys(events):
+            # position of every edge within its event
+            rank = np.arange(len(events)) - np.searchsorted(events, events)
+            return events * (len(re_events) + len(fe_events) + 1) + rank
+
+        fe_keys = keys(fe_events)
+        re_keys = keys(re_events)
+        pos = np.searchsorted(fe_keys, re_keys)
+        found = pos < len(fe_keys)
+        found[found] = fe_keys[pos[found]] == re_keys[found]
+        falling = np.full(len(re_times), MAX_TRIGGER_WINDOW)
+        falling[found] = fe_times[pos[found]]
+        falling[falling < re_times] = MAX_TRIGGER_WINDOW
+        return falling
+
+    def _write_events(self, pulses, nevents):
+        """
+        Write events returned by extract_many in the format of extract.
+        """
+        now = str(getLocalTime())
+        for event in PulseRecord(pulses, self.event_count,
+                                 nevents).channel_pulses():
+            self.pulse_file.write(repr((now, *event)) + '\n')
@@ -0,0 +1,188 @@
+"""
+Extract the pulses of the DATA stream once for all analyzers.
+
+The PulseService subscribes to the DATA records of a DAQ server, runs a
+single PulseExtractor over them and publishes the pulses of the completed
+events as PULSES records on an own PUB socket. Analyzers subscribe to
+those instead of extracting the pulses from the raw lines themselves::
+
+    sock = connect_subscriber(ctx, [RecordType.PULSES], PULSE_ADDRESS)
+    for rec in iter_records(sock):
+        decays = search.search(rec.payload.pulses)
+"""
+import logging
+import threading
+from time import time
+
+import zmq
+
+from ..common.Record import Record, RecordType
+from ..common.PulseRecord import PulseRecord
+from ..utils.Stream import (DEFAULT_ADDRESS, connect_subscriber,
+                            publish_record, recv_waiting)
+from .PulseExtractor import PulseExtractor
+
+PULSE_PORT = 1235
+# address the service binds to and analyzers connect to
+PULSE_ADDRESS = f"tcp://127.0.0.1:{PULSE_PORT}"
+
+
+class PulseRecords(object):
+    """
+    Turns batches of DATA lines into PULSES records. Used by the
+    PulseService and by the PulsePlugin of an AnalysisHost, so both number
+    and fill the records the same way.
+
+    :param pulse_file: file the pulses are written to, not written if None
+    :type pulse_file: str
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    def __init__(self, pulse_file=None, logger=None):
+        if logger is None:
+            logger = logging.getLogger()
+        self.extractor = PulseExtractor(logger, pulse_file)
+        if pulse_file is not None:
+            self.extractor.write_pulses(True)
+        self.package_number = 0
+
+    def process(self, lines):
+        """
+        Extract the pulses of the lines.
+
+        :param lines: the lines of DATA records, in the order they arrived
+        :type lines: list of str
+        :returns: Record or None -- PULSES record with the pulses of the
+                  completed events, None if no event was completed
+        """
+        first_event = self.extractor.event_count
+        pulses = self.extractor.extract_many(lines)
+        events = self.extractor.event_count - first_event
+        if not events:
+            return None
+        rec = Record(self.package_number, RecordType.PULSES, time(),
+                     PulseRecord(pulses, first_event, events))
+        self.package_number += 1
+        return rec
+
+    def finish(self):
+        """
+        Finish the pulse file.
+
+        :returns: None
+        """
+        self.extractor.finish()
+
+
+class PulseService(object):
+    """
+    Publishes the pulses of the DATA records of a DAQ server.
+
+    The DATA messages waiting at the socket are received together, up to
+    MAX_BATCH records or MAX_DELAY seconds, and passed to
+    PulseExtractor.extract_many at once. The pulses of the events they
+    complete are sent as one PULSES record. The payload is a PulseRecord
+    with the pulses as numpy.ndarray of PULSE_DTYPE.
+
+    Can be used as context manager like the ControlServer.
+
+    :param data_address: address of the DAQ server
+    :type data_address: str
+    :param bind_address: address the PULSES records are published on
+    :type bind_address: str
+    :param pulse_file: file the pulses are written to, not written if None
+    :type pulse_file: str
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    # time the loop blocks before checking for shutdown
+    POLL_TIMEOUT = 500  # milliseconds
+    # limits of the DATA records processed together
+    MAX_BATCH = 10000
+    MAX_DELAY = 0.05  # seconds
+
+    def __init__(self, data_address=DEFAULT_ADDRESS,
+                 bind_address=PULSE_ADDRESS, pulse_file=None,
+                 logger=None):
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        self.data_address = data_address
+
+        self.pulses = PulseRecords(pulse_file, self.logger)
+
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.PUB)
+        self.socket.bind(bind_address)
+        self._stop = threading.Event()
+
+    @property
+    def address(self):
+        """
+        :returns: str -- the address the pulses are published on
+        """
+        return self.socket.getsockopt(zmq.LAST_ENDPOINT).decode("ascii")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def process(self, records):
+        """
+        Extract the pulses of DATA records and publish them. Other records
+        are ignored.
+
+        :param records: the records
+        :type records: list of Record
+        :returns: Record or None -- the published PULSES record, None if
+                  the records did not complete any event
+        """
+        lines = [rec.payload.msg for rec in records
+                 if rec.type == RecordType.DATA]
+        if not lines:
+            return None
+        rec = self.pulses.process(lines)
+        if rec is not None:
+            publish_record(self.socket, rec)
+        return rec
+
+    def serve_forever(self):
+        """
+        Receive and process DATA records until shutdown() is called.
+
+        :returns: None
+        """
+        self._stop.clear()
+        sock = connect_subscriber(self.context, [RecordType.DATA],
+                                  self.data_address)
+        try:
+            while not self._stop.is_set():
+                if sock.poll(self.POLL_TIMEOUT):
+                    self.process(recv_waiting(sock, self.MAX_BATCH,
+                                              self.MAX_DELAY))
+        finally:
+            sock.close(linger=0)
+
+    def shutdown(self):
+        """
+        Make serve_forever() return.
+
+        :returns: None
+        """
+        self._stop.set()
+
+    def server_close(self):
+        """
+        Finish the pulse file and close the socket.
+
+        :returns: None
+        """
+        try:
+            self.pulses.finish()
+        finally:
+            self.socket.close(linger=0)
+            self.context.term()
@@ -1,13 +1,13 @@
-import xmlrpc.client
 import zmq
 import logging
-import jsonpickle
 import numpy as np
 
 from ..common.CountRecord import CountRecord
 from ..common.Record import RecordType, Record
 from ..common.PressureRecord import PressureType, PressureRecord
 from ..common.TemperatureRecord import TemperatureRecord
+from ..utils.Control import ControlProxy
+from ..utils.Stream import connect_subscriber, recv_record
 from ..utils.Time import getCurrentTimeString
 from datetime import datetime
 from time import time, sleep
@@ -27,12 +27,11 @@ class RateAnalyzer():
 
         # Setup the communication with the data well
         self.ctx = zmq.Context()
-        self.sock = self.ctx.socket(zmq.SUB)
-        self.sock.connect("tcp://127.0.0.1:1234")
-        self.sock.subscribe("")  # Subscribe to all topics
+        self.sock = connect_subscriber(
+            self.ctx, [RecordType.COUNTER, RecordType.PRESSURE, RecordType.TEMPERATURE])
         self.headless = headless
         if headless:
-            self.server = xmlrpc.client.ServerProxy("http://localhost:5556")
+            self.server = ControlProxy()
             self.server.setup_channel(True, True, True, True, 'threefold')
             self.server.set_threashold(110, 110, 180, 110)
         # self.server.get_gps_info()
@@ -44,7 +43,12 @@ class RateAnalyzer():
         writerTask = threading.Thread(target=self.fileWriter).start()
 
         self.pressure = 99
+        self.current_pressure = self.pressure
         self.temperature = 20
+        self.dateandtime = None
+        # ends runDaemon
+        self._stop = threading.Event()
+        self._daemon = None
 
     def fileWriter(self):
         with open(self.filename, 'a') as f:
@@ -64,10 +68,26 @@ class RateAnalyzer():
             self.outQueue.put(
                 "Date Time Rate_0 Rate_1 Rate_2 Rate_3 Rate_trigger Counts_0 Counts_1 Counts_2 Counts_3 Trigger Delta_time Pressure [mBar] Temperature [C] \n")
 
+    # time runDaemon blocks before checking for stop
+    POLL_TIMEOUT = 500  # milliseconds
+
+    def stop(self):
+        """
+        Make runDaemon return and wait for the daemon thread.
+
+        :returns: None
+        """
+        self._stop.set()
+        if self._daemon is not None and \
+                self._daemon is not threading.current_thread():
+            self._daemon.join()
+            self._daemon = None
+
     def runDaemon(self):
-        while True:
-            msg = self.sock.recv_string()
-            obj = jsonpickle.decode(msg)
+        while not self._stop.is_set():
+            if not self.sock.poll(self.POLL_TIMEOUT):
+                continue
+            obj = recv_record(self.sock)
             if obj.type == RecordType.COUNTER and obj.payload.valid == True:
                 print(
                     f"Package No.: {obj.packageNumber} Type: {obj.type} timestamp: {obj.timestamp} payloads: {repr(obj.payload)}")
@@ -81,8 +101,12 @@ class RateAnalyzer():
                     curRates = np.array([cntRec.counts_ch0, cntRec.counts_ch1,
                                          cntRec.counts_ch2, cntRec.counts_ch3, cntRec.counts_trigger])
                     current_time = datetime.fromtimestamp(obj.timestamp)
-                    self.delta_time = (
-                        current_time - self.previous_time).total_seconds()
+                    # the server measures the exact time between its polls,
+                    # records of older servers only have their timestamps
+                    self.delta_time = getattr(cntRec, "delta_time", None)
+                    if self.delta_time is None:
+                        self.delta_time = (
+                            current_time - self.previous_time).total_seconds()
                     self.previous_time = current_time
 
                     deltaRates = curRates - self.prev_rates
@@ -117,42 +141,31 @@ class RateAnalyzer():
 
             self.write_rates_to_file(firstline=True)
             self.server.reset_scalars()
-            # x = threading.Thread(target=self.start_reading_data)
-            # x.start()
-            print("before reading data")
+            # the rates are calculated from the COUNTER records published
+            # by the server's poll scheduler
+            self._stop.clear()
+            self._daemon = threading.Thread(target=self.runDaemon)
+            self._daemon.daemon = True
+            self._daemon.start()
             self.server.start_reading_data()
-            x = threading.Thread(target=self.runDaemon)
-            # x.start()
-            print("after reading data")
+            self.server.start_polling(timewindow)
 
+            start_t = time()
             t = 0
             try:
                 while t < (meastime*60):
-                    # self.server.read_scalars()
-                    time_start = time()
-                    sleep(timewindow)
-                    self.server.read_scalars()
-                    time_end = time()
-                    self.dateandtime = datetime.now().strftime(
-                        "%Y-%m-%d %H:%M:%S.%f")[:-3]
-                    self.server.do('TH')
-                    self.server.do('BA')
-                    self.server.get_temp_and_pressure()
-                    sleep(0.5)
-                    self.delta_time = time_end-time_start
-                    # self.server.calculate_rates()
-                    if not x.is_alive():
-                        x.start()
-                    self.write_rates_to_file()
+                    sleep(min(timewindow, meastime*60 - t))
+                    t = time() - start_t
                     if not self.headless:
                         self.progressbar.emit(100*t/(meastime*60) )
                     self.logger.info('Measurement progress: %f %%' %
                                      (100*t/(meastime*60)))
-                    t += self.delta_time
 
+                self.server.stop_polling()
                 self.server.stop_reading_data()
                 self.logger.info('Measurement is stopping. Please wait!')
                 sleep(5)
+                self.stop()
                 self.running = False
                 self.logger.info('Measurement stopped!')
                 self.server.clear_queues()
@@ -160,9 +173,11 @@ class RateAnalyzer():
 
             except (KeyboardInterrupt, AttributeError, RuntimeError, NameError, SystemExit):
 
+                self.server.stop_polling()
                 self.server.stop_reading_data()
                 self.logger.info('Measurement is stopping. Please wait!')
                 sleep(5)
+                self.stop()
                 self.server.setRunning(False)
                 self.logger.info('Measurement stopped!')
                 self.server.clear_queues()
@@ -176,31 +191,19 @@ class RateAnalyzer():
             self.starttime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
             self.write_rates_to_file(firstline=True)
             self.server.reset_scalars()
-            # x = threading.Thread(target=self.process_incoming)
-            # x.start()
-            x = threading.Thread(target=self.server.process_incoming())
-            x.start()
+            self.server.setRunning(True)
+            self.server.start_reading_data()
+            self.server.start_polling(timewindow)
 
+            self._stop.clear()
             try:
-                while self.running:
-                    self.server.read_scalars()
-                    time_start = time()
-                    sleep(timewindow)
-                    self.server.read_scalars()
-                    time_end = time()
-                    self.dateandtime = datetime.now().strftime(
-                        "%Y-%m-%d %H:%M:%S.%f")[:-3]
-                    self.server.do('TH')
-                    self.server.do('BA')
-                    sleep(0.5)
-                    self.server.get_temp_and_pressure()
-                    self.delta_time = time_end-time_start
-
-                    self.write_rates_to_file()
+                self.runDaemon()
             except (KeyboardInterrupt, AttributeError, RuntimeError, NameError, SystemExit):
+                self.server.stop_polling()
                 self.server.stop_reading_data()
                 self.logger.info('Measurement is stopping. Please wait!')
                 sleep(5)
+                self.stop()
                 self.server.setRunning(False)
                 self.logger.info('Measurement stopped!')
                 self.server.clear_queues()
@@ -0,0 +1,230 @@
+"""
+Parse the trigger lines of the DAQ card into NumPy structured arrays.
+
+A trigger line has 16 fields separated by single spaces::
+
+    B9C05556 00 27 00 00 00 00 00 00 00000002 000000.000 000000 V 00 8 +0000
+
+trigger count, rising and falling edge bytes of channels 0 to 3, 1PPS
+count, GPS time (hhmmss.sss), date (ddmmyy), validity of the GPS data,
+number of satellites, DAQ status and time correction in ms.
+
+Lines with the fixed 72 byte layout the card sends are converted with
+array operations. All other lines are checked field by field with the same
+rules the analysis scripts use, so odd but valid lines are still accepted:
+the line has exactly 16 fields, the trigger count 8 digits, and all fields
+are numbers. Everything else (status messages, mixed up lines) is dropped.
+"""
+import numpy as np
+
+TRIGGER_DTYPE = np.dtype([
+    ("trigger_count", np.uint32),
+    # re0, fe0, re1, fe1, re2, fe2, re3, fe3
+    ("edges", np.uint8, (8,)),
+    ("one_pps", np.uint32),
+    # seconds since day start, without the correction
+    ("gps_time", np.float64),
+    # ddmmyy
+    ("date", np.uint32),
+    ("valid", np.bool_),
+    ("satellites", np.uint8),
+    ("status", np.uint8),
+    # ms
+    ("correction", np.int16),
+])
+
+# length of a trigger line in the layout the card sends
+LINE_LENGTH = 72
+
+# columns of the fixed layout
+_TRIGGER_COUNT = list(range(0, 8))
+_EDGES = [[9 + 3 * i, 10 + 3 * i] for i in range(8)]
+_ONE_PPS = list(range(33, 41))
+_HOURS, _MINUTES, _SECONDS = [42, 43], [44, 45], [46, 47]
+_MILLISECONDS = [49, 50, 51]
+_DATE = list(range(53, 59))
+_VALID = 60
+_SATELLITES = [62, 63]
+_STATUS = [65]
+_SIGN = 67
+_CORRECTION = [68, 69, 70, 71]
+_SPACES = [8] + [11 + 3 * i for i in range(8)] + [41, 52, 59, 61, 64, 66]
+_DOT = 48
+
+_INVALID = 255
+_HEX = np.full(256, _INVALID, dtype=np.uint8)
+_DEC = np.full(256, _INVALID, dtype=np.uint8)
+for _i, _c in enumerate(b"0123456789"):
+    _HEX[_c] = _DEC[_c] = _i
+for _i, _c in enumerate(b"ABCDEF"):
+    _HEX[_c] = _HEX[_c + 32] = 10 + _i
+
+
+def _digits(table, buf, columns, base):
+    """
+    Convert the digits in the given columns of every row into numbers.
+
+    :returns: tuple -- values, mask of rows where all digits are valid
+    """
+    digits = table[buf[:, columns]]
+    ok = (digits != _INVALID).all(axis=-1)
+    value = np.zeros(digits.shape[:-1], dtype=np.int64)
+    for i in range(digits.shape[-1]):
+        value *= base
+        value += digits[..., i]
+    return value, ok
+
+
+def _parse_fixed(buf):
+    """
+    Parse lines in the fixed layout.
+
+    :param buf: one line per row
+    :type buf: numpy.ndarray of uint8 with LINE_LENGTH columns
+    :returns: tuple -- structured array, mask of rows which could be parsed
+    """
+    out = np.zeros(len(buf), dtype=TRIGGER_DTYPE)
+    ok = (buf[:, _SPACES] == ord(" ")).all(axis=1) & (buf[:, _DOT] == ord("."))
+
+    out["trigger_count"], valid = _digits(_HEX, buf, _TRIGGER_COUNT, 16)
+    ok &= valid
+    out["edges"], valid = _digits(_HEX, buf, _EDGES, 16)
+    ok &= valid.all(axis=1)
+    out["one_pps"], valid = _digits(_HEX, buf, _ONE_PPS, 16)
+    ok &= valid
+
+    gps_time = np.zeros(len(buf))
+    for columns, factor in ((_HOURS, 3600), (_MINUTES, 60), (_SECONDS, 1)):
+        value, valid = _digits(_DEC, buf, columns, 10)
+        gps_time += value * factor
+        ok &= valid
+    value, valid = _digits(_DEC, buf, _MILLISECONDS, 10)
+    out["gps_time"] = gps_time + value / 1000.0
+    ok &= valid
+
+    out["date"], valid = _digits(_DEC, buf, _DATE, 10)
+    ok &= valid
+    out["valid"] = buf[:, _VALID] == ord("A")
+    out["satellites"], valid = _digits(_DEC, buf, _SATELLITES, 10)
+    ok &= valid
+    out["status"], valid = _digits(_HEX, buf, _STATUS, 16)
+    ok &= valid
+
+    correction, valid = _digits(_DEC, buf, _CORRECTION, 10)
+    sign = buf[:, _SIGN]
+    out["correction"] = np.where(sign == ord("-"), -correction, correction)
+    ok &= valid & ((sign == ord("+")) | (sign == ord("-")))
+    return out, ok
+
+
+def parse_line(line):
+    """
+    Parse a single trigger line field by field.
+
+    :param line: line from the DAQ card
+    :type line: bytes
+    :returns: tuple or None -- the fields in the order of TRIGGER_DTYPE, None
+              if the line is no valid trigger line
+    """
+    fields = line.rstrip(b"\r\n").split(b" ")
+    # Ignore malformed lines and everything that is not trigger data
+    if len(fields) != 16 or len(fields[0]) != 8:
+        return None
+    try:
+        hms, ms = fields[10].split(b".")
+        gps_time = (int(hms[0:2]) * 3600 + int(hms[2:4]) * 60 +
+                    int(hms[4:6]) + int(ms) / 1000.0)
+        return (int(fields[0], 16), [int(f, 16) for f in fields[1:9]],
+                int(fields[9], 16), gps_time, int(fields[11]),
+                fields[12] == b"A", int(fields[13]), int(fields[14], 16),
+                int(fields[15]))
+    except ValueError:
+        return None
+
+
+def parse_block(data):
+    """
+    Parse a block of raw DAQ output. Invalid lines are dropped.
+
+    :param data: lines from the DAQ card separated by line endings
+    :type data: bytes
+    :returns: numpy.ndarray -- structured array of TRIGGER_DTYPE
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    if not len(buf):
+        return np.zeros(0, dtype=TRIGGER_DTYPE)
+    stops = np.flatnonzero(buf == ord("\n"))
+    if buf[-1] != ord("\n"):
+        stops = np.append(stops, len(buf))
+    starts = np.concatenate(([0], stops[:-1] + 1))
+    cr = (stops > starts) & (buf[stops - 1] == ord("\r"))
+    stops[cr] -= 1
+
+    out = np.zeros(len(starts), dtype=TRIGGER_DTYPE)
+    ok = np.zeros(len(starts), dtype=bool)
+    fixed = stops - starts == LINE_LENGTH
+    if fixed.any():
+        # view with the LINE_LENGTH bytes starting at every offset as row
+        windows = np.lib.stride_tricks.sliding_window_view(buf, LINE_LENGTH)
+        if fixed.all():
+            out, ok = _parse_fixed(windows[starts])
+        else:
+            out[fixed], ok[fixed] = _parse_fixed(windows[starts[fixed]])
+
+    # everything else the slow way
+    for i in np.flatnonzero(~ok):
+        fields = parse_line(data[starts[i]:stops[i]])
+        if fields is None:
+            continue
+        try:
+            out[i] = fields
+        except (OverflowError, ValueError):
+            continue
+        ok[i] = True
+    return out[ok]
+
+
+def parse_lines(lines):
+    """
+    Parse trigger lines. Invalid lines are dropped.
+
+    :param lines: lines from the DAQ card
+    :type lines: list of bytes
+    :returns: numpy.ndarray -- structured array of TRIGGER_DTYPE
+    """
+    return parse_block(b"\n".join(line.rstrip(b"\r\n") for line in lines))
+
+
+def iter_file(f, block_size=1 << 22):
+    """
+    Parse a raw DAQ file block by block.
+
+    :param f: file opened in binary mode
+    :param block_size: number of bytes to read at once
+    :type block_size: int
+    :returns: generator of numpy.ndarray -- structured arrays of
+              TRIGGER_DTYPE
+    """
+    pending = b""
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+        block = pending + block
+        end = block.rfind(b"\n") + 1
+        block, pending = block[:end], block[end:]
+        if block:
+            yield parse_block(block)
+    if pending:
+        yield parse_block(pending)
+
+
+def gps_seconds(lines):
+    """
+    GPS time of the lines in seconds since day start, corrected.
+
+    :param lines: parsed lines
+    :type lines: numpy.ndarray of TRIGGER_DTYPE
+    :returns: numpy.ndarray of float
+    """
+    return lines["gps_time"] + lines["correction"] / 1000.0
@@ -11,10 +11,18 @@ class CountRecord():
     :param counts_ch[X] (int): Counts in channel X
     :param counts_trigger (int): trigger counts recieved
     :param counts_time (Real): the time of the record
+    :param delta_time (Real): host time in seconds since the previous poll
+                              of the scalars, None if unknown
     """
 
-    def __init__(self, msg):
-        self.msg_bak = msg
+    # msg_bak is only set on records loaded from old files, which stored a
+    # copy of the raw message
+    __slots__ = ("valid", "delta_time", "counts_ch0", "counts_ch1",
+                 "counts_ch2", "counts_ch3", "counts_trigger", "counters_time",
+                 "msg_bak")
+
+    def __init__(self, msg, delta_time=None):
+        self.delta_time = delta_time
         if msg != None:
             counter_from_msg = msg.split()
             self.valid = True
@@ -46,9 +54,8 @@ class CountRecord():
             return ""
         try:
             return f"ch0: {self.counts_ch0} ch1: {self.counts_ch1} ch2: {self.counts_ch2} ch3: {self.counts_ch3} trigger: {self.counts_trigger} time: {self.counters_time}"
-        except:
-            print(f"__repr__ error msg was: {self.msg_bak}")
-            raise IOError
+        except AttributeError:
+            raise IOError("Incomplete counter record")
 
     __str__ = __repr__
 
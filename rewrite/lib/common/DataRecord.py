@@ -4,7 +4,7 @@ class DataRecord():
     Record to hold a DataRecords from the DAQ card. Basically just a string wrapper.
     """
 
-    msg = ""
+    __slots__ = ("msg",)
 
     def __init__(self, msg):
         self.msg = msg
@@ -1,4 +1,7 @@
 class GPSRecord():
+    __slots__ = ("GPSDateTime", "Status", "PosFix", "Latitude", "Longitude",
+                 "Altitude", "NSats", "PPSDelay", "FPGATime", "ChkSumErr")
+
     def __init__(self, GPSDateTime, Status, PosFix, Latitude, Longitude, Altitude, NSats, PPSDelay, FPGATime, ChkSumErr):
 
         self.GPSDateTime = GPSDateTime.decode('utf-8')
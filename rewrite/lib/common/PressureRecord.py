@@ -21,8 +21,10 @@ class PressureRecord():
     :param pressure_type (PressureType): Either mBar or plain data
     """
 
+    # msg_bak is only set on records loaded from old files
+    __slots__ = ("valid", "pressure", "pressure_type", "msg_bak")
+
     def __init__(self, msg):
-        self.msg_bak = msg
         if msg != None:
             counter_from_msg = msg.split()
             self.valid = True
@@ -0,0 +1,51 @@
+import numpy as np
+
+# one row per pulse, as returned by PulseExtractor.extract_many
+PULSE_DTYPE = np.dtype([
+    ("event_id", np.int64),
+    ("channel", np.uint8),
+    ("rising", np.float64),  # nsec
+    ("falling", np.float64),  # nsec
+    ("event_time", np.int64),  # nsec since the epoch (UTC)
+])
+
+
+class PulseRecord():
+    """
+    Holds the pulses of a batch of events extracted from DATA records
+
+    :param pulses: pulses sorted by event, channel and rising edge
+    :type pulses: numpy.ndarray of PULSE_DTYPE
+    :param first_event: id of the first event of the batch
+    :type first_event: int
+    :param events: number of events in the batch, including the events
+                   without pulses
+    :type events: int
+    """
+
+    __slots__ = ("pulses", "first_event", "events")
+
+    def __init__(self, pulses, first_event, events):
+        self.pulses = pulses
+        self.first_event = first_event
+        self.events = events
+
+    def channel_pulses(self):
+        """
+        The pulses of every event of the batch in the format of
+        PulseExtractor.extract, without the time.
+
+        :returns: list of list -- for every event a list of (rising,
+                  falling) tuples for each of the four channels
+        """
+        events = [[[] for _ in range(4)] for _ in range(self.events)]
+        for event_id, channel, rising, falling, _ in self.pulses.tolist():
+            events[event_id - self.first_event][channel].append(
+                (rising, falling))
+        return events
+
+    def __repr__(self):
+        return "%d pulses in events %d to %d" % (
+            len(self.pulses), self.first_event,
+            self.first_event + self.events - 1)
+    __str__ = __repr__
@@ -12,6 +12,7 @@ class RecordType(IntEnum):
     PRESSURE = 3
     COUNTER = 4
     GPS = 5
+    PULSES = 6
 
 
 class Record(object):
@@ -26,6 +27,8 @@ class Record(object):
     :param payload: Payload to be send
     """
 
+    __slots__ = ("packageNumber", "type", "timestamp", "payload")
+
     def __init__(self, packageNumber, RecType, timestamp, payload):
         self.packageNumber = packageNumber
         self.type = RecType
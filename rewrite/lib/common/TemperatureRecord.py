@@ -10,8 +10,10 @@ class TemperatureRecord():
     :param temperature (Real): The temperature of the record.
     """
 
+    # msg_bak is only set on records loaded from old files
+    __slots__ = ("valid", "temperature", "msg_bak")
+
     def __init__(self, msg):
-        self.msg_bak = msg
         if msg != None:
             counter_from_msg = msg.split()
             self.valid = True
@@ -0,0 +1,397 @@
+"""
+Compact binary encoding of Records for the zeromq record stream.
+
+Every message starts with a fixed header::
+
+    magic (3 bytes) | version (u8) | record type (u8) | package number (i64) | timestamp (f64)
+
+followed by a payload layout that depends on the record type. All numbers
+are little endian. Records that were encoded with jsonpickle (e.g. files
+written by older versions of muonic) are still understood by decode_record.
+
+Several DATA records can be packed into one batch message::
+
+    magic (3 bytes) | version (u8) | base package number (i64) | count (u32)
+    | count timestamps (f64) | count line lengths (u16) | lines
+
+The records of a batch have consecutive package numbers starting at the base
+package number. decode_records unpacks single records and batches alike.
+
+Version 2 added the poll interval (delta_time) to COUNTER records. Messages
+of version 1 are still decoded.
+
+PULSES records carry the first event id and the number of events (i64, u32)
+followed by the rows of the pulse array, see PulseRecord.PULSE_DTYPE.
+"""
+import math
+import struct
+
+import jsonpickle
+import numpy as np
+
+from .Record import Record, RecordType
+from .DataRecord import DataRecord
+from .CountRecord import CountRecord
+from .TemperatureRecord import TemperatureRecord
+from .PressureRecord import PressureRecord, PressureType
+from .GPSRecord import GPSRecord
+from .PulseRecord import PulseRecord, PULSE_DTYPE
+
+MAGIC = b"\x93MU"
+BATCH_MAGIC = b"\x93MB"
+FORMAT_VERSION = 2
+# versions decode_record understands
+SUPPORTED_VERSIONS = (1, 2)
+
+HEADER = struct.Struct("<3sBBqd")
+BATCH_HEADER = struct.Struct("<3sBqI")
+# valid, counts present, ch0, ch1, ch2, ch3, trigger, counters time
+COUNTER_V1 = struct.Struct("<??5Id")
+# as version 1, followed by the poll interval (NaN if unknown)
+COUNTER = struct.Struct("<??5Idd")
+# valid, temperature
+TEMPERATURE = struct.Struct("<?d")
+# valid, pressure type (-1 if unknown), followed by the pressure as text
+PRESSURE = struct.Struct("<?b")
+STRING_LENGTH = struct.Struct("<H")
+# first event, number of events, followed by the pulses
+PULSES = struct.Struct("<qI")
+PULSE_WIRE_DTYPE = PULSE_DTYPE.newbyteorder("<")
+
+# record type used in the header if the type of a record is unknown
+NO_TYPE = 0xFF
+# package number used in the header if a record has none
+NO_PACKAGE_NUMBER = -1
+
+GPS_FIELDS = ("GPSDateTime", "Status", "PosFix", "Latitude", "Longitude",
+              "Altitude", "NSats", "PPSDelay", "FPGATime", "ChkSumErr")
+
+
+class WireFormatError(ValueError):
+    """
+    Raised if a message cannot be decoded.
+    """
+    pass
+
+
+def _new(cls, **attributes):
+    """
+    Create a payload object without parsing a DAQ message.
+    """
+    obj = cls.__new__(cls)
+    for name, value in attributes.items():
+        setattr(obj, name, value)
+    return obj
+
+
+def _pack_strings(values):
+    out = []
+    for value in values:
+        data = str(value).encode("utf-8")
+        out.append(STRING_LENGTH.pack(len(data)))
+        out.append(data)
+    return b"".join(out)
+
+
+def _unpack_strings(data, offset, count):
+    values = []
+    for _ in range(count):
+        length = STRING_LENGTH.unpack_from(data, offset)[0]
+        offset += STRING_LENGTH.size
+        values.append(bytes(data[offset:offset + length]).decode("utf-8"))
+        offset += length
+    return values, offset
+
+
+def _encode_counter(payload):
+    try:
+        counts = (payload.counts_ch0, payload.counts_ch1, payload.counts_ch2,
+                  payload.counts_ch3, payload.counts_trigger)
+        counters_time = float(payload.counters_time)
+        present = True
+    except (AttributeError, TypeError):
+        counts = (0, 0, 0, 0, 0)
+        counters_time = 0.0
+        present = False
+    delta_time = getattr(payload, "delta_time", None)
+    delta_time = math.nan if delta_time is None else float(delta_time)
+    return COUNTER.pack(bool(payload.valid), present, *counts, counters_time,
+                        delta_time)
+
+
+def _decode_counter(data, offset, version):
+    if version == 1:
+        (valid, present, ch0, ch1, ch2, ch3, trigger,
+         counters_time) = COUNTER_V1.unpack_from(data, offset)
+        delta_time = None
+    else:
+        (valid, present, ch0, ch1, ch2, ch3, trigger, counters_time,
+         delta_time) = COUNTER.unpack_from(data, offset)
+        delta_time = None if math.isnan(delta_time) else delta_time
+    if not present:
+        return _new(CountRecord, valid=valid, delta_time=delta_time)
+    return _new(CountRecord, valid=valid, counts_ch0=ch0, counts_ch1=ch1,
+                counts_ch2=ch2, counts_ch3=ch3, counts_trigger=trigger,
+                counters_time=counters_time, delta_time=delta_time)
+
+
+def _encode_temperature(payload):
+    temperature = getattr(payload, "temperature", None)
+    temperature = math.nan if temperature is None else float(temperature)
+    return TEMPERATURE.pack(bool(payload.valid), temperature)
+
+
+def _decode_temperature(data, offset, version):
+    valid, temperature = TEMPERATURE.unpack_from(data, offset)
+    if math.isnan(temperature):
+        return _new(TemperatureRecord, valid=valid)
+    return _new(TemperatureRecord, valid=valid, temperature=temperature)
+
+
+def _encode_pressure(payload):
+    pressure_type = getattr(payload, "pressure_type", None)
+    pressure_type = -1 if pressure_type is None else pressure_type.value
+    pressure = getattr(payload, "pressure", None)
+    pressure = b"" if pressure is None else str(pressure).encode("utf-8")
+    return PRESSURE.pack(bool(payload.valid), pressure_type) + pressure
+
+
+def _decode_pressure(data, offset, version):
+    valid, pressure_type = PRESSURE.unpack_from(data, offset)
+    if pressure_type < 0:
+        return _new(PressureRecord, valid=valid)
+    pressure = bytes(data[offset + PRESSURE.size:]).decode("utf-8")
+    return _new(PressureRecord, valid=valid, pressure=pressure,
+                pressure_type=PressureType(pressure_type))
+
+
+def _encode_gps(payload):
+    return _pack_strings(getattr(payload, field) for field in GPS_FIELDS)
+
+
+def _decode_gps(data, offset, version):
+    values, _ = _unpack_strings(data, offset, len(GPS_FIELDS))
+    obj = GPSRecord.__new__(GPSRecord)
+    for field, value in zip(GPS_FIELDS, values):
+        setattr(obj, field, value)
+    return obj
+
+
+def _encode_data(payload):
+    return payload.msg.encode("utf-8")
+
+
+def _decode_data(data, offset, version):
+    obj = DataRecord.__new__(DataRecord)
+    obj.msg = bytes(data[offset:]).decode("utf-8")
+    return obj
+
+
+def _encode_pulses(payload):
+    pulses = np.asarray(payload.pulses, dtype=PULSE_WIRE_DTYPE)
+    return PULSES.pack(payload.first_event, payload.events) + pulses.tobytes()
+
+
+def _decode_pulses(data, offset, version):
+    first_event, events = PULSES.unpack_from(data, offset)
+    # astype copies, so the pulses are writable and in native byte order
+    pulses = np.frombuffer(data, dtype=PULSE_WIRE_DTYPE,
+                           offset=offset + PULSES.size).astype(PULSE_DTYPE)
+    return PulseRecord(pulses, first_event, events)
+
+
+# record type -> (payload class, encoder, decoder)
+PAYLOADS = {
+    RecordType.DATA: (DataRecord, _encode_data, _decode_data),
+    RecordType.COUNTER: (CountRecord, _encode_counter, _decode_counter),
+    RecordType.TEMPERATURE: (TemperatureRecord, _encode_temperature,
+                             _decode_temperature),
+    RecordType.PRESSURE: (PressureRecord, _encode_pressure, _decode_pressure),
+    RecordType.GPS: (GPSRecord, _encode_gps, _decode_gps),
+    RecordType.PULSES: (PulseRecord, _encode_pulses, _decode_pulses),
+}
+
+# payload kinds, stored in the byte after the header
+PAYLOAD_NONE = 0
+PAYLOAD_NATIVE = 1
+PAYLOAD_JSON = 2
+
+
+def encode_record(rec):
+    """
+    Encode a Record into the binary wire format.
+
+    Payloads which have no binary layout for the record type (e.g. CONTROL
+    records) are embedded as jsonpickle text.
+
+    :param rec: the record to encode
+    :type rec: Record
+    :returns: bytes
+    """
+    rec_type = NO_TYPE if rec.type is None else int(rec.type)
+    package_number = (NO_PACKAGE_NUMBER if rec.packageNumber is None
+                      else rec.packageNumber)
+    timestamp = math.nan if rec.timestamp is None else rec.timestamp
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, rec_type, package_number,
+                         timestamp)
+
+    payload = rec.payload
+    if payload is None:
+        return header + bytes((PAYLOAD_NONE,))
+    layout = PAYLOADS.get(rec.type)
+    if layout is not None and isinstance(payload, layout[0]):
+        return header + bytes((PAYLOAD_NATIVE,)) + layout[1](payload)
+    return (header + bytes((PAYLOAD_JSON,)) +
+            jsonpickle.encode(payload).encode("utf-8"))
+
+
+def encode_data_batch(base_package_number, timestamps, lines):
+    """
+    Pack several DATA records into one message.
+
+    :param base_package_number: package number of the first line
+    :type base_package_number: int
+    :param timestamps: unix timestamp of each line
+    :type timestamps: list of float
+    :param lines: the messages from the DAQ card
+    :type lines: list of str
+    :returns: bytes
+    """
+    encoded = [line.encode("utf-8") for line in lines]
+    count = len(encoded)
+    return b"".join([
+        BATCH_HEADER.pack(BATCH_MAGIC, FORMAT_VERSION, base_package_number,
+                          count),
+        struct.pack(f"<{count}d", *timestamps),
+        struct.pack(f"<{count}H", *map(len, encoded)),
+    ] + encoded)
+
+
+def decode_data_batch(data):
+    """
+    Unpack a message created by encode_data_batch.
+
+    Raises WireFormatError if the message uses an unknown format version.
+
+    :param data: the message
+    :type data: bytes
+    :raises: WireFormatError
+    :returns: tuple -- base package number, list of timestamps, list of lines
+    """
+    _, version, base, count = BATCH_HEADER.unpack_from(data, 0)
+    if version not in SUPPORTED_VERSIONS:
+        raise WireFormatError(f"Unknown wire format version {version}")
+    offset = BATCH_HEADER.size
+    timestamps = struct.unpack_from(f"<{count}d", data, offset)
+    offset += 8 * count
+    lengths = struct.unpack_from(f"<{count}H", data, offset)
+    offset += 2 * count
+    lines = []
+    for length in lengths:
+        lines.append(bytes(data[offset:offset + length]).decode("utf-8"))
+        offset += length
+    return base, list(timestamps), lines
+
+
+def is_binary(data):
+    """
+    Check if a message is a single record in the binary wire format.
+
+    :param data: the message
+    :type data: bytes or str
+    :returns: bool
+    """
+    return isinstance(data, (bytes, bytearray, memoryview)) and \
+        bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def is_batch(data):
+    """
+    Check if a message is a batch of DATA records.
+
+    :param data: the message
+    :type data: bytes or str
+    :returns: bool
+    """
+    return isinstance(data, (bytes, bytearray, memoryview)) and \
+        bytes(data[:len(BATCH_MAGIC)]) == BATCH_MAGIC
+
+
+def decode_record(data):
+    """
+    Decode a message into a Record. Accepts the binary wire format as well as
+    jsonpickle text (as bytes or str).
+
+    Raises WireFormatError if the message uses an unknown format version or
+    is a batch (use decode_records for those).
+
+    :param data: the message
+    :type data: bytes or str
+    :raises: WireFormatError
+    :returns: Record
+    """
+    if is_batch(data):
+        raise WireFormatError("Message is a batch, use decode_records")
+    if not is_binary(data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        return jsonpickle.decode(data)
+
+    _, version, rec_type, package_number, timestamp = \
+        HEADER.unpack_from(data, 0)
+    if version not in SUPPORTED_VERSIONS:
+        raise WireFormatError(f"Unknown wire format version {version}")
+    rec_type = None if rec_type == NO_TYPE else RecordType(rec_type)
+    package_number = (None if package_number == NO_PACKAGE_NUMBER
+                      else package_number)
+    timestamp = None if math.isnan(timestamp) else timestamp
+
+    offset = HEADER.size + 1
+    kind = data[HEADER.size]
+    if kind == PAYLOAD_NONE:
+        payload = None
+    elif kind == PAYLOAD_NATIVE:
+        payload = PAYLOADS[rec_type][2](data, offset, version)
+    elif kind == PAYLOAD_JSON:
+        payload = jsonpickle.decode(bytes(data[offset:]).decode("utf-8"))
+    else:
+        raise WireFormatError(f"Unknown payload kind {kind}")
+    return Record(package_number, rec_type, timestamp, payload)
+
+
+def decode_records(data):
+    """
+    Decode a message into a list of Records. Batches are unpacked into one
+    DATA record per line, everything else gives a list with one record.
+
+    :param data: the message
+    :type data: bytes or str
+    :returns: list of Record
+    """
+    if not is_batch(data):
+        return [decode_record(data)]
+    base, timestamps, lines = decode_data_batch(data)
+    records = []
+    for i, (timestamp, line) in enumerate(zip(timestamps, lines)):
+        payload = DataRecord.__new__(DataRecord)
+        payload.msg = line
+        records.append(Record(base + i, RecordType.DATA, timestamp, payload))
+    return records
+
+
+def as_text(data):
+    """
+    Convert a message into jsonpickle lines as they are stored in files.
+    Batches give one line per record, separated by newlines.
+
+    :param data: the message
+    :type data: bytes or str
+    :returns: str
+    """
+    if is_batch(data):
+        return "\n".join(jsonpickle.encode(rec) for rec in decode_records(data))
+    if is_binary(data):
+        return jsonpickle.encode(decode_record(data))
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return bytes(data).decode("utf-8")
+    return data
@@ -0,0 +1,621 @@
+"""
+asyncio implementation of the DAQ server
+"""
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from time import monotonic, time
+
+import zmq
+import zmq.asyncio
+
+from ..common.Record import Record, RecordType
+from ..common.CountRecord import CountRecord
+from ..common.TemperatureRecord import TemperatureRecord
+from ..common.PressureRecord import PressureRecord, PressureType
+from ..common.GPSRecord import GPSRecord
+from ..common.WireFormat import encode_record, encode_data_batch
+from ..utils.Stream import topic
+from ..utils.Control import (CONTROL_BIND_ADDRESS, CONTROL_METHODS,
+                             decode_request, encode_reply, error_message)
+from .CommandEngine import PendingCommand, spec_for
+from .Connection import (DAQConnection, ReadStatistics, LatencyStatistics,
+                         split_lines)
+from .DAQConfig import DAQConfiguration, channel_register
+from .DAQServer import record_for_line
+from .Exceptions import DAQTimeoutError
+from .Provider import DAQProvider
+
+
+class AsyncCommandEngine(object):
+    """
+    asyncio counterpart of CommandEngine. Lines are offered by the serial
+    reader of the event loop, callers await the response.
+
+    :param write: coroutine function sending a command to the card
+    :type write: callable
+    """
+
+    def __init__(self, write):
+        self.write = write
+        # list of (PendingCommand, future)
+        self.pending = []
+
+    def offer(self, line, received=None, received_monotonic=None):
+        """
+        Pass a line from the DAQ card to the oldest command it belongs to.
+
+        :param line: line from the DAQ card
+        :type line: str
+        :returns: str or None -- see CommandEngine.offer
+        """
+        for entry in self.pending:
+            pending, future = entry
+            claimed = pending.feed(line, received, received_monotonic)
+            if claimed is not None:
+                if pending.done.is_set():
+                    self.pending.remove(entry)
+                    if not future.done():
+                        future.set_result(pending)
+                return claimed
+        return None
+
+    async def query(self, command, timeout=2.0, passthrough=True):
+        """
+        Send a command and wait for its response.
+
+        Raises DAQTimeoutError if the card does not answer in time.
+
+        :param command: command for the DAQ card
+        :type command: str
+        :param timeout: maximum time to wait in seconds
+        :type timeout: float
+        :param passthrough: if False, the response is not treated as data
+        :type passthrough: bool
+        :returns: PendingCommand
+        :raises: DAQTimeoutError
+        """
+        entry = (PendingCommand(command, spec_for(command), passthrough),
+                 asyncio.get_running_loop().create_future())
+        self.pending.append(entry)
+        await self.write(command)
+        try:
+            return await asyncio.wait_for(entry[1], timeout)
+        except asyncio.TimeoutError:
+            if entry in self.pending:
+                self.pending.remove(entry)
+            raise DAQTimeoutError(
+                f"No response to '{command}' within {timeout} s")
+
+    async def execute(self, command, timeout=2.0):
+        """
+        Send a command and return the response lines.
+
+        :raises: DAQTimeoutError
+        :returns: list of str
+        """
+        return (await self.query(command, timeout)).response
+
+
+class AsyncDAQServer(object):
+    """
+    DAQ server running serial I/O, publishing, polling and the control
+    endpoint in a single asyncio event loop.
+
+    The serial port is watched with loop.add_reader, so the server sleeps
+    while the card is silent. The blocking reads and writes of the port run
+    in a reader and a writer thread, everything else in the event loop.
+    Records are published on a zmq.asyncio PUB socket with the same topics
+    and wire format as DAQServer. The control endpoint is a ROUTER socket
+    speaking the protocol of lib.utils.Control. Every request runs in its
+    own task, so a slow command does not block other clients.
+
+    Needs an event loop with add_reader support for the serial port (i.e.
+    not the Windows proactor loop).
+
+    :param publish_address: address of the PUB socket
+    :type publish_address: str
+    :param control_address: address of the control endpoint
+    :type control_address: str
+    :param batch_size: if set, the DATA lines of every read are published as
+                       batches of up to batch_size lines
+    :type batch_size: int
+    :param serial_port: an already opened serial port, mostly for testing
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    # maximum time to wait for the DAQ card to answer a command
+    COMMAND_TIMEOUT = 2.0  # seconds
+
+    # methods callable through the control endpoint, the same as for the
+    # ControlServer
+    CONTROL_METHODS = CONTROL_METHODS
+
+    def __init__(self, publish_address="tcp://*:1234",
+                 control_address=CONTROL_BIND_ADDRESS, batch_size=None,
+                 serial_port=None, logger=None):
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        self.publish_address = publish_address
+        self.control_address = control_address
+        self.batch_size = batch_size
+        self.connection = DAQConnection(None, None, self.logger,
+                                        serial_port=serial_port)
+        self.commands = AsyncCommandEngine(self.write)
+        self.config = DAQConfiguration()
+        self.statistics = ReadStatistics(self.logger)
+        self.latency = LatencyStatistics(self.logger)
+        self.package_number = 0
+        self.running = False
+        self.context = None
+        self.socket = None
+        self.control = None
+        self._pending = b""
+        self._lines = None
+        self._stopped = None
+        self._poll_task = None
+        self._tasks = set()
+        # a single thread each keeps the reads and the writes of the port
+        # in order
+        self._reader = None
+        self._writer = None
+
+    @property
+    def serial_port(self):
+        return self.connection.serial_port
+
+    def bound_addresses(self):
+        """
+        Addresses the sockets are bound to, useful if they were bound to a
+        random port ('tcp://127.0.0.1:*').
+
+        :returns: tuple -- publish address, control address
+        """
+        return (self.socket.getsockopt(zmq.LAST_ENDPOINT).decode("ascii"),
+                self.control.getsockopt(zmq.LAST_ENDPOINT).decode("ascii"))
+
+    async def start(self):
+        """
+        Bind the sockets, start watching the serial port and the control
+        endpoint and bring the card into its idle state.
+
+        :returns: None
+        """
+        loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._lines = asyncio.Queue()
+        self._reader = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix="DAQ reader")
+        self._writer = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix="DAQ writer")
+        self.context = zmq.asyncio.Context()
+        self.socket = self.context.socket(zmq.PUB)
+        self.socket.bind(self.publish_address)
+        self.control = self.context.socket(zmq.ROUTER)
+        self.control.bind(self.control_address)
+        loop.add_reader(self.serial_port.fileno(), self._on_readable)
+        self._spawn(self._process_incoming())
+        self._spawn(self._serve_control())
+        # disable data flow and status messages for startup
+        await self.stop_reading_data()
+        await self.do('ST 0')
+
+    async def serve(self):
+        """
+        Run the server until shutdown() is called.
+
+        :returns: None
+        """
+        await self.start()
+        await self._stopped.wait()
+        await self.close()
+
+    def shutdown(self):
+        """
+        Make serve() return.
+
+        :returns: None
+        """
+        self._stopped.set()
+
+    async def close(self):
+        """
+        Stop all tasks and close the sockets.
+
+        :returns: None
+        """
+        asyncio.get_running_loop().remove_reader(self.serial_port.fileno())
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._reader.shutdown()
+        self._writer.shutdown()
+        self.socket.close(linger=0)
+        self.control.close(linger=0)
+        self.context.term()
+
+    def _spawn(self, coroutine):
+        """
+        Run a coroutine as task which is cancelled on close().
+        """
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # serial I/O
+
+    async def write(self, command):
+        """
+        Send a command to the card. The blocking write runs in the writer
+        thread, so it does not stall the event loop.
+
+        :param command: command for the DAQ card
+        :type command: str
+        :returns: None
+        """
+        await asyncio.get_running_loop().run_in_executor(
+            self._writer, self.serial_port.write,
+            (str(command) + "\r").encode("ascii"))
+
+    def _on_readable(self):
+        """
+        Stop watching the port until the waiting data is read.
+        """
+        asyncio.get_running_loop().remove_reader(self.serial_port.fileno())
+        self._spawn(self._read())
+
+    def _read_chunk(self):
+        """
+        Read everything waiting on the port. Runs in the reader thread.
+        """
+        waiting = self.serial_port.in_waiting
+        return self.serial_port.read(
+            min(max(waiting, 1), DAQConnection.MAX_CHUNK_SIZE))
+
+    async def _read(self):
+        """
+        Read the waiting data in the reader thread, queue the complete lines
+        and watch the port again.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            chunk = await loop.run_in_executor(self._reader,
+                                               self._read_chunk)
+        except OSError as e:
+            self.logger.error(f"Reading from the DAQ card failed: {e}")
+            self._spawn(self._reconnect())
+            return
+        received, received_monotonic = time(), monotonic()
+        lines, self._pending = split_lines(self._pending, chunk)
+        self.statistics.add(len(chunk), len(lines))
+        self.statistics.report()
+        if lines:
+            self._lines.put_nowait((lines, received, received_monotonic))
+        loop.add_reader(self.serial_port.fileno(), self._on_readable)
+
+    async def _reconnect(self):
+        loop = asyncio.get_running_loop()
+        self.serial_port.close()
+        self._pending = b""
+        self.connection.serial_port = await loop.run_in_executor(
+            None, self.connection.get_serial_port)
+        loop.add_reader(self.serial_port.fileno(), self._on_readable)
+
+    async def _process_incoming(self):
+        """
+        Handle the reads in the order they arrived.
+        """
+        while True:
+            await self._handle_lines(*(await self._lines.get()))
+
+    async def _handle_lines(self, lines, received, received_monotonic):
+        """
+        Route the lines of one read to waiting commands and publish them.
+        DATA lines waiting for their batch are sent before any other record,
+        so the records keep the order of the lines like in DAQServer.
+        """
+        data = []
+        for line in lines:
+            # the same check as DAQProvider.validate_line
+            try:
+                msg = line.decode("ascii")
+                valid = DAQProvider.LINE_PATTERN.match(msg) is not None
+            except UnicodeDecodeError:
+                valid = False
+            if not valid:
+                self.logger.warning(f"Got invalid data from the DAQ card: {line}")
+                continue
+            claimed = self.commands.offer(msg, received, received_monotonic)
+            if claimed not in (None, "response"):
+                continue
+            record = record_for_line(msg)
+            if record is None:
+                continue
+            rec_type, payload = record
+            if rec_type == RecordType.DATA and self.batch_size:
+                data.append(msg)
+                if len(data) >= self.batch_size:
+                    await self._send_data(data, received,
+                                          received_monotonic)
+                    data = []
+                continue
+            if data:
+                await self._send_data(data, received, received_monotonic)
+                data = []
+            await self.publish(rec_type, payload, received,
+                               received_monotonic)
+        if data:
+            await self._send_data(data, received, received_monotonic)
+        self.latency.report()
+
+    async def _send_data(self, data, received, received_monotonic):
+        """
+        Publish DATA lines of one read as one batch.
+        """
+        await self.socket.send_multipart([
+            topic(RecordType.DATA),
+            encode_data_batch(self.package_number, [received] * len(data),
+                              data)])
+        self.package_number += len(data)
+        for _ in data:
+            self.latency.add(monotonic() - received_monotonic)
+
+    # publishing
+
+    async def publish(self, rec_type, payload, timestamp=None,
+                      received_monotonic=None):
+        """
+        Wrap a payload into a Record with the next package number and send it
+        to all subscribers.
+
+        :param rec_type: type of the record
+        :type rec_type: RecordType
+        :param payload: payload of the record
+        :param timestamp: unix timestamp of the record, defaults to now
+        :type timestamp: float
+        :param received_monotonic: monotonic time the underlying line was
+                                   read from the port
+        :type received_monotonic: float
+        :returns: Record -- the published record
+        """
+        if timestamp is None:
+            timestamp = datetime.now().timestamp()
+        rec = Record(self.package_number, rec_type, timestamp, payload)
+        self.package_number += 1
+        await self.socket.send_multipart([topic(rec_type), encode_record(rec)])
+        if received_monotonic is not None:
+            self.latency.add(monotonic() - received_monotonic)
+        return rec
+
+    # control endpoint
+
+    async def _serve_control(self):
+        while True:
+            frames = await self.control.recv_multipart()
+            self._spawn(self._handle_request(frames))
+
+    async def _handle_request(self, frames):
+        """
+        Call the requested method and send the reply. The routing frames
+        are sent back unchanged, so REQ and DEALER clients both work.
+        """
+        request_id = None
+        try:
+            request_id, method, params = decode_request(frames[-1])
+            if method not in self.CONTROL_METHODS:
+                raise AttributeError(f"Unknown method '{method}'")
+            result = await getattr(self, method)(*params)
+            reply = encode_reply(request_id, result)
+        except Exception as e:
+            self.logger.debug(f"Control request failed: {e}")
+            reply = encode_reply(request_id, error=error_message(e))
+        await self.control.send_multipart(frames[:-1] + [reply])
+
+    # DAQ API, same as DAQServer
+
+    async def do(self, msg, timeout=None):
+        """
+        Send a command to the DAQ card and wait until the card has answered.
+
+        :param msg: command for the DAQ card
+        :type msg: str
+        :param timeout: maximum time to wait, defaults to COMMAND_TIMEOUT
+        :type timeout: float
+        :returns: list of str -- the response lines, empty for commands which
+                  are only echoed or if the card did not answer in time
+        """
+        if timeout is None:
+            timeout = self.COMMAND_TIMEOUT
+        try:
+            response = await self.commands.execute(msg, timeout)
+        except DAQTimeoutError as e:
+            self.logger.warning(str(e))
+            return []
+        self.config.update_from_command(msg)
+        for line in response:
+            self.config.update_from_response(line)
+        return response
+
+    async def _query(self, command):
+        try:
+            return await self.commands.query(command, self.COMMAND_TIMEOUT,
+                                             passthrough=False)
+        except DAQTimeoutError as e:
+            self.logger.warning(str(e))
+            return None
+
+    async def reset_scalars(self):
+        """
+        Reset the scalars of all channels.
+        """
+        await self.do('RB')
+
+    async def start_reading_data(self):
+        """
+        Start receiving data from the DAQ card.
+        """
+        self.running = True
+        await self.do('CE')
+
+    async def stop_reading_data(self):
+        """
+        Stop receiving data from the DAQ card.
+        """
+        await self.do('CD')
+        self.running = False
+
+    async def setRunning(self, isRunning):
+        self.running = isRunning
+
+    async def clear_queues(self):
+        """
+        Nothing to do, the asyncio server does not queue lines.
+        """
+        pass
+
+    async def read_scalars(self):
+        """
+        Read the scalars and publish them as COUNTER record.
+
+        :returns: list -- ch0, ch1, ch2, ch3, trigger or None
+        """
+        reply = await self._query('DS')
+        if reply is None:
+            return None
+        cntRec = CountRecord(reply.response[0])
+        await self.publish(RecordType.COUNTER, cntRec, reply.received,
+                           reply.received_monotonic)
+        return [cntRec.counts_ch0, cntRec.counts_ch1, cntRec.counts_ch2,
+                cntRec.counts_ch3, cntRec.counts_trigger]
+
+    async def refresh_config(self):
+        """
+        Read the channel settings and thresholds back from the DAQ card.
+        """
+        self.config.invalidate()
+        await self.do('DC')
+        await self.do('TL')
+
+    async def apply_config(self, registers=None, thresholds=None):
+        """
+        Write the registers and thresholds which differ from the last known
+        configuration (see DAQServer.apply_config).
+
+        :returns: list of str -- the commands sent to the card
+        """
+        if not self.config.known:
+            await self.refresh_config()
+        commands = self.config.commands_for(registers, thresholds)
+        for command in commands:
+            await self.do(command)
+        if any(command.startswith('WC') for command in commands):
+            await self.do('DC')
+        if any(command.startswith('TL') for command in commands):
+            await self.do('TL')
+        return commands
+
+    async def write_register(self, register, value):
+        """
+        Write a control register of the DAQ card if its value changed.
+        """
+        await self.apply_config(registers={register: value})
+
+    async def setup_channel(self, ch0=False, ch1=False, ch2=False, ch3=False,
+                            coincidence='single'):
+        """
+        Enable/Disable channels of the DAQ card and set coincidence settings.
+        """
+        await self.apply_config(registers={
+            0: channel_register(ch0, ch1, ch2, ch3, coincidence)})
+
+    async def set_threashold(self, th_0=300, th_1=300, th_2=300, th_3=300):
+        """
+        Set the threasholds for the channels of the DAQ card.
+        """
+        await self.apply_config(thresholds=[int(th_0), int(th_1), int(th_2),
+                                            int(th_3)])
+
+    async def get_temp_and_pressure(self):
+        """
+        Read temperature and pressure and publish them.
+
+        :returns: list -- temperature, pressure, pressure in mBar, -999.0 for
+                  values which could not be read
+        """
+        temperature = pressure = pressure_mbar = -999.0
+        reply = await self._query('TH')
+        if reply is not None:
+            tmpRec = TemperatureRecord(reply.response[0])
+            await self.publish(RecordType.TEMPERATURE, tmpRec, reply.received,
+                               reply.received_monotonic)
+            if tmpRec.valid:
+                temperature = tmpRec.temperature
+        reply = await self._query('BA')
+        if reply is not None:
+            # pressure in counts and in mBar, skip the calibration message
+            for line in (reply.response[0], reply.response[-1]):
+                presRec = PressureRecord(line)
+                await self.publish(RecordType.PRESSURE, presRec,
+                                   reply.received, reply.received_monotonic)
+                if not hasattr(presRec, "pressure_type"):
+                    continue
+                if presRec.pressure_type == PressureType.MBAR:
+                    pressure_mbar = float(presRec.pressure)
+                else:
+                    pressure = float(presRec.pressure)
+        return [temperature, pressure, pressure_mbar]
+
+    async def get_gps_info(self):
+        """
+        Read the GPS information and publish it.
+        """
+        reply = await self._query('DG')
+        if reply is None or len(reply.response) < 10:
+            self.logger.error("Could not read GPS information.")
+            return
+        gpsRecord = GPSRecord(*[line.encode("ascii")
+                                for line in reply.response])
+        await self.publish(RecordType.GPS, gpsRecord, reply.received,
+                           reply.received_monotonic)
+
+    async def start_polling(self, interval=5.0, environment_every=1):
+        """
+        Publish the scalars every interval seconds and temperature and
+        pressure every environment_every scalar polls (see PollScheduler).
+        """
+        await self.stop_polling()
+        self._poll_task = self._spawn(self._poll(interval, environment_every))
+
+    async def stop_polling(self):
+        """
+        Stop the periodic readout started with start_polling.
+        """
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            await asyncio.gather(self._poll_task, return_exceptions=True)
+            self._poll_task = None
+
+    async def _poll(self, interval, environment_every):
+        start = monotonic()
+        previous_poll = None
+        n = 0
+        while True:
+            reply = await self._query('DS')
+            if reply is not None:
+                delta_time = None
+                if previous_poll is not None:
+                    delta_time = reply.received_monotonic - previous_poll
+                previous_poll = reply.received_monotonic
+                await self.publish(RecordType.COUNTER,
+                                   CountRecord(reply.response[0], delta_time),
+                                   reply.received, reply.received_monotonic)
+            if environment_every and n % environment_every == 0:
+                await self.get_temp_and_pressure()
+            n += 1
+            now = monotonic()
+            n = max(n, int((now - start) / interval) + 1)
+            await asyncio.sleep(start + n * interval - now)
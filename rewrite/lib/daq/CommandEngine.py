@@ -0,0 +1,288 @@
+"""
+Correlation of commands sent to the DAQ card with their responses
+"""
+import logging
+import re
+import threading
+from time import monotonic, time
+
+from .Exceptions import DAQTimeoutError
+
+
+class CommandSpec(object):
+    """
+    Describes the response the DAQ card sends for a command.
+
+    The card echoes every command. A response starts with the first line
+    matching pattern and ends after lines lines or with the first line
+    matching terminator. The following lines have to match continuation,
+    all other lines, e.g. trigger lines arriving in between, are left to
+    the caller. Commands without a pattern are answered by their echo and
+    replies more lines which are no trigger lines.
+
+    :param pattern: regular expression for the first line of the response
+    :type pattern: str
+    :param lines: number of lines of the response
+    :type lines: int
+    :param terminator: regular expression for the last line of the response
+    :type terminator: str
+    :param replies: number of lines following the echo of a command without
+                    pattern
+    :type replies: int
+    :param continuation: regular expression for the lines of the response
+                         after the first one
+    :type continuation: str
+    """
+
+    def __init__(self, pattern=None, lines=1, terminator=None, replies=0,
+                 continuation=None):
+        self.pattern = None if pattern is None else re.compile(pattern)
+        self.lines = lines
+        self.terminator = None if terminator is None else re.compile(terminator)
+        self.replies = replies
+        self.continuation = (None if continuation is None
+                             else re.compile(continuation))
+
+
+# trigger count and first edge byte of a trigger line
+DATA_LINE = re.compile(r"^[0-9A-Fa-f]{8} [0-9A-Fa-f]{2}\b")
+
+
+# commands which are only echoed by the card
+ECHO_ONLY = CommandSpec()
+# commands the card answers with one more line after the echo
+ECHO_AND_REPLY = CommandSpec(replies=1)
+
+# command (first word) -> expected response of the query form
+COMMANDS = {
+    "TL": CommandSpec(r"^TL\s+L0="),
+    "DC": CommandSpec(r"^DC\s+C0="),
+    "TH": CommandSpec(r"^TH.*="),
+    "BA": CommandSpec(r"^BA\s+\S", terminator=r"^mBar",
+                      continuation=r"^(calibrate|mBar)"),
+    "DS": CommandSpec(r"^DS\s+S0="),
+    # Status:, PosFix:, ..., ChkSumErr:
+    "DG": CommandSpec(r"^Date\+Time", lines=10,
+                      continuation=r"^[A-Za-z][A-Za-z ]*:"),
+}
+
+
+def spec_for(command):
+    """
+    Get the response specification for a command. Commands with arguments
+    (e.g. 'TL 0 300') are only echoed, except for 'ST 0' and the register
+    writes ('WC 00 0F'), which are followed by one more line.
+
+    :param command: command sent to the DAQ card
+    :type command: str
+    :returns: CommandSpec
+    """
+    words = command.split()
+    if words == ["ST", "0"] or (words and words[0] == "WC"):
+        return ECHO_AND_REPLY
+    if len(words) != 1:
+        return ECHO_ONLY
+    return COMMANDS.get(words[0], ECHO_ONLY)
+
+
+class PendingCommand(object):
+    """
+    A command waiting for its response.
+
+    :param command: command sent to the DAQ card
+    :type command: str
+    :param spec: expected response
+    :type spec: CommandSpec
+    :param passthrough: if False, the response is only delivered to the
+                        caller and not treated as regular data
+    :type passthrough: bool
+    """
+
+    def __init__(self, command, spec, passthrough=True):
+        self.command = command.strip()
+        self.spec = spec
+        self.passthrough = passthrough
+        self.echoed = False
+        self.response = []
+        # unix and monotonic time when the first response line was read
+        self.received = None
+        self.received_monotonic = None
+        self.done = threading.Event()
+
+    def feed(self, line, received=None, received_monotonic=None):
+        """
+        Offer a line from the DAQ card to the command.
+
+        :param line: line from the DAQ card
+        :type line: str
+        :param received: unix time the line was read, defaults to now
+        :type received: float
+        :param received_monotonic: monotonic time the line was read, defaults
+                                   to now
+        :type received_monotonic: float
+        :returns: str or None -- 'echo' if the line is the echo of the
+                  command, 'response' if it belongs to the response and
+                  'consumed' if it belongs to the response but should not
+                  be passed on
+        """
+        if self.done.is_set():
+            return None
+        if not self.echoed and not self.response and \
+                line.strip() == self.command:
+            self.echoed = True
+            if self.spec.pattern is None and not self.spec.replies:
+                self.done.set()
+            return "echo"
+        if DATA_LINE.match(line):
+            return None
+        if self.spec.pattern is None:
+            if not self.echoed or not self.spec.replies:
+                return None
+            # whatever follows the echo is the reply
+            self._receive(line, received, received_monotonic)
+            if len(self.response) >= self.spec.replies:
+                self.done.set()
+            return "consumed"
+        if not self.response:
+            if not self.spec.pattern.match(line):
+                return None
+        elif self.spec.continuation is not None and \
+                not self.spec.continuation.match(line):
+            return None
+        self._receive(line, received, received_monotonic)
+        if self.spec.terminator is not None:
+            if self.spec.terminator.match(line):
+                self.done.set()
+        elif len(self.response) >= self.spec.lines:
+            self.done.set()
+        return "response" if self.passthrough else "consumed"
+
+    def _receive(self, line, received, received_monotonic):
+        """
+        Add a line to the response, the first one sets the receive time.
+        """
+        if not self.response:
+            self.received = time() if received is None else received
+            self.received_monotonic = (monotonic() if received_monotonic is None
+                                       else received_monotonic)
+        self.response.append(line)
+
+
+class CommandEngine(object):
+    """
+    Sends commands to the DAQ card and routes the lines coming back to the
+    callers waiting for them.
+
+    Lines are offered to the engine with offer(). While nobody does so
+    (i.e. no measurement is running), execute() reads from the client
+    itself, so a command only takes as long as the card needs to answer.
+
+    :param client: connection to the DAQ card
+    :type client: DAQProvider
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    # how long a waiting caller sleeps before checking who reads the card
+    POLL_INTERVAL = 0.05  # seconds
+
+    def __init__(self, client, logger=None):
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        self.client = client
+        self.pending = []
+        self.lock = threading.Lock()
+        self.read_lock = threading.Lock()
+        # set while another thread passes all lines to offer()
+        self.fed = False
+
+    def offer(self, line, received=None, received_monotonic=None):
+        """
+        Pass a line from the DAQ card to the oldest command it belongs to.
+
+        :param line: line from the DAQ card
+        :type line: str
+        :param received: unix time the line was read, defaults to now
+        :type received: float
+        :param received_monotonic: monotonic time the line was read, defaults
+                                   to now
+        :type received_monotonic: float
+        :returns: str or None -- 'echo', 'response', 'consumed' or None if
+                  no command claimed the line
+        """
+        with self.lock:
+            for pending in self.pending:
+                claimed = pending.feed(line, received, received_monotonic)
+                if claimed is not None:
+                    if pending.done.is_set():
+                        self.pending.remove(pending)
+                    return claimed
+        return None
+
+    def execute(self, command, timeout=2.0):
+        """
+        Send a command and wait for its response.
+
+        Raises DAQTimeoutError if the card does not answer in time.
+
+        :param command: command for the DAQ card
+        :type command: str
+        :param timeout: maximum time to wait in seconds
+        :type timeout: float
+        :returns: list of str -- the response lines, empty for commands which
+                  are only echoed, the reply for those followed by one
+        :raises: DAQTimeoutError
+        """
+        return self.query(command, timeout).response
+
+    def query(self, command, timeout=2.0, passthrough=True):
+        """
+        Send a command and wait for its response. Unlike execute, this
+        returns the answered command, which also holds the time the response
+        was read.
+
+        Raises DAQTimeoutError if the card does not answer in time.
+
+        :param command: command for the DAQ card
+        :type command: str
+        :param timeout: maximum time to wait in seconds
+        :type timeout: float
+        :param passthrough: if False, the response is not treated as data
+        :type passthrough: bool
+        :returns: PendingCommand
+        :raises: DAQTimeoutError
+        """
+        pending = PendingCommand(command, spec_for(command), passthrough)
+        with self.lock:
+            self.pending.append(pending)
+        self.client.put(command)
+        deadline = monotonic() + timeout
+        while not pending.done.is_set():
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                with self.lock:
+                    if pending in self.pending:
+                        self.pending.remove(pending)
+                raise DAQTimeoutError(
+                    f"No response to '{command}' within {timeout} s")
+            wait = min(remaining, self.POLL_INTERVAL)
+            if not self.fed and self.read_lock.acquire(blocking=False):
+                try:
+                    self._read(wait)
+                finally:
+                    self.read_lock.release()
+            else:
+                pending.done.wait(wait)
+        return pending
+
+    def _read(self, timeout):
+        """
+        Read lines from the client and offer them to the waiting commands.
+        Lines nobody waits for are dropped.
+        """
+        for received in self.client.receive(timeout=timeout):
+            line = received.line.decode("ascii")
+            if self.offer(line, received.received,
+                          received.received_monotonic) is None:
+                self.logger.debug(f"Dropped unexpected line: {line}")
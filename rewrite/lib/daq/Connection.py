@@ -1,7 +1,183 @@
 import logging
+import queue
+import select
+import struct
 import serial
 from .getDevice import get_Device
-from time import sleep
+from time import sleep, monotonic, time
+
+# unix time and monotonic time at which a chunk was read from the port
+CHUNK_HEADER = struct.Struct("<dd")
+
+
+def encode_chunk(lines, received, received_monotonic):
+    """
+    Pack lines read from the port together with the time they were read.
+
+    :param lines: lines read from the card, must not contain newlines
+    :type lines: list of bytes
+    :param received: unix time of the read
+    :type received: float
+    :param received_monotonic: time.monotonic() of the read
+    :type received_monotonic: float
+    :returns: bytes
+    """
+    return CHUNK_HEADER.pack(received, received_monotonic) + b"\n".join(lines)
+
+
+def decode_chunk(chunk):
+    """
+    Unpack a chunk created by encode_chunk.
+
+    :param chunk: the packed chunk
+    :type chunk: bytes
+    :returns: tuple -- unix time, monotonic time, list of lines
+    """
+    received, received_monotonic = CHUNK_HEADER.unpack_from(chunk, 0)
+    return (received, received_monotonic,
+            bytes(chunk[CHUNK_HEADER.size:]).split(b"\n"))
+
+
+class ReadStatistics(object):
+    """
+    Throughput counters of the serial reader.
+
+    Counts bytes and lines read from the DAQ card and logs the rates
+    every `interval` seconds.
+
+    :param logger: logger object
+    :type logger: logging.Logger
+    :param interval: seconds between two reports
+    :type interval: float
+    """
+
+    def __init__(self, logger, interval=10.0):
+        self.logger = logger
+        self.interval = interval
+        self.total_bytes = 0
+        self.total_lines = 0
+        self.bytes_per_second = 0.0
+        self.lines_per_second = 0.0
+        self._bytes = 0
+        self._lines = 0
+        self._since = monotonic()
+
+    def add(self, nbytes, nlines):
+        """
+        Account for a chunk read from the port.
+
+        :param nbytes: number of bytes in the chunk
+        :type nbytes: int
+        :param nlines: number of complete lines in the chunk
+        :type nlines: int
+        :returns: None
+        """
+        self._bytes += nbytes
+        self._lines += nlines
+        self.total_bytes += nbytes
+        self.total_lines += nlines
+
+    def report(self, now=None):
+        """
+        Update the rates and log them if the report interval has passed.
+
+        :param now: current monotonic time, defaults to time.monotonic()
+        :type now: float
+        :returns: bool -- True if a report was made
+        """
+        if now is None:
+            now = monotonic()
+        elapsed = now - self._since
+        if elapsed < self.interval:
+            return False
+        self.bytes_per_second = self._bytes / elapsed
+        self.lines_per_second = self._lines / elapsed
+        self.logger.debug(f"Serial reader: {self.bytes_per_second:.0f} bytes/s, "
+                          f"{self.lines_per_second:.1f} lines/s")
+        self._bytes = 0
+        self._lines = 0
+        self._since = now
+        return True
+
+
+def split_lines(pending, chunk):
+    """
+    Split data read from the port into complete lines.
+
+    :param pending: incomplete line left over from the previous read
+    :type pending: bytes
+    :param chunk: data read from the port
+    :type chunk: bytes
+    :returns: tuple -- list of stripped, non-empty lines and the new
+              incomplete line
+    """
+    lines = (pending + chunk).split(b"\n")
+    pending = lines.pop()
+    lines = [line.strip() for line in lines]
+    return [line for line in lines if line], pending
+
+
+class LatencyStatistics(object):
+    """
+    Delay between reading a line from the port and publishing it.
+
+    Logs the mean and maximum delay every `interval` seconds.
+
+    :param logger: logger object
+    :type logger: logging.Logger
+    :param interval: seconds between two reports
+    :type interval: float
+    """
+
+    def __init__(self, logger, interval=10.0):
+        self.logger = logger
+        self.interval = interval
+        self.count = 0
+        self.mean = 0.0
+        self.maximum = 0.0
+        self._sum = 0.0
+        self._count = 0
+        self._maximum = 0.0
+        self._since = monotonic()
+
+    def add(self, delay):
+        """
+        Account for a published line.
+
+        :param delay: seconds between read and publish
+        :type delay: float
+        :returns: None
+        """
+        self.count += 1
+        self._count += 1
+        self._sum += delay
+        if delay > self._maximum:
+            self._maximum = delay
+
+    def report(self, now=None):
+        """
+        Update mean and maximum and log them if the report interval has
+        passed.
+
+        :param now: current monotonic time, defaults to time.monotonic()
+        :type now: float
+        :returns: bool -- True if a report was made
+        """
+        if now is None:
+            now = monotonic()
+        if now - self._since < self.interval:
+            return False
+        if self._count:
+            self.mean = self._sum / self._count
+            self.maximum = self._maximum
+            self.logger.debug(f"Read to publish delay: mean "
+                              f"{1000 * self.mean:.2f} ms, max "
+                              f"{1000 * self.maximum:.2f} ms")
+        self._sum = 0.0
+        self._count = 0
+        self._maximum = 0.0
+        self._since = now
+        return True
 
 
 class DAQConnection(object):
@@ -11,21 +187,50 @@ class DAQConnection(object):
 
     Raises SystemError if serial connection cannot be established.
 
+    The connection can read from the card in two ways. In 'poll' mode
+    `inWaiting()` is polled with an adaptive sleep and lines are read one by
+    one. In 'select' mode (the default) the reader blocks on the file
+    descriptor of the port, reads everything that is waiting in one call and
+    splits the lines itself. 'select' mode falls back to 'poll' mode if the
+    port does not provide a file descriptor.
+
+    The lines of every read are put into the out queue as one chunk (see
+    encode_chunk) together with the unix and monotonic time of the read.
+
     :param logger: logger object
     :type logger: logging.Logger
     :param in_queue: input queue
     :param out_queue: output queue
+    :param read_mode: either 'select' or 'poll'
+    :type read_mode: str
+    :param serial_port: an already opened serial port, mostly for testing
     :raises: SystemError
     """
 
-    def __init__(self, in_queue, out_queue, logger=None):
+    READ_MODES = ("select", "poll")
+
+    # maximum time select() and the writer block before checking
+    # self.running again
+    SELECT_TIMEOUT = 0.5  # seconds
+    # upper limit for a single read() call
+    MAX_CHUNK_SIZE = 65536  # bytes
+
+    def __init__(self, in_queue, out_queue, logger=None, read_mode="select",
+                 serial_port=None):
         if logger is None:
             logger = logging.getLogger()
         self.logger = logger
         self.running = 1
         self.in_queue = in_queue
         self.out_queue = out_queue
+        if read_mode not in self.READ_MODES:
+            raise ValueError(f"Unknown read mode '{read_mode}'")
+        self.read_mode = read_mode
+        self.statistics = ReadStatistics(self.logger)
 
+        if serial_port is not None:
+            self.serial_port = serial_port
+            return
         try:
             self.serial_port = self.get_serial_port()
         except serial.SerialException as e:
@@ -65,7 +270,75 @@ class DAQConnection(object):
 
     def read(self):
         """
-        Gets Data from the DAQ card. Read it from the provided queue.
+        Gets Data from the DAQ card and puts every line into the out queue.
+
+        :returns: None
+        """
+        if self.read_mode == "select":
+            try:
+                self.serial_port.fileno()
+            except (AttributeError, OSError, ValueError):
+                self.logger.info("Serial port has no file descriptor. "
+                                 "Falling back to polling.")
+            else:
+                return self.read_select()
+        return self.read_poll()
+
+    def read_select(self):
+        """
+        Event driven reader. Blocks on the port until data arrives, then reads
+        all waiting bytes in one call and splits them into lines. Incomplete
+        lines are kept until the rest arrives. Never sleeps while data is
+        waiting.
+
+        :returns: None
+        """
+        pending = b""
+        while self.running:
+            try:
+                ready, _, _ = select.select([self.serial_port.fileno()], [],
+                                            [], self.SELECT_TIMEOUT)
+                if ready:
+                    waiting = self.serial_port.in_waiting
+                    chunk = self.serial_port.read(
+                        min(max(waiting, 1), self.MAX_CHUNK_SIZE))
+                    received, received_monotonic = time(), monotonic()
+                    if chunk:
+                        lines, pending = split_lines(pending, chunk)
+                        self.put_lines(lines, received, received_monotonic)
+                        self.statistics.add(len(chunk), len(lines))
+                self.statistics.report()
+            except (IOError, OSError, serial.SerialException):
+                self.logger.error("IOError")
+                pending = b""
+                self.serial_port.close()
+                self.serial_port = self.get_serial_port()
+
+    def put_lines(self, lines, received=None, received_monotonic=None):
+        """
+        Hand the lines of one read to the out queue as a single chunk.
+
+        :param lines: lines read from the card
+        :type lines: list of bytes
+        :param received: unix time of the read, defaults to now
+        :type received: float
+        :param received_monotonic: time.monotonic() of the read, defaults to
+                                   now
+        :type received_monotonic: float
+        :returns: None
+        """
+        if not lines:
+            return
+        if received is None:
+            received = time()
+        if received_monotonic is None:
+            received_monotonic = monotonic()
+        self.out_queue.put(encode_chunk(lines, received, received_monotonic))
+
+    def read_poll(self):
+        """
+        Polling reader. Checks the port for waiting data and sleeps between
+        10 ms and 200 ms if there is none.
 
         :returns: None
         """
@@ -78,10 +351,13 @@ class DAQConnection(object):
             try:
                 if self.serial_port.inWaiting():
                     while self.serial_port.inWaiting():
-                        self.out_queue.put(self.serial_port.readline().strip())
+                        line = self.serial_port.readline()
+                        self.put_lines([line.strip()])
+                        self.statistics.add(len(line), 1)
                         sleep_time = max(sleep_time / 2, min_sleep_time)
                 else:
                     sleep_time = min(1.5 * sleep_time, max_sleep_time)
+                self.statistics.report()
                 sleep(sleep_time)
             except (IOError, OSError):
                 self.logger.error("IOError")
@@ -90,26 +366,19 @@ class DAQConnection(object):
 
     def write(self):
         """
-        Writes messages from the in queue to the DAQ card
+        Writes messages from the in queue to the DAQ card as soon as they
+        are queued
 
         :returns: None
         """
 
         while self.running:
             try:
-                while self.in_queue.qsize():
-                    try:
-                        out_str = str(self.in_queue.get(0)) + str("\r")
-                        self.serial_port.write(out_str.encode("ascii"))
-                    except (queue.Empty, serial.SerialTimeoutException):
-                        pass
-            except NotImplementedError:
-                self.logger.debug("Running macOS version of muonic")
-                while True:
-                    try:
-                        out_str = str(self.in_queue.get(
-                            timeout=0.01)) + str("\r")
-                        self.serial_port.write(out_str.encode("ascii"))
-                    except (queue.Empty, serial.SerialTimeoutException):
-                        pass
-            sleep(0.1)
+                out_str = str(self.in_queue.get(
+                    timeout=self.SELECT_TIMEOUT)) + str("\r")
+            except queue.Empty:
+                continue
+            try:
+                self.serial_port.write(out_str.encode("ascii"))
+            except serial.SerialTimeoutException:
+                pass
@@ -0,0 +1,160 @@
+"""
+In-memory model of the configuration of the DAQ card
+"""
+import re
+
+# register 00: coincidence level (high nibble) and channel mask (low nibble)
+CHANNEL_REGISTER = 0
+# registers 02 and 03: gate time of the coincidence window
+GATE_REGISTERS = (2, 3)
+REGISTERS = (0, 1, 2, 3)
+
+COINCIDENCES = ("single", "twofold", "threefold", "fourfold")
+
+NCHANNELS = 4
+
+DC_PATTERN = re.compile(r"C([0-3])=([0-9A-Fa-f]{1,2})\b")
+TL_PATTERN = re.compile(r"L([0-3])=(\d+)\b")
+
+
+class DAQConfiguration(object):
+    """
+    Last known configuration of the DAQ card: the control registers written
+    with 'WC' (channel mask, coincidence level, gate registers) and the
+    thresholds written with 'TL'.
+
+    The model is updated from every command sent to the card and from the
+    card's own replies to 'DC' and 'TL', so it always reflects what the card
+    reported last. Values which are unknown are None.
+    """
+
+    def __init__(self):
+        self.registers = dict.fromkeys(REGISTERS)
+        self.thresholds = [None] * NCHANNELS
+
+    @property
+    def known(self):
+        """
+        True if all registers and thresholds are known
+
+        :returns: bool
+        """
+        return None not in self.registers.values() and \
+            None not in self.thresholds
+
+    @property
+    def channel_mask(self):
+        """
+        Enabled channels as a bit mask, bit 0 is channel 0
+
+        :returns: int or None
+        """
+        value = self.registers[CHANNEL_REGISTER]
+        return None if value is None else value & 0x0F
+
+    @property
+    def coincidence(self):
+        """
+        Coincidence level, one of COINCIDENCES
+
+        :returns: str or None
+        """
+        value = self.registers[CHANNEL_REGISTER]
+        return None if value is None else COINCIDENCES[(value >> 4) & 0x03]
+
+    def invalidate(self):
+        """
+        Forget everything, e.g. after the card was reset.
+
+        :returns: None
+        """
+        self.registers = dict.fromkeys(REGISTERS)
+        self.thresholds = [None] * NCHANNELS
+
+    def update_from_response(self, line):
+        """
+        Update the model from a reply of the card to 'DC' or 'TL'.
+        Other lines are ignored.
+
+        :param line: line from the DAQ card
+        :type line: str
+        :returns: bool -- True if the line was a configuration reply
+        """
+        if line.startswith("DC"):
+            for register, value in DC_PATTERN.findall(line):
+                self.registers[int(register)] = int(value, 16)
+            return True
+        if line.startswith("TL"):
+            for channel, value in TL_PATTERN.findall(line):
+                self.thresholds[int(channel)] = int(value)
+            return True
+        return False
+
+    def update_from_command(self, command):
+        """
+        Update the model from a command sent to the card, i.e. 'WC 00 2F' or
+        'TL 0 300'. 'TL 4 x' sets the threshold of all channels.
+
+        :param command: command sent to the DAQ card
+        :type command: str
+        :returns: None
+        """
+        words = command.split()
+        if len(words) != 3:
+            return
+        try:
+            if words[0] == "WC":
+                register = int(words[1], 16)
+                if register in self.registers:
+                    self.registers[register] = int(words[2], 16)
+            elif words[0] == "TL":
+                channel = int(words[1])
+                value = int(words[2])
+                if channel == NCHANNELS:
+                    self.thresholds = [value] * NCHANNELS
+                elif 0 <= channel < NCHANNELS:
+                    self.thresholds[channel] = value
+        except ValueError:
+            pass
+
+    def commands_for(self, registers=None, thresholds=None):
+        """
+        Get the commands which bring the card from the known configuration
+        to the requested one. Values which already match are skipped.
+
+        :param registers: requested register values by register number
+        :type registers: dict
+        :param thresholds: requested thresholds per channel, None entries
+                           are left unchanged
+        :type thresholds: list of int
+        :returns: list of str
+        """
+        commands = []
+        for register, value in sorted((registers or {}).items()):
+            if self.registers.get(register) != value:
+                commands.append("WC %02X %02X" % (register, value))
+        for channel, value in enumerate(thresholds or []):
+            if value is not None and self.thresholds[channel] != value:
+                commands.append("TL %d %d" % (channel, value))
+        return commands
+
+
+def channel_register(ch0=False, ch1=False, ch2=False, ch3=False,
+                     coincidence="single"):
+    """
+    Get the value of register 00 for a channel and coincidence setting.
+
+    Raises ValueError for an unknown coincidence level.
+
+    :param coincidence: one of COINCIDENCES
+    :type coincidence: str
+    :raises: ValueError
+    :returns: int
+    """
+    if coincidence not in COINCIDENCES:
+        raise ValueError(f"Unknown coincidence '{coincidence}'")
+    mask = 0
+    for i, enabled in enumerate((ch0, ch1, ch2, ch3)):
+        if enabled:
+            mask |= 1 << i
+    return COINCIDENCES.index(coincidence) << 4 | mask
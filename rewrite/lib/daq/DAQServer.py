@@ -2,8 +2,13 @@ import logging
 
 
 from .Provider import DAQProvider
+from .Connection import LatencyStatistics
+from .CommandEngine import CommandEngine
+from .DAQConfig import DAQConfiguration, channel_register
+from .PollScheduler import PollScheduler
+from .Exceptions import DAQTimeoutError
 from datetime import datetime
-from time import time, sleep
+from time import time, sleep, monotonic
 from multiprocessing import Queue
 import threading
 from ..common.Record import Record, RecordType
@@ -12,12 +17,63 @@ from ..common.TemperatureRecord import TemperatureRecord
 from ..common.PressureRecord import PressureRecord, PressureType
 from ..common.DataRecord import DataRecord
 from ..common.GPSRecord import GPSRecord
+from ..utils.Stream import publish_record, publish_data_batch
 import zmq
-import jsonpickle
+
+
+def record_for_line(msg):
+    """
+    Get the record type and payload for a message from the DAQ card.
+
+    :param msg: message from the DAQ card
+    :type msg: str
+    :returns: tuple or None -- record type and payload, None for messages
+              which are not published
+    """
+    if msg.startswith('DS'):
+        if len(msg) >= 3:
+            return RecordType.COUNTER, CountRecord(msg)
+    elif msg.startswith('TH'):
+        if len(msg) >= 9:
+            return RecordType.TEMPERATURE, TemperatureRecord(msg)
+    elif msg.startswith('BA') or msg.startswith('mBar'):
+        if len(msg) >= 4:
+            return RecordType.PRESSURE, PressureRecord(msg)
+    elif msg.startswith('CD') or msg.startswith('CE'):
+        return None
+    else:
+        return RecordType.DATA, DataRecord(msg)
+    return None
 
 
 class DAQServer(object):
-    def __init__(self):
+    """
+    Talks to the DAQ card and publishes everything it sends as Records
+    via zeromq.
+
+    DATA lines can be published in batches: up to batch_size lines or all
+    lines received within batch_interval seconds are sent as one message.
+    Every line keeps its own package number and receive timestamp, other
+    records are never overtaken by a pending batch.
+
+    :param transport: transport between the serial reader process and the
+                      server, 'queue' or 'shm' (see DAQProvider)
+    :type transport: str
+    :param batch_size: maximum number of DATA lines per message, every line
+                       is sent on its own if None
+    :type batch_size: int
+    :param batch_interval: maximum time a DATA line waits for its batch
+    :type batch_interval: float
+    """
+
+    # maximum time process_incoming waits for new data before checking
+    # self.running again
+    WAIT_TIMEOUT = 0.5  # seconds
+    # maximum time to wait for the DAQ card to answer a command
+    COMMAND_TIMEOUT = 2.0  # seconds
+
+    def __init__(self, transport="queue", batch_size=None,
+                 batch_interval=0.05):
 
         # process incoming data
         self.countqueue = Queue()
@@ -31,6 +87,16 @@ class DAQServer(object):
         self.socket.bind("tcp://*:1234")
         # package number
         self.package_number = 0
+        # zmq sockets must not be used by several threads at once
+        self.publish_lock = threading.Lock()
+
+        # pending DATA lines, guarded by publish_lock
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.batch_lines = []
+        self.batch_timestamps = []
+        self.batch_received = []
+        self.batch_deadline = None
 
         self.running = False
 
@@ -47,27 +113,229 @@ class DAQServer(object):
         ch.setFormatter(formatter)
         self.logger.addHandler(ch)
 
+        # delay between reading a line from the port and publishing it
+        self.latency = LatencyStatistics(self.logger)
+
         # Connect to the DAQ card
-        self.client = DAQProvider(logger=self.logger)
+        self.client = DAQProvider(logger=self.logger, transport=transport)
+        self.commands = CommandEngine(self.client, self.logger)
+        # last known configuration of the card
+        self.config = DAQConfiguration()
+        # periodic readout of scalars, temperature and pressure
+        self.poller = PollScheduler(self, logger=self.logger)
 
         # disable data flow for startup
         self.stop_reading_data()
         # disable status messages from the card
         self.do('ST 0')
 
-    def do(self, msg):
+    def publish(self, rec_type, payload, timestamp=None,
+                received_monotonic=None):
         """
-        Send a command to the DAQ card and remove repeated responses from the outqueue
-        if data taking is turned off. Otherwise just send the command to the card.
+        Wrap a payload into a Record with the next package number and send it
+        to all subscribers.
+
+        :param rec_type: type of the record
+        :type rec_type: RecordType
+        :param payload: payload of the record
+        :param timestamp: unix timestamp of the record, defaults to now
+        :type timestamp: float
+        :param received_monotonic: monotonic time the underlying line was
+                                   read from the port, for the latency
+                                   statistics
+        :type received_monotonic: float
+        :returns: Record -- the published record
         """
-        if self.running == False:
-            self.client.put(msg)
-            sleep(0.5)
-            self.client.get(0)
-            if msg == 'ST 0' or msg.startswith('WC'):
-                self.client.get(0)
-        else:
-            self.client.put(msg)
+        if timestamp is None:
+            timestamp = datetime.now().timestamp()
+        with self.publish_lock:
+            self._flush_batch()
+            rec = Record(self.package_number, rec_type, timestamp, payload)
+            self.package_number += 1
+            publish_record(self.socket, rec)
+            if received_monotonic is not None:
+                self.latency.add(monotonic() - received_monotonic)
+        return rec
+
+    def publish_data(self, msg, timestamp=None, received_monotonic=None):
+        """
+        Publish a DATA line. If batching is enabled, the line is added to
+        the pending batch which is sent once it is full.
+
+        :param msg: message from the DAQ card
+        :type msg: str
+        :param timestamp: unix timestamp of the line, defaults to now
+        :type timestamp: float
+        :param received_monotonic: monotonic time the line was read from the
+                                   port
+        :type received_monotonic: float
+        :returns: None
+        """
+        if not self.batch_size:
+            self.publish(RecordType.DATA, DataRecord(msg), timestamp,
+                         received_monotonic)
+            return
+        if timestamp is None:
+            timestamp = datetime.now().timestamp()
+        with self.publish_lock:
+            if not self.batch_lines:
+                self.batch_deadline = monotonic() + self.batch_interval
+            self.batch_lines.append(msg)
+            self.batch_timestamps.append(timestamp)
+            if received_monotonic is not None:
+                self.batch_received.append(received_monotonic)
+            if len(self.batch_lines) >= self.batch_size:
+                self._flush_batch()
+
+    def flush_batch(self, force=True):
+        """
+        Send the pending DATA batch.
+
+        :param force: send the batch even if batch_interval has not passed
+        :type force: bool
+        :returns: None
+        """
+        with self.publish_lock:
+            if force or (self.batch_deadline is not None and
+                         monotonic() >= self.batch_deadline):
+                self._flush_batch()
+
+    def _flush_batch(self):
+        """
+        Send the pending DATA batch. publish_lock must be held.
+        """
+        if not self.batch_lines:
+            return
+        publish_data_batch(self.socket, self.package_number,
+                           self.batch_timestamps, self.batch_lines)
+        self.package_number += len(self.batch_lines)
+        now = monotonic()
+        for received_monotonic in self.batch_received:
+            self.latency.add(now - received_monotonic)
+        self.batch_lines = []
+        self.batch_timestamps = []
+        self.batch_received = []
+        self.batch_deadline = None
+
+    def _wait_timeout(self):
+        """
+        Time process_incoming may wait for new data without delaying the
+        pending batch.
+        """
+        if self.batch_deadline is None:
+            return self.WAIT_TIMEOUT
+        return max(0.0, min(self.WAIT_TIMEOUT,
+                            self.batch_deadline - monotonic()))
+
+    def do(self, msg, timeout=None):
+        """
+        Send a command to the DAQ card and wait until the card has answered.
+        The echo of the command is removed from the data stream.
+
+        :param msg: command for the DAQ card
+        :type msg: str
+        :param timeout: maximum time to wait, defaults to COMMAND_TIMEOUT
+        :type timeout: float
+        :returns: list of str -- the response lines, empty for commands which
+                  are only echoed or if the card did not answer in time
+        """
+        if timeout is None:
+            timeout = self.COMMAND_TIMEOUT
+        try:
+            response = self.commands.execute(msg, timeout)
+        except DAQTimeoutError as e:
+            self.logger.warning(str(e))
+            return []
+        self.config.update_from_command(msg)
+        for line in response:
+            self.config.update_from_response(line)
+        return response
+
+    def refresh_config(self):
+        """
+        Read the channel settings and thresholds back from the DAQ card.
+
+        :returns: None
+        """
+        self.config.invalidate()
+        self.do('DC')
+        self.do('TL')
+
+    def apply_config(self, registers=None, thresholds=None):
+        """
+        Bring the DAQ card to the given configuration. Only registers and
+        thresholds which differ from the last known configuration are
+        written, so applying the current configuration sends no command.
+
+        :param registers: register values by register number
+        :type registers: dict
+        :param thresholds: thresholds per channel, None entries are left
+                           unchanged
+        :type thresholds: list of int
+        :returns: list of str -- the commands sent to the card
+        """
+        if not self.config.known:
+            self.refresh_config()
+        commands = self.config.commands_for(registers, thresholds)
+        for command in commands:
+            self.do(command)
+        # read back what the card actually uses
+        if any(command.startswith('WC') for command in commands):
+            response = self.do('DC')
+            if response:
+                self.logger.info("Channels set. %s" % response[0])
+            else:
+                self.logger.error(
+                    "DAQ card did not report the channel setting.")
+        if any(command.startswith('TL') for command in commands):
+            response = self.do('TL')
+            if response:
+                self.logger.info("Thresholds set to %s" % response[0])
+            else:
+                self.logger.error(
+                    "DAQ card did not report the threashold setting. Something is wrong!")
+        return commands
+
+    def write_register(self, register, value):
+        """
+        Write a control register of the DAQ card if its value changed.
+
+        :param register: register number, e.g. 2 or 3 for the gate time
+        :type register: int
+        :param value: new value of the register
+        :type value: int
+        :returns: None
+        """
+        self.apply_config(registers={register: value})
+
+    def start_polling(self, interval=5.0, environment_every=1):
+        """
+        Start publishing the scalars every interval seconds and temperature
+        and pressure every environment_every scalar polls (see
+        PollScheduler). A running scheduler is restarted with the new
+        settings.
+
+        :param interval: time between scalar polls in seconds
+        :type interval: float
+        :param environment_every: poll temperature and pressure every n-th
+                                  scalar poll, never if 0
+        :type environment_every: int
+        :returns: None
+        """
+        self.poller.stop()
+        self.poller.interval = interval
+        self.poller.environment_every = environment_every
+        self.poller.start()
+        self.logger.debug(f'Polling scalars every {interval} s.')
+
+    def stop_polling(self):
+        """
+        Stop the periodic readout started with start_polling.
+
+        :returns: None
+        """
+        self.poller.stop()
+        self.logger.debug('Stopped polling.')
 
     def reset_scalars(self):
         """
@@ -103,70 +371,28 @@ class DAQServer(object):
         if self.running:
             self.client.put('DS')
         else:
-            self.do('DS')
-            scalar_msg = self.client.get(0)
-            if scalar_msg.startswith('DS'):
-                self.get_scalars(scalar_msg)
+            response = self.do('DS')
+            if response:
+                self.get_scalars(response[0])
                 return self.counts_ch0, self.counts_ch1, self.counts_ch2, self.counts_ch3, self.counts_trigger
             else:
-                self.logger.info(
-                    "Didn't find scalars in message. %s" % scalar_msg)
+                self.logger.info("Didn't find scalars in the response.")
 
     def set_threashold(self, th_0=300, th_1=300, th_2=300, th_3=300):
         """
         Set the threasholds for the channels of the DAQ card.
         Default value for all channels is 300.
         """
-        Th = [th_0, th_1, th_2, th_3]
-        for i in range(4):
-            msg = "TL "+str(i)+" "+str(Th[i])
-            self.do(msg)
-
-        self.do('TL')
-        scan = 0
-        while scan < 10:
-            response_th = self.client.get(0).decode("ascii")
-            if response_th.startswith('TL') and len(response_th) > 9:
-                self.logger.info("Thresholds set to %s" % response_th)
-                break
-            else:
-                self.logger.debug("Haven't found threasholds yet")
-                self.logger.debug(response_th)
-                scan += 1
-        else:
-            self.logger.error(
-                "Didn't find threashold setting in last 10 messanges coming from DAQ card. Something is wrong!")
+        self.apply_config(thresholds=[int(th_0), int(th_1), int(th_2),
+                                      int(th_3)])
 
     def setup_channel(self, ch0=False, ch1=False, ch2=False, ch3=False, coincidence='single'):
         """
         Enable/Disable channels of the DAQ card and set coincidence settings.
         """
-        self.nchannels = 0
-        channels = [ch3, ch2, ch1, ch0]
-        ch_setting = str("")
-        for i in range(4):
-            if channels[i] == False:
-                ch_setting += '0'
-            elif channels[i] == True:
-                ch_setting += '1'
-                self.nchannels += 1
-        ch = format(int(ch_setting, 2), 'X')
-
-        if coincidence == 'single':
-            coinc = 0
-        elif coincidence == 'twofold':
-            coinc = 1
-        elif coincidence == 'threefold':
-            coinc = 2
-        elif coincidence == 'fourfold':
-            coinc = 3
-
-        msg = "WC 00 "+str(coinc)+str(ch)
-        self.do(msg)
-        sleep(0.5)
-        self.do('DC')
-        response_ch = self.client.get(0)
-        self.logger.info("Channels set. %s" % response_ch)
+        self.nchannels = sum(1 for ch in (ch0, ch1, ch2, ch3) if ch)
+        self.apply_config(registers={
+            0: channel_register(ch0, ch1, ch2, ch3, coincidence)})
 
     def get_temp_and_pressure(self):
         """
@@ -183,10 +409,7 @@ class DAQServer(object):
             if self.tempqueue.qsize():
                 msg_temp = self.tempqueue.get(0)
                 tmpRec = TemperatureRecord(msg_temp)
-                rec = Record(self.package_number, RecordType.TEMPERATURE,
-                             datetime.now().timestamp(), tmpRec)
-                self.package_number += 1
-                self.socket.send_string(jsonpickle.encode(rec))
+                self.publish(RecordType.TEMPERATURE, tmpRec)
                 self.temperature = float(msg_temp.split("=")[1])
             else:
                 self.logger.info(
@@ -203,36 +426,28 @@ class DAQServer(object):
                     "Failed to measure the pressure. No element in queue.")
 
         else:
-            self.do('TH')
-            msg_temp = self.client.get(0).decode("ascii")
+            response = self.do('TH')
+            msg_temp = response[0] if response else None
             tmpRec = TemperatureRecord(msg_temp)
-            rec = Record(self.package_number, RecordType.TEMPERATURE,
-                         datetime.now().timestamp(), tmpRec)
-            self.package_number += 1
-            self.socket.send_string(jsonpickle.encode(rec))
-            print(f"type: {type(msg_temp)}")
-            if msg_temp.startswith('TH'):
+            self.publish(RecordType.TEMPERATURE, tmpRec)
+            if tmpRec.valid:
                 self.temperature = float(msg_temp.split("=")[1])
                 self.logger.debug('Measured temperature: %f' %
                                   self.temperature)
             else:
                 self.logger.error("Could not read temperature.")
-            self.do('BA')
-            msg_press = self.client.get(0).decode("ascii")
+            # response: pressure, 'calibrate pressure' message, pressure in mBar
+            response = self.do('BA')
+            msg_press = response[0] if response else ""
             presRec = PressureRecord(msg_press)
-            rec = Record(self.package_number, RecordType.PRESSURE,
-                         datetime.now().timestamp(), presRec)
-            self.package_number += 1
-            self.socket.send_string(jsonpickle.encode(rec))
+            self.publish(RecordType.PRESSURE, presRec)
             if msg_press.startswith('BA'):
                 self.pressure = float(msg_press.split()[1])
                 self.logger.debug('Measured pressure: %f' % self.pressure)
             else:
                 self.logger.error("Could not read pressure [counts].")
-            # take out the 'calibrate pressure' message:
-            self.client.get(0)
 
-            calib_press = self.client.get(0).decode("ascii")
+            calib_press = response[-1] if response else ""
             if calib_press.startswith('mBar'):
                 self.pressure_mbar = float(calib_press.split()[4])
                 self.logger.debug('Measured pressure in mBar: %f' %
@@ -247,10 +462,7 @@ class DAQServer(object):
         Check message for pressure information.
         """
         presRec = PressureRecord(msg)
-        rec = Record(self.package_number, RecordType.PRESSURE,
-                     datetime.now().timestamp(), presRec)
-        self.package_number += 1
-        self.socket.send_string(jsonpickle.encode(rec))
+        self.publish(RecordType.PRESSURE, presRec)
         if msg.startswith('BA'):
             self.pressure = float(msg.split()[1])
         elif msg.startswith('mBar'):
@@ -260,37 +472,19 @@ class DAQServer(object):
                 "Weird element in pressure queue. Could not read pressure.")
 
     def get_gps_info(self):
-        self.do('DG')
-        Found = False
-        # print("before get")
-        msg = self.client.get(0)
-        # print("after get")
-        while not Found:
-            if msg.startswith(b'Date+Time'):
-                gpsmsg = msg
-                Found = True
-            else:
-                msg = self.client.get(0)
-
-        GPSDateTime = gpsmsg
-        Status = self.client.get(0)
-        PosFix = self.client.get(0)
-        Latitude = self.client.get(0)
-        Longitude = self.client.get(0)
-        Altitude = self.client.get(0)
-        NSats = self.client.get(0)
-        PPSDelay = self.client.get(0)
-        FPGATime = self.client.get(0)
-        ChkSumErr = self.client.get(0)
+        response = self.do('DG')
+        if len(response) < 10:
+            self.logger.error("Could not read GPS information.")
+            return
+        (GPSDateTime, Status, PosFix, Latitude, Longitude, Altitude, NSats,
+         PPSDelay, FPGATime, ChkSumErr) = [line.encode("ascii")
+                                           for line in response]
 
 
         gpsRecord = GPSRecord(GPSDateTime,Status,PosFix,Latitude,Longitude,Altitude,NSats,PPSDelay,FPGATime,ChkSumErr)
 
 
-        rec = Record(self.package_number, RecordType.GPS,
-                        datetime.now().timestamp(), jsonpickle.encode(gpsRecord))
-        self.package_number += 1
-        self.socket.send_string(jsonpickle.encode(rec))
+        self.publish(RecordType.GPS, gpsRecord)
 
         self.logger.info(GPSDateTime)
         self.logger.info(Status)
@@ -306,50 +500,56 @@ class DAQServer(object):
     def process_incoming(self):
         """
         Sort messages received from the DAQ card and store them in separate queues.
+        Waits for data from the DAQ card instead of polling and handles all
+        waiting lines in one batch.
         """
-        while self.running:
-            while self.client.data_available():
-                try:
-                    msg = self.client.get(0).decode("ascii")
-                except:
-                    self.logger.debug('Queue empty!')
-                    break
-                # print(msg)
-                if msg.startswith('DS'):
-                    if len(msg) >= 3:
-                        cntRec = CountRecord(msg)
-                        rec = Record(self.package_number, RecordType.COUNTER,
-                                     datetime.now().timestamp(), cntRec)
-                        self.package_number += 1
-                        self.socket.send_string(jsonpickle.encode(rec))
-                        self.countqueue.put(msg)
-                elif msg.startswith('TH'):
-                    if len(msg) >= 9:
-                        tmpRec = TemperatureRecord(msg)
-                        rec = Record(self.package_number, RecordType.TEMPERATURE,
-                                     datetime.now().timestamp(), tmpRec)
-                        self.package_number += 1
-                        self.socket.send_string(jsonpickle.encode(rec))
-                        self.tempqueue.put(msg)
-                elif msg.startswith('BA') or msg.startswith('mBar'):
-                    if len(msg) >= 4:
-                        presRec = PressureRecord(msg)
-                        rec = Record(self.package_number, RecordType.PRESSURE,
-                                     datetime.now().timestamp(), presRec)
-                        self.package_number += 1
-                        self.socket.send_string(jsonpickle.encode(rec))
-                        self.pressqueue.put(msg)
-                elif msg.startswith('CD') or msg.startswith('CE'):
-                    continue
-                else:
-                    dataRec = DataRecord(msg)
-                    rec = Record(self.package_number, RecordType.DATA,
-                                 datetime.now().timestamp(), dataRec)
-                    self.package_number += 1
-                    self.socket.send_string(jsonpickle.encode(rec))
-                    # self.dataqueue.put(msg)
-            else:
-                sleep(0.2)
+        self.commands.fed = True
+        try:
+            while self.running:
+                for received in self.client.receive(
+                        timeout=self._wait_timeout()):
+                    msg = received.line.decode("ascii")
+                    # echoes of commands are not data, responses are
+                    # published as usual unless the caller publishes them
+                    claimed = self.commands.offer(
+                        msg, received.received, received.received_monotonic)
+                    if claimed in (None, "response"):
+                        self.handle_line(msg, received.received,
+                                         received.received_monotonic)
+                self.flush_batch(force=False)
+                self.latency.report()
+        finally:
+            self.commands.fed = False
+        self.flush_batch()
+
+    def handle_line(self, msg, received=None, received_monotonic=None):
+        """
+        Publish a single message from the DAQ card as a record of the
+        matching type. The record gets the time the line was read from the
+        port as timestamp.
+
+        :param msg: message from the DAQ card
+        :type msg: str
+        :param received: unix time the line was read, defaults to now
+        :type received: float
+        :param received_monotonic: monotonic time the line was read
+        :type received_monotonic: float
+        """
+        record = record_for_line(msg)
+        if record is None:
+            return
+        rec_type, payload = record
+        if rec_type == RecordType.DATA:
+            self.publish_data(msg, received, received_monotonic)
+            # self.dataqueue.put(msg)
+            return
+        self.publish(rec_type, payload, received, received_monotonic)
+        if rec_type == RecordType.COUNTER:
+            self.countqueue.put(msg)
+        elif rec_type == RecordType.TEMPERATURE:
+            self.tempqueue.put(msg)
+        else:
+            self.pressqueue.put(msg)
 
     def get_scalars(self, msg=None):
         """
@@ -381,10 +581,7 @@ class DAQServer(object):
             elif ("S5" in item) & (len(item) == 11):
                 counters_time = float(int(item[3:], 16))
         cntRec = CountRecord(msg)
-        rec = Record(self.package_number, RecordType.COUNTER,
-                     datetime.now().timestamp(), cntRec)
-        self.package_number += 1
-        self.socket.send_string(jsonpickle.encode(rec))
+        self.publish(RecordType.COUNTER, cntRec)
         return self.counts_ch0, self.counts_ch1, self.counts_ch2, self.counts_ch3, self.counts_trigger
 
     # def calculate_rates(self):
@@ -425,6 +622,7 @@ class DAQServer(object):
         self.x.start()
 
     def stop(self):
+        self.stop_polling()
         self.running = False
         self.x.stop()
 
@@ -15,3 +15,11 @@ class DAQMissingDependencyError(Exception):
     Exception class which is thrown if runtime dependencies are not met
     """
     pass
+
+
+class DAQTimeoutError(DAQIOError):
+    """
+    Exception class which is thrown if the DAQ card does not answer a command
+    in time
+    """
+    pass
@@ -0,0 +1,147 @@
+"""
+Periodic readout of the scalars and the environment sensors of the DAQ card
+"""
+import logging
+import threading
+from time import monotonic
+
+from ..common.Record import RecordType
+from ..common.CountRecord import CountRecord
+from ..common.TemperatureRecord import TemperatureRecord
+from ..common.PressureRecord import PressureRecord
+from .Exceptions import DAQTimeoutError
+
+
+class PollScheduler(object):
+    """
+    Polls the scalars ('DS') of the DAQ card at a fixed cadence and publishes
+    them as COUNTER records. Temperature ('TH') and pressure ('BA') are
+    polled every environment_every scalar polls.
+
+    The polls are scheduled on a fixed grid of the monotonic clock, so delays
+    do not accumulate. Every record gets the host time at which the card's
+    reply was read, and COUNTER records carry the exact time since the
+    previous scalar reply in delta_time. Rates should be calculated with
+    delta_time instead of the nominal interval.
+
+    :param server: server used to talk to the card and to publish records
+    :type server: DAQServer
+    :param interval: time between scalar polls in seconds
+    :type interval: float
+    :param environment_every: poll temperature and pressure every n-th scalar
+                              poll, never if 0
+    :type environment_every: int
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    def __init__(self, server, interval=5.0, environment_every=1,
+                 logger=None):
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        self.server = server
+        self.interval = interval
+        self.environment_every = environment_every
+        self.previous_poll = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        """
+        :returns: bool -- True while the scheduler thread is alive
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """
+        Start polling in a background thread. The first poll is done
+        immediately.
+
+        :returns: None
+        """
+        if self.running:
+            return
+        self._stop.clear()
+        self.previous_poll = None
+        self._thread = threading.Thread(target=self.run, name="PollScheduler",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop polling and wait for the scheduler thread to finish.
+
+        :param timeout: maximum time to wait for the thread in seconds
+        :type timeout: float
+        :returns: None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run(self):
+        """
+        Poll until stop() is called.
+
+        :returns: None
+        """
+        start = monotonic()
+        n = 0
+        while not self._stop.is_set():
+            self.poll_scalars()
+            if self.environment_every and n % self.environment_every == 0:
+                self.poll_environment()
+            n += 1
+            # skip polls which are already overdue instead of bursting
+            now = monotonic()
+            n = max(n, int((now - start) / self.interval) + 1)
+            self._stop.wait(start + n * self.interval - now)
+
+    def _query(self, command):
+        """
+        Send a command whose response is published by the scheduler only.
+        """
+        try:
+            return self.server.commands.query(
+                command, self.server.COMMAND_TIMEOUT, passthrough=False)
+        except DAQTimeoutError as e:
+            self.logger.warning(str(e))
+            return None
+
+    def poll_scalars(self):
+        """
+        Read the scalars and publish them as COUNTER record.
+
+        :returns: Record or None -- the published record
+        """
+        reply = self._query('DS')
+        if reply is None:
+            return None
+        delta_time = None
+        if self.previous_poll is not None:
+            delta_time = reply.received_monotonic - self.previous_poll
+        self.previous_poll = reply.received_monotonic
+        return self.server.publish(RecordType.COUNTER,
+                                   CountRecord(reply.response[0], delta_time),
+                                   reply.received, reply.received_monotonic)
+
+    def poll_environment(self):
+        """
+        Read temperature and pressure and publish them.
+
+        :returns: None
+        """
+        reply = self._query('TH')
+        if reply is not None:
+            self.server.publish(RecordType.TEMPERATURE,
+                                TemperatureRecord(reply.response[0]),
+                                reply.received, reply.received_monotonic)
+        reply = self._query('BA')
+        if reply is not None:
+            # pressure in counts and in mBar, skip the calibration message
+            for line in (reply.response[0], reply.response[-1]):
+                self.server.publish(RecordType.PRESSURE, PressureRecord(line),
+                                    reply.received, reply.received_monotonic)
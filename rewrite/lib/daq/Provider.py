@@ -2,26 +2,59 @@ import logging
 import re
 import multiprocessing as mp
 import queue
-from .Connection import DAQConnection
+import threading
+from collections import deque, namedtuple
+from .Connection import DAQConnection, decode_chunk
+from .RingBuffer import SharedRingBuffer
 
 from .Exceptions import DAQIOError, DAQMissingDependencyError
 
+# a line from the DAQ card with the unix and monotonic time it was read
+ReceivedLine = namedtuple("ReceivedLine",
+                          ["line", "received", "received_monotonic"])
+
 
 class DAQProvider(object):
     """
     Class providing the public API and helpers for the communication with the DAQ card
+
+    :param logger: logger object
+    :type logger: logging.Logger
+    :param read_mode: read mode of the serial connection, 'select' or 'poll'
+    :type read_mode: str
+    :param transport: how lines get from the reader process to the consumer.
+                      'queue' uses a multiprocessing.Queue, 'shm' a
+                      SharedRingBuffer which can be drained in batches
+    :type transport: str
+    :param buffer_size: size of the shared memory ring buffer in bytes,
+                        must be larger than DAQConnection.MAX_CHUNK_SIZE
+    :type buffer_size: int
     """
 
     LINE_PATTERN = re.compile("^[a-zA-Z0-9+-.,:()=$/#?!%_@*|~' ]*[\n\r]*$")
 
-    def __init__(self, logger=None):
+    TRANSPORTS = ("queue", "shm")
+
+    def __init__(self, logger=None, read_mode="select", transport="queue",
+                 buffer_size=1 << 20):
         if logger is None:
             logger = logging.getLogger()
         self.logger = logger
-        self.out_queue = mp.Queue()
+        if transport not in self.TRANSPORTS:
+            raise ValueError(f"Unknown transport '{transport}'")
+        self.transport = transport
+        if transport == "shm":
+            self.out_queue = SharedRingBuffer(buffer_size)
+        else:
+            self.out_queue = mp.Queue()
         self.in_queue = mp.Queue()
+        # lines of chunks which were taken from the out queue but not
+        # returned yet
+        self.received = deque()
+        self.received_lock = threading.Lock()
 
-        self.daq = DAQConnection(self.in_queue, self.out_queue, self.logger)
+        self.daq = DAQConnection(self.in_queue, self.out_queue, self.logger,
+                                 read_mode=read_mode)
 
         # Set up the thread to do asynchronous I/O. More can be made if
         # necessary. Set daemon flag so that the threads finish when the main
@@ -45,11 +78,73 @@ class DAQProvider(object):
         :returns: str or None -- next item from the queue
         :raises: DAQIOError
         """
-        try:
-            line = self.out_queue.get(*args)
-        except queue.Empty:
-            raise DAQIOError("Queue is empty")
-        return self.validate_line(line)
+        with self.received_lock:
+            while not self.received:
+                try:
+                    self._unpack(self.out_queue.get(*args))
+                except queue.Empty:
+                    raise DAQIOError("Queue is empty")
+            return self.validate_line(self.received.popleft().line)
+
+    def _unpack(self, chunk):
+        """
+        Split a chunk from the reader into lines.
+        """
+        received, received_monotonic, lines = decode_chunk(chunk)
+        self.received.extend(ReceivedLine(line, received, received_monotonic)
+                             for line in lines)
+
+    def receive(self, timeout=None, max_items=None):
+        """
+        Get all lines currently waiting together with the time they were
+        read from the port, blocking until at least one line arrives or
+        timeout seconds have passed. Invalid lines are dropped.
+
+        :param timeout: maximum time to wait in seconds, None waits forever
+        :type timeout: float
+        :param max_items: maximum number of lines to return
+        :type max_items: int
+        :returns: list of ReceivedLine -- may be empty if the timeout expired
+        """
+        with self.received_lock:
+            return self._receive(timeout, max_items)
+
+    def _receive(self, timeout, max_items):
+        if not self.received:
+            if self.transport == "shm":
+                chunks = self.out_queue.get_many(timeout=timeout)
+            else:
+                chunks = []
+                try:
+                    chunks.append(self.out_queue.get(True, timeout))
+                    while True:
+                        chunks.append(self.out_queue.get_nowait())
+                except queue.Empty:
+                    pass
+            for chunk in chunks:
+                self._unpack(chunk)
+        count = len(self.received)
+        if max_items is not None:
+            count = min(count, max_items)
+        lines = []
+        for _ in range(count):
+            received = self.received.popleft()
+            if self.validate_line(received.line) is not None:
+                lines.append(received)
+        return lines
+
+    def get_many(self, timeout=None, max_items=None):
+        """
+        Get all lines currently waiting, blocking until at least one line
+        arrives or timeout seconds have passed. Invalid lines are dropped.
+
+        :param timeout: maximum time to wait in seconds, None waits forever
+        :type timeout: float
+        :param max_items: maximum number of lines to return
+        :type max_items: int
+        :returns: list of bytes -- may be empty if the timeout expired
+        """
+        return [received.line for received in self.receive(timeout, max_items)]
 
     def put(self, *args):
         """
@@ -61,12 +156,23 @@ class DAQProvider(object):
         """
         self.in_queue.put(*args)
 
+    def close(self):
+        """
+        Free the resources of the transport.
+
+        :returns: None
+        """
+        if self.transport == "shm":
+            self.out_queue.close()
+
     def data_available(self):
         """
         Tests if data is available from the DAQ card.
 
         :returns: int or bool
         """
+        if self.received:
+            return len(self.received)
         try:
             size = self.out_queue.qsize()
         except NotImplementedError:
@@ -83,8 +189,12 @@ class DAQProvider(object):
         :type line: str
         :returns: str or None
         """
-        if self.LINE_PATTERN.match(line.decode("ascii")) is None:
-            line = line.rstrip('\r\n')
+        try:
+            valid = self.LINE_PATTERN.match(line.decode("ascii")) is not None
+        except UnicodeDecodeError:
+            valid = False
+        if not valid:
+            line = line.rstrip(b'\r\n')
             self.logger.warning(f"Got invalid data from the DAQ card: {line}")
             return None
         return line
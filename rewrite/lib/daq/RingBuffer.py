@@ -0,0 +1,238 @@
+"""
+Shared memory transport between the serial reader process and the DAQ server
+"""
+import multiprocessing as mp
+import queue
+import struct
+from time import monotonic
+
+from .Exceptions import DAQMissingDependencyError
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python < 3.8
+    shared_memory = None
+
+# write position, read position, written frames, read frames
+HEADER = struct.Struct("<QQQQ")
+FRAME_HEADER = struct.Struct("<I")
+
+
+class SharedRingBuffer(object):
+    """
+    A ring buffer of length framed byte strings in shared memory.
+
+    Each line is stored as a 4 byte length followed by the line itself.
+    Frames may wrap around the end of the buffer. Positions in the header
+    are absolute byte counters, so the fill level is always
+    write position - read position.
+
+    The producer can push a whole chunk of lines with one lock acquisition
+    and the consumer can drain everything that is waiting in one batch.
+    An event is set whenever data is written, so a consumer waiting for data
+    wakes up immediately instead of polling. The buffer also provides the
+    put/get/qsize/empty subset of the multiprocessing.Queue API.
+
+    Raises DAQMissingDependencyError if multiprocessing.shared_memory is not
+    available (Python < 3.8).
+
+    :param size: size of the data area in bytes
+    :type size: int
+    :raises: DAQMissingDependencyError
+    """
+
+    def __init__(self, size=1 << 20):
+        if shared_memory is None:
+            raise DAQMissingDependencyError(
+                "The shared memory transport needs Python 3.8 or newer")
+        self.size = size
+        self._shm = shared_memory.SharedMemory(create=True,
+                                               size=HEADER.size + size)
+        HEADER.pack_into(self._shm.buf, 0, 0, 0, 0, 0)
+        self._lock = mp.Lock()
+        self._not_empty = mp.Event()
+        self._not_full = mp.Event()
+
+    @property
+    def name(self):
+        """
+        Name of the shared memory block
+
+        :returns: str
+        """
+        return self._shm.name
+
+    def _copy_in(self, pos, data):
+        """
+        Copy data into the ring starting at the absolute position pos.
+        """
+        start = pos % self.size
+        first = min(len(data), self.size - start)
+        buf = self._shm.buf
+        buf[HEADER.size + start:HEADER.size + start + first] = data[:first]
+        if first < len(data):
+            buf[HEADER.size:HEADER.size + len(data) - first] = data[first:]
+
+    def _copy_out(self, pos, length):
+        """
+        Copy length bytes out of the ring starting at the absolute position pos.
+        """
+        start = pos % self.size
+        first = min(length, self.size - start)
+        buf = self._shm.buf
+        data = bytes(buf[HEADER.size + start:HEADER.size + start + first])
+        if first < length:
+            data += bytes(buf[HEADER.size:HEADER.size + length - first])
+        return data
+
+    def put_many(self, lines, block=True, timeout=None):
+        """
+        Append lines to the buffer. If there is not enough space, wait for
+        the consumer to make room.
+
+        Raises ValueError if a single line does not fit into the buffer and
+        queue.Full if there is no room after timeout seconds.
+
+        :param lines: lines to append
+        :type lines: list of bytes
+        :param block: wait for free space
+        :type block: bool
+        :param timeout: maximum time to wait in seconds
+        :type timeout: float
+        :raises: ValueError, queue.Full
+        :returns: None
+        """
+        frames = b"".join(FRAME_HEADER.pack(len(line)) + line
+                          for line in lines)
+        if len(frames) > self.size:
+            if len(lines) > 1:
+                for line in lines:
+                    self.put_many([line], block, timeout)
+                return
+            raise ValueError("Line does not fit into the ring buffer")
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            with self._lock:
+                write_pos, read_pos, written, read = HEADER.unpack_from(
+                    self._shm.buf, 0)
+                if self.size - (write_pos - read_pos) >= len(frames):
+                    self._copy_in(write_pos, frames)
+                    HEADER.pack_into(self._shm.buf, 0,
+                                     write_pos + len(frames), read_pos,
+                                     written + len(lines), read)
+                    self._not_empty.set()
+                    return
+                self._not_full.clear()
+            if not block:
+                raise queue.Full
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                raise queue.Full
+            self._not_full.wait(remaining)
+
+    def put(self, line, block=True, timeout=None):
+        """
+        Append a single line to the buffer.
+
+        :param line: line to append
+        :type line: bytes
+        :returns: None
+        """
+        self.put_many([line], block, timeout)
+
+    def wait(self, timeout=None):
+        """
+        Wait until data is available.
+
+        :param timeout: maximum time to wait in seconds
+        :type timeout: float
+        :returns: bool -- True if data is available
+        """
+        if self.qsize():
+            return True
+        return self._not_empty.wait(timeout) and bool(self.qsize())
+
+    def get_many(self, max_items=None, block=True, timeout=None):
+        """
+        Remove and return all waiting lines (at most max_items).
+
+        :param max_items: maximum number of lines to return
+        :type max_items: int
+        :param block: wait for data if the buffer is empty
+        :type block: bool
+        :param timeout: maximum time to wait in seconds
+        :type timeout: float
+        :returns: list of bytes -- empty if no data arrived in time
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            with self._lock:
+                # clear before reading the header, a concurrent put sets the
+                # event again, so no wakeup is lost
+                self._not_empty.clear()
+                write_pos, read_pos, written, read = HEADER.unpack_from(
+                    self._shm.buf, 0)
+                if written != read:
+                    count = written - read
+                    if max_items is not None:
+                        count = min(count, max_items)
+                    lines = []
+                    for _ in range(count):
+                        length = FRAME_HEADER.unpack(
+                            self._copy_out(read_pos, FRAME_HEADER.size))[0]
+                        lines.append(self._copy_out(
+                            read_pos + FRAME_HEADER.size, length))
+                        read_pos += FRAME_HEADER.size + length
+                    HEADER.pack_into(self._shm.buf, 0, write_pos, read_pos,
+                                     written, read + count)
+                    if read + count != written:
+                        self._not_empty.set()
+                    self._not_full.set()
+                    return lines
+            if not block:
+                return []
+            remaining = None if deadline is None else deadline - monotonic()
+            if remaining is not None and remaining <= 0:
+                return []
+            self._not_empty.wait(remaining)
+
+    def get(self, block=True, timeout=None):
+        """
+        Remove and return a single line.
+
+        Raises queue.Empty if there is no data.
+
+        :raises: queue.Empty
+        :returns: bytes
+        """
+        lines = self.get_many(1, block, timeout)
+        if not lines:
+            raise queue.Empty
+        return lines[0]
+
+    def qsize(self):
+        """
+        Number of lines waiting in the buffer
+
+        :returns: int
+        """
+        _, _, written, read = HEADER.unpack_from(self._shm.buf, 0)
+        return written - read
+
+    def empty(self):
+        """
+        :returns: bool -- True if no line is waiting
+        """
+        return self.qsize() == 0
+
+    def close(self):
+        """
+        Close the buffer and free the shared memory block.
+
+        :returns: None
+        """
+        self._shm.close()
+        try:
+            self._shm.unlink()
+        except FileNotFoundError:
+            pass
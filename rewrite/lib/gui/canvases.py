@@ -7,6 +7,9 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import numpy as np
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
 
+from ..analyzers.Histogram import Histogram
+from ..utils.RingHistory import RingHistory
+
 
 class MplCanvas(FigureCanvas):
     def __init__(self, parent=None, width=5, height=4, dpi=100):
@@ -97,6 +100,12 @@ class ScalarsCanvas(BasePlotCanvas):
     """
     A plot canvas to display scalars
 
+    The lines are created once and only get new data on updates. The rate
+    history is kept in a preallocated ring buffer and the lines are blitted
+    onto a cached background, the axes are only redrawn if their limits,
+    the legend or the visible lines change. Long histories are thinned out
+    to MAX_POINTS points, so an update does not get slower with max_length.
+
     :param parent: parent widget
     :param logger: logger object
     :type logger: logging.Logger
@@ -107,6 +116,8 @@ class ScalarsCanvas(BasePlotCanvas):
     DEFAULT_CHANNEL_CONFIG = [True, True, True, True]
     CHANNEL_COLORS = ["y", "m", "c", "b"]
     TRIGGER_COLOR = "g"
+    # longer histories are thinned out to about this number of points
+    MAX_POINTS = 500
 
     def __init__(self, parent, logger, max_length=40):
 
@@ -121,12 +132,51 @@ class ScalarsCanvas(BasePlotCanvas):
         )
         self.show_trigger = True
         self.max_length = max_length
-        self.channel_data = [[], [], [], []]
-        self.trigger_data = []
-        self.time_data = []
+        # time and rates of the four channels and the trigger
+        self.history = RingHistory(6, max_length)
         self.time_window = 0
+        self.updates = 0
+
+        self.lines = []
+        for ch in range(4):
+            self.lines.append(self.ax.plot(
+                [], [], c=self.CHANNEL_COLORS[ch], label=("ch%d" % ch),
+                lw=2, marker="v", animated=True)[0])
+        self.lines.append(self.ax.plot(
+            [], [], c=self.TRIGGER_COLOR, label="trg", lw=2, marker="x",
+            animated=True)[0])
+        self.ax.grid()
+        self.pending_text = self.ax.text(
+            0.5,
+            0.75,
+            "Measuring...",
+            horizontalalignment="center",
+            verticalalignment="center",
+            fontsize=56,
+            color="red",
+            fontweight="heavy",
+            alpha=0.8,
+            rotation=30,
+            transform=self.fig.transFigure,
+        )
+        self._visible = None
+        self._background = None
+        self.mpl_connect("draw_event", self._on_draw)
         self.reset()
 
+    def _on_draw(self, event):
+        """
+        Cache the background after every full redraw, e.g. after resizing,
+        and draw the lines onto it.
+
+        :param event: the draw event
+        :type event: matplotlib.backend_bases.DrawEvent
+        :returns: None
+        """
+        self._background = self.copy_from_bbox(self.ax.bbox)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+
     def reset(self, show_pending=False):
         """
         Reset all cached plot data
@@ -135,51 +185,69 @@ class ScalarsCanvas(BasePlotCanvas):
         :type show_pending: bool
         :returns: None
         """
-        self.ax.clear()
-        self.ax.grid()
-        self.ax.set_xlabel(self.xlabel)
-        self.ax.set_ylabel(self.ylabel)
+        self.history.clear()
+        self.time_window = 0
+        self.updates = 0
+        for line in self.lines:
+            line.set_data([], [])
         self.ax.set_xlim((self.xmin, self.xmax))
         self.ax.set_ylim((self.ymin, self.ymax))
+        self.pending_text.set_visible(not show_pending)
+        self.fig.canvas.draw()
 
-        self.channel_data = [[], [], [], []]
-        self.trigger_data = []
-        self.time_data = []
-        self.time_window = 0
-
-        for ch in range(4):
-            self.ax.plot(
-                self.time_data,
-                self.channel_data[ch],
-                c=self.CHANNEL_COLORS[ch],
-                label=("ch%d" % ch),
-                lw=3,
-            )
-        if self.show_trigger:
-            self.ax.plot(
-                self.time_data, self.trigger_data, c="g", label="trigger", lw=3
-            )
+    def _update_legend(self, visible):
+        """
+        Show the lines which are enabled and a legend for them.
 
-        if not show_pending:
-            left, width = 0.25, 0.5
-            bottom, height = 0.35, 0.8
-            right = left + width
-            top = bottom + height
-            self.ax.text(
-                0.5 * (left + right),
-                0.5 * (bottom + top),
-                "Measuring...",
-                horizontalalignment="center",
-                verticalalignment="center",
-                fontsize=56,
-                color="red",
-                fontweight="heavy",
-                alpha=0.8,
-                rotation=30,
-                transform=self.fig.transFigure,
+        :param visible: visibility of the four channels and the trigger
+        :type visible: list of bool
+        :returns: None
+        """
+        for line, show in zip(self.lines, visible):
+            line.set_visible(show)
+        try:
+            self.ax.legend(
+                [line for line in self.lines if line.get_visible()],
+                [line.get_label() for line in self.lines
+                 if line.get_visible()],
+                bbox_to_anchor=(0.0, 1.02, 1.0, 0.102),
+                loc=3,
+                ncol=max(sum(visible), 1),
+                mode="expand",
+                borderaxespad=0.0,
+                handlelength=2,
             )
+        except Exception as e:
+            self.logger.info("An error with the legend occurred: %s" % e)
+            self.ax.legend(loc=2)
 
-        self.fig.canvas.draw()
+    def _update_limits(self, times, rates):
+        """
+        Adjust the axes limits if the lines do not fit anymore. The limits
+        get some headroom, so they do not change on every update.
+
+        :param times: times of the history
+        :type times: numpy.ndarray
+        :param rates: rates of the visible lines
+        :type rates: numpy.ndarray
+        :returns: bool -- True if the limits changed
+        """
+        changed = False
+        # do not set x-range if time_data consists of only one item to
+        # avoid matlibplot UserWarning
+        xmin, xmax = self.ax.get_xlim()
+        if len(times) > 1 and (times[-1] > xmax or times[0] > xmin +
+                               0.5 * (xmax - xmin)):
+            span = times[-1] - times[0]
+            self.ax.set_xlim(times[0], times[-1] + 0.25 * span)
+            changed = True
+
+        ymax = self.ax.get_ylim()[1]
+        ma = rates.max() if rates.size else 0
+        if ma > ymax or 0 < ma < 0.5 * ymax:
+            self.ax.set_ylim(0, ma * 1.25)
+            changed = True
+        return changed
 
     def update_plot(
         self, data, show_trigger=True, enabled_channels=DEFAULT_CHANNEL_CONFIG
@@ -195,83 +263,42 @@ class ScalarsCanvas(BasePlotCanvas):
         :type enabled_channels: list of bool
         :returne: None
         """
-        # do a complete redraw of the plot to avoid memory leak!
-        self.ax.clear()
         self.show_trigger = show_trigger
-
-        self.ax.grid()
-        self.ax.set_xlabel(self.xlabel)
-        self.ax.set_ylabel(self.ylabel)
-
         self.logger.debug("result : %s" % data)
 
-        # update lines data using the lists with new data
+        # update lines data using the ring buffer with new data
         self.time_window += data[5]
-        self.time_data.append(self.time_window)
-
-        for ch in range(4):
-            self.channel_data[ch].append(data[ch])
-            if enabled_channels[ch]:
-                self.ax.plot(
-                    self.time_data,
-                    self.channel_data[ch],
-                    c=self.CHANNEL_COLORS[ch],
-                    label=("ch%d" % ch),
-                    lw=2,
-                    marker="v",
-                )
-
-        self.trigger_data.append(data[4])
-
-        if self.show_trigger:
-            self.ax.plot(
-                self.time_data,
-                self.trigger_data,
-                c=self.TRIGGER_COLOR,
-                label="trg",
-                lw=2,
-                marker="x",
-            )
-
-        try:
-            # get count of active cannels
-            channels = enabled_channels + [show_trigger]
-            active_count = sum(channels)
-
-            self.ax.legend(
-                bbox_to_anchor=(0.0, 1.02, 1.0, 0.102),
-                loc=3,
-                ncol=active_count,
-                mode="expand",
-                borderaxespad=0.0,
-                handlelength=2,
-            )
-        except Exception as e:
-            self.logger.info("An error with the legend occurred: %s" % e)
-            self.ax.legend(loc=2)
-
-        if len(self.channel_data[0]) > self.max_length:
-            for ch in range(4):
-                self.channel_data[ch].remove(self.channel_data[ch][0])
-            self.trigger_data.remove(self.trigger_data[0])
-            self.time_data.remove(self.time_data[0])
-
-        ma = max(
-            max(self.channel_data[0]),
-            max(self.channel_data[1]),
-            max(self.channel_data[2]),
-            max(self.channel_data[3]),
-            max(self.trigger_data),
-        )
-
-        self.ax.set_ylim(0, ma * 1.1)
-
-        # do not set x-range if time_data consists of only one item to
-        # avoid matlibplot UserWarning
-        if len(self.time_data) > 1:
-            self.ax.set_xlim(self.time_data[0], self.time_data[-1])
-
-        self.fig.canvas.draw()
+        self.history.append((self.time_window,) + tuple(data[:5]))
+        self.updates += 1
+        history = self.history.view()
+        times = history[0]
+
+        # there are not more pixels than points anyway, the points drawn
+        # are fixed to the update count, so they do not jump when scrolling
+        step = len(times) // self.MAX_POINTS + 1
+        first = -(self.updates - len(times)) % step
+        for ch, line in enumerate(self.lines):
+            line.set_data(times[first::step], history[ch + 1, first::step])
+
+        visible = list(enabled_channels) + [show_trigger]
+        redraw = self.pending_text.get_visible()
+        self.pending_text.set_visible(False)
+        if visible != self._visible:
+            self._visible = visible
+            self._update_legend(visible)
+            redraw = True
+        rows = [ch + 1 for ch, show in enumerate(visible) if show]
+        if self._update_limits(times, history[rows]):
+            redraw = True
+
+        if redraw or self._background is None:
+            # _on_draw blits the lines
+            self.fig.canvas.draw()
+            return
+        self.restore_region(self._background)
+        for line in self.lines:
+            self.ax.draw_artist(line)
+        self.blit(self.ax.bbox)
 
 
 class BaseHistogramCanvas(BasePlotCanvas):
@@ -292,23 +319,60 @@ class BaseHistogramCanvas(BasePlotCanvas):
     def __init__(self, parent, logger, binning, hist_color="b", **kwargs):
         BasePlotCanvas.__init__(self, parent, logger, **kwargs)
 
-        # setup binning
+        # setup binning, the counts are kept in the histogram
         self.binning = np.asarray(binning)
-        self.bincontent = np.zeros(len(self.binning))
-        self.hist_patches = self.ax.hist(
-            np.array([self.binning[0] - 1]), self.binning, fc=hist_color, alpha=0.25
-        )[2]
-        self.heights = []
+        self.histogram = Histogram(self.binning)
+        self.hist_color = hist_color
         self.dimension = r"$\mu$s"
 
-        # FIXME the current implementation does not know about outliers
-        self.underflow = 0
-        # FIXME the current implementation does not know about outliers
-        self.overflow = 0
-
         # fixed xrange for histogram
         self.xmin = self.binning[0]
         self.xmax = self.binning[-1] + (self.binning[:-1] - self.binning[1:])[-1]
+        self._draw_histogram()
+
+    @property
+    def heights(self):
+        """
+        The bin contents
+
+        :returns: numpy.ndarray
+        """
+        return self.histogram.counts
+
+    @property
+    def underflow(self):
+        """
+        Number of values below the first bin
+
+        :returns: int
+        """
+        return self.histogram.underflow
+
+    @property
+    def overflow(self):
+        """
+        Number of values above the last bin
+
+        :returns: int
+        """
+        return self.histogram.overflow
+
+    def _draw_histogram(self):
+        """
+        Draw all bins with one bar and one errorbar artist, so drawing
+        does not get slower with the number of events.
+
+        :returns: None
+        """
+        counts = self.histogram.counts
+        errors = self.histogram.errors
+        self.hist_bars = self.ax.bar(self.binning[:-1], counts,
+                                     width=self.histogram.widths,
+                                     align="edge", fc=self.hist_color,
+                                     alpha=0.25)
+        self.hist_errors = self.ax.errorbar(self.histogram.centers, counts,
+                                            yerr=errors, fmt="none",
+                                            color=self.hist_color)
 
     def update_plot(self, data):
         """
@@ -318,62 +382,26 @@ class BaseHistogramCanvas(BasePlotCanvas):
         :type data: list of lists
         :return: None
         """
-        if not data:
+        if not len(data):
             return
 
+        self.histogram.fill(data)
+        self.logger.debug("Histogram bin contents %s" % self.heights)
+
         # avoid memory leak
         self.ax.clear()
         if self.title is not None:
             self.ax.set_title(self.title)
-
-        # we have to do some bad hacking here,
-        # because the p histogram is rather
-        # simple and it is not possible to add two of them...
-        # however, since we do not want to run into a memory leak
-        # and we also be not dependent on dashi (but maybe
-        # sometimes in the future?) we have to do it
-        # by manipulating rectangles...
-
-        # we want to find the non-empty bins
-        # tmp_hist is compatible with the decay_time hist...
-        tmp_hist = self.ax.hist(data, self.binning, fc="b", alpha=0.25)[0]
-
-        for hist_bin in enumerate(tmp_hist):
-            if hist_bin[1]:
-                self.hist_patches[hist_bin[0]].set_height(
-                    self.hist_patches[hist_bin[0]].get_height() + hist_bin[1]
-                )
-
-        # we want to get the maximum for the ylims
-        # self.heights contains the bincontent!
-
-        self.heights = []
-        for patch in self.hist_patches:
-            self.heights.append(patch.get_height())
-
-        self.logger.debug("Histogram patch heights %s" % self.heights)
-        self.ax.set_ylim(ymax=max([h + np.sqrt(h) for h in self.heights]) * 1.1)
-        self.ax.set_ylim(ymin=0)
+        self._draw_histogram()
+        self.ax.set_ylim(ymin=0, ymax=max(np.max(self.heights +
+                                                 self.histogram.errors),
+                                          1) * 1.1)
         self.ax.set_xlabel(self.xlabel)
         self.ax.set_ylabel(self.ylabel)
         self.ax.set_xlim(xmin=self.xmin, xmax=self.xmax)
 
-        # always get rid of unused stuff
-        del tmp_hist
-
-        # try to add errorbars
-        bincenters = (self.binning[1:] + self.binning[:-1]) / 2.0
-        binwidth = (self.xmax - self.xmin) / (self.binning[1] - self.binning[0])
-        for i, height in enumerate(self.heights):
-            self.ax.errorbar(bincenters[i], height, yerr=np.sqrt(height), color="b")
-            self.ax.bar(bincenters[i], height, width=3.4,  color='skyblue')
-
         # some beautification
         self.ax.grid()
-
-        # we now have to pass our new patches
-        # to the figure we created..
-        #self.ax.patches = self.hist_patches
         self.fig.canvas.draw()
 
     def show_fit(
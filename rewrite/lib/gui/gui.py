@@ -6,13 +6,11 @@ from PyQt5.QtGui import QTextCursor
 import sys
 import os
 import threading
-from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
 import pathlib
 import multiprocessing
 import subprocess
 import logging
 import datetime
-import jsonpickle
 import numpy as np
 from time import time, sleep
 import zmq
@@ -20,6 +18,11 @@ from ..analyzers.VelocityTrigger import VelocityTrigger
 from ..analyzers.DecayTrigger import DecayTriggerThorough
 from ..analyzers.PulseAnalyzer import PulseAnalyzer
 from ..analyzers.fit import gaussian_fit
+from ..common.Record import RecordType
+from ..common.WireFormat import decode_record
+from ..utils.Stream import connect_subscriber, recv_record
+from ..utils.RecordDispatcher import RecordDispatcher
+from ..utils.GroupCommitWriter import GroupCommitWriter
 
 # from src_bak.muonic3.gui.plot_canvases import PulseWidthCanvas
 from ..daq.DAQServer import DAQServer
@@ -60,10 +63,11 @@ class PulseWorker(QObject):
     progressBar = pyqtSignal(float)
     daq_time = 0.5
 
-    def __init__(self, server):
+    def __init__(self, server, dispatcher=None):
         QObject.__init__(self)
         self._DAQServer = server
-        self._PulseAnalyzer = PulseAnalyzer(logger=None, headless=False)
+        self._PulseAnalyzer = PulseAnalyzer(logger=None, headless=False,
+                                            dispatcher=dispatcher)
         self._PulseAnalyzer.server = self._DAQServer
         self._PulseAnalyzer.progress = self.progress
         self._PulseAnalyzer.finished = self.finished
@@ -78,10 +82,11 @@ class VelocityWorker(QObject):
     progressBar = pyqtSignal(float)
     daq_time = 0.5
 
-    def __init__(self, server):
+    def __init__(self, server, dispatcher=None):
         QObject.__init__(self)
         self._DAQServer = server
-        self._PulseAnalyzer = PulseAnalyzer(logger=None, headless=False)
+        self._PulseAnalyzer = PulseAnalyzer(logger=None, headless=False,
+                                            dispatcher=dispatcher)
         self._PulseAnalyzer.server = self._DAQServer
         self._PulseAnalyzer.progress = self.progress
         self._PulseAnalyzer.finished = self.finished
@@ -97,10 +102,11 @@ class LifetimeWorker(QObject):
     progressBar = pyqtSignal(float)
     daq_time = 0.5
 
-    def __init__(self, server):
+    def __init__(self, server, dispatcher=None):
         QObject.__init__(self)
         self._DAQServer = server
-        self._PulseAnalyzer = PulseAnalyzer(logger=None, headless=False)
+        self._PulseAnalyzer = PulseAnalyzer(logger=None, headless=False,
+                                            dispatcher=dispatcher)
         self._PulseAnalyzer.server = self._DAQServer
         self._PulseAnalyzer.progress = self.progress
         self._PulseAnalyzer.finished = self.finished
@@ -112,46 +118,37 @@ class LifetimeWorker(QObject):
 class DAQOutputWorker(QObject):
     i = 0
     progress = pyqtSignal(str)
-    def __init__(self, server, output):
+    def __init__(self, server, output, dispatcher):
         QObject.__init__(self)
         self._DAQServer = server
         self.output = output
-        self.ctx = zmq.Context()
-        self.sock = self.ctx.socket(zmq.SUB)
-        self.sock.connect("tcp://127.0.0.1:1234")
-        self.sock.subscribe("")
+        self.consumer = dispatcher.register(name="DAQ output")
 
     def run(self):
-        while True:
-            msg = self.sock.recv_string()
-            obj = jsonpickle.decode(msg)
+        for obj in self.consumer:
             #print(f"OBJ Type: {type(obj)}")
             text = str(obj)
             if text != "":
                 self.progress.emit(text + '\n')
 
 class DAQOutputWriter(QObject):
-    def __init__(self, server):
+    def __init__(self, server, dispatcher):
         QObject.__init__(self)
         self._DAQServer = server
-        self.ctx  = zmq.Context()
-        self.sock = self.ctx.socket(zmq.SUB)
-        self.sock.connect("tcp://127.0.0.1:1234")
-        self.sock.subscribe("")
-        self.file = open(f"{getCurrentTimeString()}_RAW.txt", "w")
+        self.consumer = dispatcher.register(name="raw file writer")
+        self.file = GroupCommitWriter(f"{getCurrentTimeString()}_RAW.txt",
+                                      "w")
 
     def run(self):
-        while True:
-            msg = self.sock.recv_string()
-            obj = jsonpickle.decode(msg)
+        for obj in self.consumer:
             #print(f"OBJ Type: {type(obj)}")
             text = str(obj)
             if text != "":
                 self.file.write(text + '\n')
-                self.file.flush()
+        # the consumer ends when the dispatcher is stopped
+        self.file.close()
 
 class Ui(QtWidgets.QMainWindow):
-    serverTask = threading.Thread()
     SCALAR_BUF_SIZE = 5
 
     def __init__(self):
@@ -514,8 +511,13 @@ class Ui(QtWidgets.QMainWindow):
         except zmq.error.ZMQError:
             print("reusing old server")
 
+        # receives and decodes the records once for all consumers
+        self.dispatcher = RecordDispatcher()
+        self.dispatcher.start()
+
         self.DAQThread = QThread()
-        self.DAQWorker = DAQOutputWorker(self._DAQServer, self.DAQOutput)
+        self.DAQWorker = DAQOutputWorker(self._DAQServer, self.DAQOutput,
+                                         self.dispatcher)
         self.DAQWorker.moveToThread(self.DAQThread)
 
         self.DAQThread.started.connect(self.DAQWorker.run)
@@ -538,21 +540,13 @@ class Ui(QtWidgets.QMainWindow):
         if hasattr(self,"DAQWriteThread"):
             return
         self.DAQWriteThread = QThread()
-        self.DAQOutputWriter = DAQOutputWriter(self._DAQServer)
+        self.DAQOutputWriter = DAQOutputWriter(self._DAQServer,
+                                               self.dispatcher)
         self.DAQOutputWriter.moveToThread(self.DAQWriteThread)
         self.DAQWriteThread.started.connect(self.DAQOutputWriter.run)
         self.DAQWriteThread.start()
 
 
-    def shutdownDAQServer(self):
-        print("shutdown task")
-        self._DAQServer.shutdown()
-
-    def startDAQServer(self):
-        self._DAQServer.register_introspection_functions()
-        self._DAQServer.register_instance(DAQServer())
-        self._DAQServer.serve_forever()
-
     def getCoincidence(self):
         if self.OpenStudiesSingleCoincidence.isChecked():
             self.coincidence = "single"
@@ -628,10 +622,9 @@ class Ui(QtWidgets.QMainWindow):
 
         self.getCoincidence()
         self.setupChannels()
-        self._DAQServer.do("DC")
         self._DAQServer.do("CE")
-        self._DAQServer.do("WC 03 04")
-        self._DAQServer.do("WC 02 0A")
+        self._DAQServer.write_register(3, 0x04)
+        self._DAQServer.write_register(2, 0x0A)
 
         self.threadRate = QThread()
 
@@ -797,7 +790,7 @@ class Ui(QtWidgets.QMainWindow):
 
         self.lastUpdatePulse = time()
         self.threadPulse = QThread()
-        self.workerPulse = PulseWorker(self._DAQServer)
+        self.workerPulse = PulseWorker(self._DAQServer, self.dispatcher)
         self.daq_timePulse = self.OpenStudiesMeasurementTime.value()
         self.workerPulse.daq_time = self.daq_timePulse
         self.workerPulse.moveToThread(self.threadPulse)
@@ -945,7 +938,7 @@ class Ui(QtWidgets.QMainWindow):
         self.setupVelocityChannels()
 
         self.thread = QThread()
-        self.worker = VelocityWorker(self._DAQServer)
+        self.worker = VelocityWorker(self._DAQServer, self.dispatcher)
         self.worker.daq_time = float(self.velocityMeasTime.value())
         self.worker.moveToThread(self.thread)
 
@@ -1105,15 +1098,14 @@ class Ui(QtWidgets.QMainWindow):
         self.startOutputWrite()
          # configure DAQ card with coincidence/veto settings
         self.setupLifetimeChannels()
-        self._DAQServer.do("DC")
         self._DAQServer.do("CE")
-        self._DAQServer.do("WC 03 04")
-        self._DAQServer.do("WC 02 0A")
+        self._DAQServer.write_register(3, 0x04)
+        self._DAQServer.write_register(2, 0x0A)
 
         # this should set the veto to none (because we have a
         # software veto) and the coincidence to single,
         # so we take all pulses
-        self._DAQServer.do("WC 00 0F")
+        self._DAQServer.write_register(0, 0x0F)
 
         self.start_time = getLocalTime()
         self.mu_file.open("a")
@@ -1122,7 +1114,7 @@ class Ui(QtWidgets.QMainWindow):
 
 
         self.thread = QThread()
-        self.worker = LifetimeWorker(self._DAQServer)
+        self.worker = LifetimeWorker(self._DAQServer, self.dispatcher)
         self.worker.daq_time = float(self.LifetimeMeasurementTime.value())
         self.worker.moveToThread(self.thread)
 
@@ -1205,8 +1197,8 @@ class Ui(QtWidgets.QMainWindow):
         self.measurement_duration += stop_time - self.start_time
 
         # reset coincidence times
-        self._DAQServer.do("WC 03 " + self.previous_coinc_time_03)
-        self._DAQServer.do("WC 02 " + self.previous_coinc_time_02)
+        self._DAQServer.write_register(3, int(self.previous_coinc_time_03, 16))
+        self._DAQServer.write_register(2, int(self.previous_coinc_time_02, 16))
 
         logging.getLogger().info("Muon decay mode now deactivated, returning to " +
                          "previous setting (if available)")
@@ -1249,14 +1241,14 @@ class Ui(QtWidgets.QMainWindow):
         except zmq.error.ZMQError:
             print("reusing old server")
         self.ctx = zmq.Context()
-        self.sock = self.ctx.socket(zmq.SUB)
-        self.sock.connect("tcp://127.0.0.1:1234")
-        self.sock.subscribe("")
+        self.sock = connect_subscriber(self.ctx, [RecordType.GPS])
         self._DAQServer.get_gps_info()
-        msg = self.sock.recv_string()
-        obj = jsonpickle.decode(msg)
+        obj = recv_record(self.sock)
         print(f"Got GPS: {obj}")
-        obj = jsonpickle.decode(obj.payload)
+        obj = obj.payload
+        if isinstance(obj, str):
+            # GPS records of older servers carry a jsonpickle encoded payload
+            obj = decode_record(obj)
 
         self.GPSDateTime.setText(str(obj.GPSDateTime))
         self.Status.setText(str(obj.Status))
@@ -1274,13 +1266,13 @@ class Ui(QtWidgets.QMainWindow):
         self.DAQOutput.moveCursor(QTextCursor.End)
         self.DAQOutput.insertPlainText(msg)
 
-class RequestHandler(SimpleXMLRPCRequestHandler):
-    """
-    Adapter Class for xmlrpc
-    """
-
-    rpc_paths = ("/RPC2",)
-
+    def closeEvent(self, event):
+        # ends the consumers, the raw file writer then closes its file
+        self.dispatcher.stop()
+        if hasattr(self, "DAQWriteThread"):
+            self.DAQWriteThread.quit()
+            self.DAQWriteThread.wait()
+        super(Ui, self).closeEvent(event)
 
 # app = QtWidgets.QApplication(sys.argv)
 # window = Ui()
@@ -3,7 +3,8 @@ import datetime
 import time
 from .util import WrappedFile
 from .canvases import ScalarsCanvas
-from ..utils.Time import getLocalTime
+from ..utils.Time import getLocalTime, get_hours_from_duration
+from ..utils.WrappedFile import rename_muonic_file
 class BaseWidget(QtWidgets.QWidget):
     """
     Base widget class
@@ -0,0 +1,283 @@
+"""
+Compressed raw data archive with a time index.
+
+The ArchiveWriter stores records as jsonpickle lines, like the
+WriterToFile, in gzip compressed segments. A new segment is started every
+hour and when a segment reaches its maximum size. Every segment is a
+series of gzip members of about block_size characters each, so it can be
+read with gzip.open (and the analysis scripts) as a whole, but a single
+block can also be decompressed on its own.
+
+For every block a line is appended to the index next to the segments::
+
+    {"segment": "2024-06-24_10-15-00_F_0003.txt.gz", "offset": 1048321,
+     "size": 98304, "records": 8192, "first_time": 1719224100.5,
+     "last_time": 1719224161.2, "first_package": 120001,
+     "last_package": 128192}
+
+The ArchiveReader uses the index to read only the blocks of a time range
+or of a package number.
+"""
+import gzip
+import json
+import logging
+import os
+from datetime import datetime
+
+import jsonpickle
+
+from ..common.WireFormat import decode_record
+
+INDEX_SUFFIX = ".idx"
+SEGMENT_SUFFIX = ".txt.gz"
+
+
+class ArchiveWriter(object):
+    """
+    Writes records to rotating, gzip compressed segments and indexes every
+    compressed block.
+
+    A block is compressed and written when it holds block_size characters,
+    when it spans block_interval seconds of record time, on flush() and on
+    close(). Records of an unfinished block are lost on a crash, the
+    blocks written before stay readable.
+
+    Can be used as context manager.
+
+    :param prefix: path of the archive, the segments are named
+                   <prefix>_<number>.txt.gz and the index <prefix>.idx,
+                   <start time>_F if None
+    :type prefix: str
+    :param max_segment_size: compressed bytes after which a new segment is
+                             started
+    :type max_segment_size: int
+    :param hourly: start a new segment with every hour of record time
+    :type hourly: bool
+    :param block_size: uncompressed characters per block
+    :type block_size: int
+    :param block_interval: maximum seconds of record time per block
+    :type block_interval: float
+    :param compresslevel: gzip compression level
+    :type compresslevel: int
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    def __init__(self, prefix=None, max_segment_size=64 << 20, hourly=True,
+                 block_size=1 << 20, block_interval=60.0, compresslevel=6,
+                 logger=None):
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        if prefix is None:
+            prefix = datetime.now().strftime("%Y-%m-%d_%H-%M-%S") + "_F"
+        self.prefix = prefix
+        self.max_segment_size = max_segment_size
+        self.hourly = hourly
+        self.block_size = block_size
+        self.block_interval = block_interval
+        self.compresslevel = compresslevel
+        self.index_filename = prefix + INDEX_SUFFIX
+        self.index = open(self.index_filename, "a")
+        self.closed = False
+        # number of the next segment, the current segment and its hour
+        self.segments = 0
+        self.segment = None
+        self.segment_filename = None
+        self._hour = None
+        self._reset_block()
+
+    def _reset_block(self):
+        self._lines = []
+        self._size = 0
+        self._first_time = None
+        self._last_time = None
+        self._first_package = None
+        self._last_package = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _open_segment(self):
+        self.segment_filename = "%s_%04d%s" % (self.prefix, self.segments,
+                                               SEGMENT_SUFFIX)
+        self.segments += 1
+        self.segment = open(self.segment_filename, "ab")
+        self.logger.info("Writing archive segment %s" %
+                         self.segment_filename)
+
+    def _close_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.segment = None
+
+    def write(self, records):
+        """
+        Add records to the archive.
+
+        :param records: the records
+        :type records: list of Record
+        :raises: ValueError
+        :returns: None
+        """
+        if self.closed:
+            raise ValueError("write to closed ArchiveWriter")
+        for rec in records:
+            timestamp = rec.timestamp
+            if timestamp is not None:
+                hour = int(timestamp // 3600)
+                if self.hourly and self._hour is not None and \
+                        hour != self._hour:
+                    # the new hour starts a new segment
+                    self.flush()
+                    self._close_segment()
+                if self._lines and self._first_time is not None and \
+                        timestamp - self._first_time >= self.block_interval:
+                    self.flush()
+                self._hour = hour
+                if self._first_time is None:
+                    self._first_time = timestamp
+                self._last_time = timestamp
+            if rec.packageNumber is not None:
+                if self._first_package is None:
+                    self._first_package = rec.packageNumber
+                self._last_package = rec.packageNumber
+            line = jsonpickle.encode(rec) + "\n"
+            self._lines.append(line)
+            self._size += len(line)
+            if self._size >= self.block_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Compress and write the current block and its index entry.
+
+        :returns: None
+        """
+        if not self._lines:
+            return
+        if self.segment is None:
+            self._open_segment()
+        data = gzip.compress("".join(self._lines).encode("utf-8"),
+                             self.compresslevel, mtime=0)
+        offset = self.segment.tell()
+        self.segment.write(data)
+        self.segment.flush()
+        entry = {"segment": os.path.basename(self.segment_filename),
+                 "offset": offset, "size": len(data),
+                 "records": len(self._lines),
+                 "first_time": self._first_time,
+                 "last_time": self._last_time,
+                 "first_package": self._first_package,
+                 "last_package": self._last_package}
+        # the index is written after the block, so every entry points to
+        # complete data
+        self.index.write(json.dumps(entry) + "\n")
+        self.index.flush()
+        self._reset_block()
+        if offset + len(data) >= self.max_segment_size:
+            self._close_segment()
+
+    def close(self):
+        """
+        Write the current block and close the segment and the index.
+
+        :returns: None
+        """
+        if self.closed:
+            return
+        self.flush()
+        self._close_segment()
+        self.index.close()
+        self.closed = True
+
+
+class ArchiveReader(object):
+    """
+    Reads records of an archive of the ArchiveWriter block by block.
+
+    :param index_filename: the index of the archive
+    :type index_filename: str
+    """
+
+    def __init__(self, index_filename):
+        self.index_filename = index_filename
+        self.directory = os.path.dirname(index_filename)
+        self.blocks = []
+        with open(index_filename) as f:
+            for line in f:
+                try:
+                    self.blocks.append(json.loads(line))
+                except ValueError:
+                    # the last line of an archive still being written may
+                    # be incomplete
+                    break
+
+    def find(self, start=None, end=None):
+        """
+        The blocks with records in a time range. Blocks without timestamps
+        are always included.
+
+        :param start: first time in seconds since the epoch, open if None
+        :type start: float
+        :param end: time in seconds since the epoch the range ends before,
+                    open if None
+        :type end: float
+        :returns: list of dict -- the index entries
+        """
+        return [block for block in self.blocks
+                if block["first_time"] is None or
+                ((start is None or block["last_time"] >= start) and
+                 (end is None or block["first_time"] < end))]
+
+    def find_package(self, package_number):
+        """
+        The blocks which may contain a package number. The package numbers
+        start again when the DAQ server is restarted, so there can be
+        several.
+
+        :param package_number: the package number
+        :type package_number: int
+        :returns: list of dict -- the index entries
+        """
+        return [block for block in self.blocks
+                if block["first_package"] is not None and
+                block["first_package"] <= package_number <=
+                block["last_package"]]
+
+    def read_block(self, block):
+        """
+        Decompress the records of one block.
+
+        :param block: index entry returned by find() or find_package()
+        :type block: dict
+        :returns: list of Record
+        """
+        with open(os.path.join(self.directory, block["segment"]),
+                  "rb") as f:
+            f.seek(block["offset"])
+            data = gzip.decompress(f.read(block["size"]))
+        return [decode_record(line)
+                for line in data.decode("utf-8").splitlines() if line]
+
+    def records(self, start=None, end=None):
+        """
+        The records in a time range, only the blocks of the range are
+        decompressed.
+
+        :param start: first time in seconds since the epoch, open if None
+        :type start: float
+        :param end: time in seconds since the epoch the range ends before,
+                    open if None
+        :type end: float
+        :returns: generator of Record
+        """
+        for block in self.find(start, end):
+            for rec in self.read_block(block):
+                if rec.timestamp is None or \
+                        ((start is None or rec.timestamp >= start) and
+                         (end is None or rec.timestamp < end)):
+                    yield rec
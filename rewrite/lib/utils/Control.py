@@ -0,0 +1,406 @@
+"""
+Request/reply protocol of the control endpoint of the DAQ server.
+
+Clients talk to a zeromq ROUTER socket. Every request is a single JSON
+frame::
+
+    {"id": 17, "method": "setup_channel", "params": [true, true, false, false, "twofold"]}
+
+and is answered with::
+
+    {"id": 17, "result": null}
+
+or, if the call failed::
+
+    {"id": 17, "error": "ValueError: Unknown coincidence 'sixfold'"}
+
+The id is chosen by the client and echoed by the server, so a client can
+send several requests without waiting and match the replies, which may
+arrive in a different order.
+
+ControlServer serves the methods in CONTROL_METHODS of an object
+(DAQServer, ReaderFromFile, ...) on such an endpoint, ControlProxy calls
+them like xmlrpc.client.ServerProxy did.
+"""
+import itertools
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+import zmq
+
+CONTROL_PORT = 5556
+# address the server binds to, local clients only
+CONTROL_BIND_ADDRESS = f"tcp://127.0.0.1:{CONTROL_PORT}"
+# address clients connect to
+DEFAULT_CONTROL_ADDRESS = f"tcp://127.0.0.1:{CONTROL_PORT}"
+
+# methods of a DAQ server clients may call, everything else (run, publish,
+# handle_line, ...) is internal
+CONTROL_METHODS = ("do", "reset_scalars", "start_reading_data",
+                   "stop_reading_data", "read_scalars", "set_threashold",
+                   "setup_channel", "write_register", "refresh_config",
+                   "get_temp_and_pressure", "get_gps_info",
+                   "start_polling", "stop_polling", "setRunning",
+                   "clear_queues")
+
+
+class ControlError(Exception):
+    """
+    Raised on the client side if the server reports an error
+    """
+    pass
+
+
+class ControlTimeoutError(ControlError):
+    """
+    Raised on the client side if the server does not reply in time
+    """
+    pass
+
+
+def encode_request(request_id, method, params=()):
+    """
+    :param request_id: id chosen by the client
+    :type request_id: int
+    :param method: name of the method to call
+    :type method: str
+    :param params: positional arguments of the call
+    :type params: list
+    :returns: bytes
+    """
+    return json.dumps({"id": request_id, "method": method,
+                       "params": list(params)},
+                      separators=(",", ":")).encode("utf-8")
+
+
+def decode_request(data):
+    """
+    Raises ValueError if the request is malformed.
+
+    :param data: the request
+    :type data: bytes
+    :raises: ValueError
+    :returns: tuple -- id, method name, list of parameters
+    """
+    request = json.loads(data)
+    if not isinstance(request, dict) or \
+            not isinstance(request.get("method"), str):
+        raise ValueError("Malformed request")
+    return request.get("id"), request["method"], request.get("params", [])
+
+
+def encode_reply(request_id, result=None, error=None):
+    """
+    :param request_id: id of the request
+    :type request_id: int
+    :param result: return value of the call, must be JSON serializable
+    :param error: error message if the call failed
+    :type error: str
+    :returns: bytes
+    """
+    reply = {"id": request_id}
+    if error is not None:
+        reply["error"] = error
+    else:
+        reply["result"] = result
+    try:
+        return json.dumps(reply, separators=(",", ":")).encode("utf-8")
+    except (TypeError, ValueError) as e:
+        return encode_reply(request_id, error=f"Cannot encode result: {e}")
+
+
+def decode_reply(data):
+    """
+    :param data: the reply
+    :type data: bytes
+    :returns: tuple -- id, result and error message (None on success)
+    """
+    reply = json.loads(data)
+    return reply.get("id"), reply.get("result"), reply.get("error")
+
+
+def error_message(e):
+    """
+    Format an exception raised by a call for the reply.
+
+    :param e: the exception
+    :type e: Exception
+    :returns: str
+    """
+    return f"{type(e).__name__}: {e}"
+
+
+class ControlServer(object):
+    """
+    Serves the methods of an object on a ROUTER socket. Only the methods
+    named in methods can be called.
+
+    Requests are executed by a pool of worker threads, so a slow call (e.g.
+    get_gps_info) does not delay calls of other clients, and a client may
+    send several requests without waiting for the replies. The object has
+    to be thread safe for that.
+
+    Can be used as context manager like SimpleXMLRPCServer.
+
+    :param instance: object whose methods are served
+    :param address: address to bind to
+    :type address: str
+    :param workers: number of worker threads
+    :type workers: int
+    :param methods: names of the methods clients may call, CONTROL_METHODS
+                    if None
+    :type methods: iterable of str
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    # time the loop blocks before checking for shutdown
+    POLL_TIMEOUT = 500  # milliseconds
+
+    def __init__(self, instance, address=CONTROL_BIND_ADDRESS, workers=4,
+                 methods=None, logger=None):
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        self.instance = instance
+        self.methods = frozenset(CONTROL_METHODS if methods is None
+                                 else methods)
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.ROUTER)
+        self.socket.bind(address)
+        # replies of the workers are passed back to the serving thread,
+        # which owns the ROUTER socket
+        self.reply_address = f"inproc://control-replies-{id(self)}"
+        self.replies = self.context.socket(zmq.PULL)
+        self.replies.bind(self.reply_address)
+        self.executor = ThreadPoolExecutor(workers)
+        self._local = threading.local()
+        self._pushers = []
+        self._pushers_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @property
+    def address(self):
+        """
+        :returns: str -- the address the server is bound to
+        """
+        return self.socket.getsockopt(zmq.LAST_ENDPOINT).decode("ascii")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def serve_forever(self):
+        """
+        Handle requests until shutdown() is called.
+
+        :returns: None
+        """
+        self._stop.clear()
+        poller = zmq.Poller()
+        poller.register(self.socket, zmq.POLLIN)
+        poller.register(self.replies, zmq.POLLIN)
+        while not self._stop.is_set():
+            events = dict(poller.poll(self.POLL_TIMEOUT))
+            while self.replies in events:
+                try:
+                    self.socket.send_multipart(
+                        self.replies.recv_multipart(zmq.NOBLOCK))
+                except zmq.Again:
+                    break
+            if self.socket in events:
+                frames = self.socket.recv_multipart()
+                self.executor.submit(self._handle, frames)
+
+    def shutdown(self):
+        """
+        Make serve_forever() return.
+
+        :returns: None
+        """
+        self._stop.set()
+
+    def server_close(self):
+        """
+        Wait for running calls and close the sockets.
+
+        :returns: None
+        """
+        self.executor.shutdown(wait=True)
+        with self._pushers_lock:
+            for pusher in self._pushers:
+                pusher.close(linger=0)
+        self.replies.close(linger=0)
+        self.socket.close(linger=0)
+        self.context.term()
+
+    def _pusher(self):
+        """
+        Socket of the current worker thread to pass replies back.
+        """
+        pusher = getattr(self._local, "pusher", None)
+        if pusher is None:
+            pusher = self.context.socket(zmq.PUSH)
+            pusher.connect(self.reply_address)
+            with self._pushers_lock:
+                self._pushers.append(pusher)
+            self._local.pusher = pusher
+        return pusher
+
+    def _handle(self, frames):
+        """
+        Execute a request in a worker thread.
+        """
+        request_id = None
+        try:
+            request_id, method, params = decode_request(frames[-1])
+            reply = encode_reply(request_id, self.dispatch(method, params))
+        except Exception as e:
+            self.logger.debug(f"Control request failed: {e}")
+            reply = encode_reply(request_id, error=error_message(e))
+        self._pusher().send_multipart(frames[:-1] + [reply])
+
+    def dispatch(self, method, params):
+        """
+        Call a method of the served object.
+
+        Raises AttributeError for methods which are not in methods or do
+        not exist.
+
+        :param method: name of the method
+        :type method: str
+        :param params: positional arguments
+        :type params: list
+        :raises: AttributeError
+        :returns: return value of the method
+        """
+        function = None
+        if method in self.methods:
+            function = getattr(self.instance, method, None)
+        if not callable(function):
+            raise AttributeError(f"Unknown method '{method}'")
+        return function(*params)
+
+
+class ControlCall(object):
+    """
+    A request sent by ControlProxy whose reply may not have arrived yet.
+
+    :param proxy: the proxy which sent the request
+    :type proxy: ControlProxy
+    :param request_id: id of the request
+    :type request_id: int
+    """
+
+    def __init__(self, proxy, request_id):
+        self.proxy = proxy
+        self.request_id = request_id
+
+    def result(self, timeout=None):
+        """
+        Wait for the reply.
+
+        :param timeout: maximum time to wait in seconds, defaults to the
+                        timeout of the proxy
+        :type timeout: float
+        :raises: ControlError, ControlTimeoutError
+        :returns: return value of the call
+        """
+        return self.proxy._result(self.request_id, timeout)
+
+
+class ControlProxy(object):
+    """
+    Client of a control endpoint. Methods of the server are called as
+    attributes of the proxy, just like with xmlrpc.client.ServerProxy::
+
+        server = ControlProxy()
+        server.setup_channel(True, True, True, True, 'threefold')
+
+    submit() sends a request without waiting for the reply, so several
+    requests can be in flight at once. The proxy may be shared by threads.
+
+    :param address: address of the control endpoint
+    :type address: str
+    :param timeout: maximum time to wait for a reply in seconds, None waits
+                    forever
+    :type timeout: float
+    :param context: zeromq context, defaults to the global instance
+    :type context: zmq.Context
+    """
+
+    # how long a waiting thread holds the socket before letting others in
+    POLL_INTERVAL = 50  # milliseconds
+
+    def __init__(self, address=DEFAULT_CONTROL_ADDRESS, timeout=None,
+                 context=None):
+        if context is None:
+            context = zmq.Context.instance()
+        self._timeout = timeout
+        self._socket = context.socket(zmq.DEALER)
+        self._socket.connect(address)
+        self._ids = itertools.count(1)
+        self._replies = {}
+        # requests which timed out, their replies are dropped
+        self._abandoned = set()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return lambda *params: self.submit(name, *params).result()
+
+    def submit(self, method, *params):
+        """
+        Send a request without waiting for the reply.
+
+        :param method: name of the method to call
+        :type method: str
+        :returns: ControlCall
+        """
+        with self._lock:
+            request_id = next(self._ids)
+            self._socket.send_multipart(
+                [b"", encode_request(request_id, method, params)])
+        return ControlCall(self, request_id)
+
+    def _result(self, request_id, timeout=None):
+        if timeout is None:
+            timeout = self._timeout
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            with self._lock:
+                if request_id in self._replies:
+                    result, error = self._replies.pop(request_id)
+                    if error is not None:
+                        raise ControlError(error)
+                    return result
+                wait = self.POLL_INTERVAL
+                if deadline is not None:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        self._abandoned.add(request_id)
+                        raise ControlTimeoutError(
+                            f"No reply to request {request_id} within "
+                            f"{timeout} s")
+                    wait = min(wait, int(remaining * 1000) + 1)
+                if self._socket.poll(wait):
+                    reply_id, result, error = decode_reply(
+                        self._socket.recv_multipart()[-1])
+                    if reply_id in self._abandoned:
+                        self._abandoned.discard(reply_id)
+                    else:
+                        self._replies[reply_id] = (result, error)
+
+    def close(self):
+        """
+        Close the connection.
+
+        :returns: None
+        """
+        self._socket.close(linger=0)
@@ -0,0 +1,174 @@
+"""
+Write text files in groups instead of line by line.
+
+Writing and flushing every DAQ line costs a system call per line at full
+trigger rate. The GroupCommitWriter collects the lines in memory and a
+thread of its own writes them together when enough text is waiting, when
+the flush interval has passed, or when the writer is closed::
+
+    with GroupCommitWriter("raw.txt", flush_interval=0.25) as writer:
+        for rec in consumer:
+            writer.write(str(rec) + "\\n")
+
+write() never waits for the disk, so a receive loop is not slowed down by
+it. How much data can be lost on a crash is stated by the durability
+property.
+"""
+import logging
+import os
+import threading
+from time import monotonic
+
+
+class GroupCommitWriter(object):
+    """
+    Buffered text file written by an I/O thread.
+
+    The waiting text is written and flushed to the operating system every
+    flush_interval seconds, as soon as buffer_size characters are waiting
+    and on close(). If fsync_interval is set, the file is also synced to
+    the disk, with every write if it is 0, otherwise at most every
+    fsync_interval seconds and on close().
+
+    Can be used as context manager.
+
+    :param filename: name of the file
+    :type filename: str
+    :param mode: mode the file is opened with, "a" or "w"
+    :type mode: str
+    :param flush_interval: maximum seconds text waits before it is written
+    :type flush_interval: float
+    :param buffer_size: characters waiting before they are written early
+    :type buffer_size: int
+    :param fsync_interval: seconds between syncs to the disk, 0 to sync
+                           every write, never if None
+    :type fsync_interval: float
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    def __init__(self, filename, mode="a", flush_interval=0.25,
+                 buffer_size=1 << 16, fsync_interval=None, logger=None):
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        self.filename = filename
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.fsync_interval = fsync_interval
+        self.file = open(filename, mode)
+        self.writes = 0
+        self.fsyncs = 0
+        self.closed = False
+        self._pending = []
+        self._size = 0
+        self._unsynced = False
+        self._last_fsync = monotonic()
+        self._cond = threading.Condition()
+        # serializes the writes of the thread and of flush()
+        self._io_lock = threading.Lock()
+        self.logger.debug("Writing %s: %s" % (filename, self.durability))
+        self._thread = threading.Thread(target=self._run,
+                                        name="GroupCommitWriter",
+                                        daemon=True)
+        self._thread.start()
+
+    @property
+    def durability(self):
+        """
+        How much data is lost if muonic or the whole system crashes.
+
+        :returns: str
+        """
+        process = ("a crash of muonic loses at most the last %g s or %d "
+                   "characters" % (self.flush_interval, self.buffer_size))
+        if self.fsync_interval is None:
+            return process + ", a crash of the system or a power failure " \
+                "everything the system did not write to the disk yet"
+        if self.fsync_interval == 0:
+            return process + ", also on a crash of the system or a power " \
+                "failure"
+        return process + ", a crash of the system or a power failure at " \
+            "most the last %g s" % max(self.flush_interval,
+                                       self.fsync_interval)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, text):
+        """
+        Queue text for writing. Does not block on the disk.
+
+        :param text: the text, including the line breaks
+        :type text: str
+        :raises: ValueError
+        :returns: None
+        """
+        with self._cond:
+            if self.closed:
+                raise ValueError("write to closed GroupCommitWriter")
+            self._pending.append(text)
+            self._size += len(text)
+            if self._size >= self.buffer_size:
+                self._cond.notify()
+
+    def flush(self):
+        """
+        Write the waiting text now and wait until it is written.
+
+        :returns: None
+        """
+        self._commit(False)
+
+    def _commit(self, final):
+        """
+        Write and flush the waiting text, sync it if it is time to.
+        """
+        with self._io_lock:
+            with self._cond:
+                pending, self._pending = self._pending, []
+                self._size = 0
+            try:
+                if pending:
+                    self.file.write("".join(pending))
+                    self.file.flush()
+                    self.writes += 1
+                    self._unsynced = True
+                if self._unsynced and self.fsync_interval is not None and \
+                        (final or monotonic() - self._last_fsync >=
+                         self.fsync_interval):
+                    os.fsync(self.file.fileno())
+                    self.fsyncs += 1
+                    self._unsynced = False
+                    self._last_fsync = monotonic()
+            except (OSError, IOError):
+                self.logger.exception("Could not write to %s" %
+                                      self.filename)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self.closed and self._size < self.buffer_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self.closed
+            if closed:
+                return
+            self._commit(False)
+
+    def close(self):
+        """
+        Write the waiting text, stop the thread and close the file.
+
+        :returns: None
+        """
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._commit(True)
+        self.file.close()
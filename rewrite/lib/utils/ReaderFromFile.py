@@ -1,7 +1,8 @@
 import zmq
 from datetime import datetime, timezone
 from .db.RecordAdapter import RecordAdapter
-import jsonpickle
+from ..common.WireFormat import decode_record
+from .Stream import publish_record
 import threading
 import logging
 
@@ -33,7 +34,7 @@ class ReaderFromFile(object):
             for line in file:
                 if line != "" and line != '\n':
                     print(f"Sening line: {line}")
-                    self.socket.send_string(line)
+                    publish_record(self.socket, decode_record(line))
 
     def setup_channel(self, ch0, ch1, ch2, ch3, coincidence):
         """
@@ -75,6 +76,18 @@ class ReaderFromFile(object):
         """
         self.logger.debug("reading fake scalars")
 
+    def start_polling(self, interval=5.0, environment_every=1):
+        """
+        Fake function. Just for API compatibility
+        """
+        self.logger.debug(f"starting fake polling every {interval} s")
+
+    def stop_polling(self):
+        """
+        Fake function. Just for API compatibility
+        """
+        self.logger.debug("stopping fake polling")
+
     def do(self, arg):
         """
         Fake function. Just for API compatibility
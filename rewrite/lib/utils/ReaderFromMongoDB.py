@@ -2,7 +2,7 @@ from mongoengine import connect
 import zmq
 from datetime import datetime, timezone
 from .db.RecordAdapter import RecordAdapter
-import jsonpickle
+from .Stream import publish_record
 import threading
 import logging
 
@@ -46,7 +46,7 @@ class ReaderFromMongoDB(object):
         for o in list(objs):
             # convert objects retrieved from the db into Record objects and send them via zmq
             rec = RecordAdapter(**o)
-            self.socket.send_string(jsonpickle.encode(rec.createRecord()))
+            publish_record(self.socket, rec.createRecord())
 
     def setup_channel(self, ch0, ch1, ch2, ch3, coincidence):
         """
@@ -88,6 +88,18 @@ class ReaderFromMongoDB(object):
         """
         self.logger.debug("reading fake scalars")
 
+    def start_polling(self, interval=5.0, environment_every=1):
+        """
+        Fake function. Just for API compatibility
+        """
+        self.logger.debug(f"starting fake polling every {interval} s")
+
+    def stop_polling(self):
+        """
+        Fake function. Just for API compatibility
+        """
+        self.logger.debug("stopping fake polling")
+
     def do(self, arg):
         """
         Fake function. Just for API compatibility
@@ -0,0 +1,343 @@
+"""
+Receive records once and hand them to several consumers in the process.
+
+Without the dispatcher every part of the GUI that needs records (DAQ
+output, raw file writer, pulse analyzers) has its own SUB socket and
+decodes every message itself. The dispatcher owns a single SUB socket,
+decodes each message once and puts the records into a bounded queue of
+every consumer registered for their type::
+
+    dispatcher = RecordDispatcher()
+    dispatcher.start()
+    output = dispatcher.register(record_types=[RecordType.DATA])
+    for rec in output:
+        ...
+
+A consumer which falls behind does not block the others, records which
+do not fit into its queue are dropped and counted.
+"""
+import logging
+import queue
+import threading
+
+import zmq
+
+from .Stream import DEFAULT_ADDRESS, recv_records, topic
+
+
+class Consumer(object):
+    """
+    Queue of the records for one consumer of a RecordDispatcher.
+
+    Records are either taken from the queue with get(), get_many() or by
+    iterating over the consumer, or, if a callback is given, passed to the
+    callback by a thread of the consumer.
+
+    :param record_types: types to receive, all records if None
+    :type record_types: iterable of RecordType
+    :param callback: called with every record in a thread of the consumer
+    :type callback: callable
+    :param queue_size: maximum number of waiting records
+    :type queue_size: int
+    :param name: name used in log messages and in stats()
+    :type name: str
+    """
+
+    def __init__(self, record_types=None, callback=None, queue_size=10000,
+                 name=None):
+        self.record_types = None
+        if record_types is not None:
+            self.record_types = frozenset(record_types)
+        self.callback = callback
+        self.name = name if name is not None else "consumer-%x" % id(self)
+        self.queue_size = queue_size
+        # the size is limited by offer(), so close() can always add its
+        # marker
+        self.queue = queue.Queue()
+        self.delivered = 0
+        self.dropped = 0
+        self.closed = False
+        self._thread = None
+
+    def offer(self, rec):
+        """
+        Queue a record, drop it if the queue is full.
+
+        :param rec: the record
+        :type rec: Record
+        :returns: bool -- True if the record was queued
+        """
+        # there is only one producer, so the size can not grow in between
+        if self.closed or self.queue.qsize() >= self.queue_size:
+            self.dropped += 1
+            return False
+        self.queue.put_nowait(rec)
+        self.delivered += 1
+        return True
+
+    def get(self, timeout=None):
+        """
+        Take the next record, None if the consumer was closed or no
+        record arrived within timeout seconds.
+
+        :param timeout: seconds to wait, forever if None
+        :type timeout: float
+        :returns: Record or None
+        """
+        try:
+            rec = self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if rec is None:
+            # put the close marker back for the next call
+            self.queue.put(None)
+        return rec
+
+    def get_many(self, timeout=None):
+        """
+        Wait for the next record and take all records which are waiting.
+
+        :param timeout: seconds to wait for the first record, forever if
+                        None
+        :type timeout: float
+        :returns: list of Record -- empty if nothing arrived in time
+        """
+        rec = self.get(timeout)
+        if rec is None:
+            return []
+        records = [rec]
+        while True:
+            try:
+                rec = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if rec is None:
+                # put the close marker back for the next call
+                self.queue.put(None)
+                break
+            records.append(rec)
+        return records
+
+    def __iter__(self):
+        while True:
+            rec = self.get()
+            if rec is None:
+                return
+            yield rec
+
+    def _run_callback(self):
+        for rec in self:
+            self.callback(rec)
+
+    def start(self):
+        """
+        Start the thread which passes the records to the callback.
+
+        :returns: None
+        """
+        if self.callback is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._run_callback,
+                                            name=self.name, daemon=True)
+            self._thread.start()
+
+    def close(self):
+        """
+        Stop the iteration and the callback thread after the records which
+        are already queued.
+
+        :returns: None
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        if self._thread is not None and \
+                self._thread is not threading.current_thread():
+            self._thread.join()
+
+
+class RecordDispatcher(object):
+    """
+    Receives the records of a DAQ server on one SUB socket and passes every
+    record to the consumers registered for its type.
+
+    The socket is only subscribed to the types some consumer wants. Records
+    can also be passed to dispatch() directly, e.g. when reading a file.
+
+    :param address: address of the DAQ server
+    :type address: str
+    :param context: zmq context, the global instance if None
+    :type context: zmq.Context
+    :param queue_size: default queue size of the consumers
+    :type queue_size: int
+    :param logger: logger object
+    :type logger: logging.Logger
+    """
+
+    # time the loop blocks before checking for shutdown and subscriptions
+    POLL_TIMEOUT = 200  # milliseconds
+
+    def __init__(self, address=DEFAULT_ADDRESS, context=None,
+                 queue_size=10000, logger=None):
+        if logger is None:
+            logger = logging.getLogger()
+        self.logger = logger
+        self.address = address
+        self.context = context if context is not None else \
+            zmq.Context.instance()
+        self.queue_size = queue_size
+        self.received = 0
+        # consumers of all records and consumers by record type
+        self._all = []
+        self._by_type = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def register(self, record_types=None, callback=None, queue_size=None,
+                 name=None):
+        """
+        Add a consumer. Can be called while the dispatcher is running.
+
+        :param record_types: types to receive, all records if None
+        :type record_types: iterable of RecordType
+        :param callback: called with every record in a thread of the
+                         consumer, if None the records are taken from the
+                         returned consumer
+        :type callback: callable
+        :param queue_size: maximum number of waiting records, the default
+                           of the dispatcher if None
+        :type queue_size: int
+        :param name: name of the consumer
+        :type name: str
+        :returns: Consumer
+        """
+        if queue_size is None:
+            queue_size = self.queue_size
+        consumer = Consumer(record_types, callback, queue_size, name)
+        with self._lock:
+            if consumer.record_types is None:
+                self._all = self._all + [consumer]
+            else:
+                by_type = dict(self._by_type)
+                for rec_type in consumer.record_types:
+                    by_type[rec_type] = by_type.get(rec_type, []) + [consumer]
+                self._by_type = by_type
+        consumer.start()
+        return consumer
+
+    def unregister(self, consumer):
+        """
+        Remove a consumer and close it.
+
+        :param consumer: consumer returned by register
+        :type consumer: Consumer
+        :returns: None
+        """
+        with self._lock:
+            self._all = [c for c in self._all if c is not consumer]
+            by_type = {}
+            for rec_type, consumers in self._by_type.items():
+                consumers = [c for c in consumers if c is not consumer]
+                if consumers:
+                    by_type[rec_type] = consumers
+            self._by_type = by_type
+        consumer.close()
+
+    def consumers(self):
+        """
+        :returns: list of Consumer -- all registered consumers
+        """
+        with self._lock:
+            consumers = list(self._all)
+            for type_consumers in self._by_type.values():
+                consumers += [c for c in type_consumers
+                              if c not in consumers]
+        return consumers
+
+    def dispatch(self, records):
+        """
+        Pass records to the consumers registered for their types.
+
+        :param records: the records
+        :type records: list of Record
+        :returns: None
+        """
+        # the lists and the dict are replaced, not changed, on
+        # (un)registering, so they can be used without holding the lock
+        all_consumers = self._all
+        by_type = self._by_type
+        for rec in records:
+            self.received += 1
+            for consumer in by_type.get(rec.type, []) + all_consumers:
+                if not consumer.offer(rec) and consumer.dropped == 1:
+                    self.logger.warning("%s falls behind, dropping records" %
+                                        consumer.name)
+
+    def stats(self):
+        """
+        Delivered, dropped and waiting records of every consumer.
+
+        :returns: dict -- dict of counters by consumer name
+        """
+        return {c.name: {"delivered": c.delivered, "dropped": c.dropped,
+                         "queued": c.queue.qsize()}
+                for c in self.consumers()}
+
+    def _topics(self):
+        """
+        Topics the socket has to be subscribed to.
+        """
+        if self._all:
+            return {b""}
+        return set(topic(rec_type) for rec_type in self._by_type)
+
+    def run(self):
+        """
+        Receive and dispatch records until stop() is called.
+
+        :returns: None
+        """
+        sock = self.context.socket(zmq.SUB)
+        sock.connect(self.address)
+        subscribed = set()
+        try:
+            while not self._stop.is_set():
+                # consumers may have been added or removed
+                topics = self._topics()
+                for new in topics - subscribed:
+                    sock.subscribe(new)
+                for old in subscribed - topics:
+                    sock.unsubscribe(old)
+                subscribed = topics
+                if sock.poll(self.POLL_TIMEOUT):
+                    self.dispatch(recv_records(sock))
+        finally:
+            sock.close(linger=0)
+
+    def start(self):
+        """
+        Start receiving in a thread.
+
+        :returns: None
+        """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run,
+                                        name="RecordDispatcher",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop receiving and close all consumers.
+
+        :returns: None
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for consumer in self.consumers():
+            self.unregister(consumer)
@@ -0,0 +1,67 @@
+"""
+Fixed length history of several values in preallocated arrays
+"""
+import numpy as np
+
+
+class RingHistory(object):
+    """
+    Keeps the last length rows of columns values each, e.g. the time and
+    the rates of a plot, in a ring buffer. Appending never allocates and
+    evicts the oldest row once the history is full.
+
+    Every row is written twice, at its position and one length further, so
+    the history is always a contiguous slice of the buffer and view() does
+    not need to copy or reorder anything.
+
+    :param columns: number of values per row
+    :type columns: int
+    :param length: maximum number of rows
+    :type length: int
+    :raises: ValueError
+    """
+
+    def __init__(self, columns, length):
+        if length < 1:
+            raise ValueError("The history needs at least one row")
+        self.length = length
+        self._data = np.zeros((columns, 2 * length))
+        self.clear()
+
+    def clear(self):
+        """
+        Remove all rows.
+
+        :returns: None
+        """
+        self._start = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, values):
+        """
+        Append a row, evicting the oldest one if the history is full.
+
+        :param values: one value for every column
+        :type values: list or tuple or numpy.ndarray
+        :returns: None
+        """
+        if self._size < self.length:
+            pos = self._start + self._size
+            self._size += 1
+        else:
+            pos = self._start
+            self._start = (self._start + 1) % self.length
+        self._data[:, pos] = values
+        self._data[:, pos + self.length] = values
+
+    def view(self):
+        """
+        The rows from oldest to newest, one array row per column. This is
+        a view into the buffer and changes with the next append().
+
+        :returns: numpy.ndarray of shape (columns, len(self))
+        """
+        return self._data[:, self._start:self._start + self._size]
@@ -0,0 +1,175 @@
+"""
+Helpers to publish and receive Records over zeromq.
+
+Every record is sent as a multipart message. The first frame is a topic
+derived from the RecordType (e.g. b"DATA", b"COUNTER"), the second one the
+encoded record. Subscribers only subscribe to the topics they need, so
+libzmq drops everything else before it reaches Python.
+
+DATA records may arrive packed into batches (see DAQServer batch_size).
+recv_records and iter_records unpack them transparently. recv_waiting also
+collects the messages already waiting, so a busy receiver can handle many
+small messages at once.
+"""
+from time import monotonic
+
+import zmq
+
+from ..common.Record import RecordType
+from ..common.WireFormat import (encode_record, encode_data_batch,
+                                 decode_record, decode_records)
+
+DEFAULT_ADDRESS = "tcp://127.0.0.1:1234"
+
+# topic for records without a type
+NO_TYPE_TOPIC = b"NONE"
+
+
+def topic(rec_type):
+    """
+    Get the topic for a record type.
+
+    :param rec_type: record type or None
+    :type rec_type: RecordType
+    :returns: bytes
+    """
+    if rec_type is None:
+        return NO_TYPE_TOPIC
+    return RecordType(rec_type).name.encode("ascii")
+
+
+def publish_record(socket, rec, data=None):
+    """
+    Send a record with its topic.
+
+    :param socket: zmq PUB socket
+    :param rec: the record
+    :type rec: Record
+    :param data: the already encoded record, encoded from rec if None
+    :type data: bytes
+    :returns: None
+    """
+    if data is None:
+        data = encode_record(rec)
+    socket.send_multipart([topic(rec.type), data])
+
+
+def publish_data_batch(socket, base_package_number, timestamps, lines):
+    """
+    Send several DATA lines as one message.
+
+    :param socket: zmq PUB socket
+    :param base_package_number: package number of the first line
+    :type base_package_number: int
+    :param timestamps: unix timestamp of each line
+    :type timestamps: list of float
+    :param lines: the messages from the DAQ card
+    :type lines: list of str
+    :returns: None
+    """
+    socket.send_multipart([topic(RecordType.DATA),
+                           encode_data_batch(base_package_number, timestamps,
+                                             lines)])
+
+
+def subscribe(socket, record_types=None):
+    """
+    Subscribe a SUB socket to records of the given types.
+
+    :param socket: zmq SUB socket
+    :param record_types: types to receive, all records if None
+    :type record_types: iterable of RecordType
+    :returns: None
+    """
+    if record_types is None:
+        socket.subscribe(b"")
+        return
+    for rec_type in set(record_types):
+        socket.subscribe(topic(rec_type))
+
+
+def connect_subscriber(context, record_types=None, address=DEFAULT_ADDRESS):
+    """
+    Create a SUB socket connected to a DAQ server and subscribed to the
+    given record types.
+
+    :param context: zmq context
+    :type context: zmq.Context
+    :param record_types: types to receive, all records if None
+    :type record_types: iterable of RecordType
+    :param address: address of the DAQ server
+    :type address: str
+    :returns: zmq.Socket
+    """
+    sock = context.socket(zmq.SUB)
+    sock.connect(address)
+    subscribe(sock, record_types)
+    return sock
+
+
+def recv_message(socket):
+    """
+    Receive the encoded record of the next message.
+
+    :param socket: zmq SUB socket
+    :returns: bytes
+    """
+    return socket.recv_multipart()[-1]
+
+
+def recv_record(socket):
+    """
+    Receive and decode the next record. Must not be used on sockets which
+    receive DATA batches, use recv_records there.
+
+    :param socket: zmq SUB socket
+    :returns: Record
+    """
+    return decode_record(recv_message(socket))
+
+
+def recv_records(socket):
+    """
+    Receive the next message and decode all records in it.
+
+    :param socket: zmq SUB socket
+    :returns: list of Record
+    """
+    return decode_records(recv_message(socket))
+
+
+def recv_waiting(socket, max_records=10000, max_time=0.05):
+    """
+    Receive the next message and the messages already waiting behind it,
+    and decode all records in them. Stops when no message is waiting, when
+    max_records records or max_time seconds are reached.
+
+    :param socket: zmq SUB socket
+    :param max_records: number of records after which no more messages are
+                        received
+    :type max_records: int
+    :param max_time: seconds after which no more messages are received
+    :type max_time: float
+    :returns: list of Record
+    """
+    records = recv_records(socket)
+    deadline = monotonic() + max_time
+    while len(records) < max_records and monotonic() < deadline:
+        try:
+            data = socket.recv_multipart(zmq.NOBLOCK)[-1]
+        except zmq.Again:
+            break
+        records += decode_records(data)
+    return records
+
+
+def iter_records(socket):
+    """
+    Iterate over all records arriving at a socket, unpacking batches.
+
+    :param socket: zmq SUB socket
+    :returns: generator of Record
+    """
+    while True:
+        for rec in recv_records(socket):
+            yield rec
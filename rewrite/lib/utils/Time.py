@@ -17,4 +17,15 @@ def getTimeString(time):
 def getCurrentTimeString():
     return datetime.datetime.now().strftime(
                         "%Y-%m-%d %H:%M:%S")
-    # return getTimeString(getLocalTime())
\ No newline at end of file
+    # return getTimeString(getLocalTime())
+
+
+def get_hours_from_duration(duration):
+    """
+    Get the hours of a measurement duration
+
+    :param duration: the duration of the measurement
+    :type duration: datetime.timedelta
+    :returns: float
+    """
+    return round(duration.seconds / 3600., 2) + duration.days * 24
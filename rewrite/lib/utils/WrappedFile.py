@@ -1,6 +1,31 @@
 import os
 import shutil
 
+from .Time import get_hours_from_duration
+
+
+def rename_muonic_file(duration, file_path):
+    """
+    Replaces the placeholder 'HOURS' in the filename by the hours the
+    measurement took.
+
+    Raises OSError if the file_path does not contain a filename.
+
+    :param duration: the duration of the measurement
+    :type duration: datetime.timedelta
+    :param file_path: the file path
+    :type file_path: str
+    :raises: OSError
+    :returns: None
+    """
+    path, filename = os.path.split(file_path)
+    if filename == "":
+        raise OSError("filename is empty")
+    new_filename = filename.replace("HOURS",
+                                    str(get_hours_from_duration(duration)))
+    if new_filename != filename:
+        shutil.move(file_path, os.path.join(path, new_filename))
+
 
 class WrappedFile(object):
     """
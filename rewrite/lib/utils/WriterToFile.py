@@ -1,8 +1,10 @@
-import xmlrpc.client
 import zmq
 import logging
-import jsonpickle
-from .db.RecordAdapter import RecordAdapter
+from ..common.WireFormat import as_text
+from .Stream import (DEFAULT_ADDRESS, connect_subscriber, recv_message,
+                     recv_records)
+from .GroupCommitWriter import GroupCommitWriter
+from .ArchiveWriter import ArchiveWriter
 
 # from ..common.CountRecord import CountRecord
 # from ..common.Record import RecordType, Record
@@ -17,26 +19,93 @@ import queue
 
 class WriterToFile():
     """
-    Writes incoming data to a file for storage
+    Writes incoming data to a file for storage.
+
+    The lines are written in groups by a GroupCommitWriter, see its
+    durability for the data lost on a crash. With archive the records are
+    written to a compressed, rotating ArchiveWriter archive instead.
+
+    stop() ends the writer thread and closes the file or the archive, so
+    the lines still waiting in memory and the open block of the archive are
+    written.
+
+    :param flush_interval: maximum seconds a line waits before it is written
+    :type flush_interval: float
+    :param fsync_interval: seconds between syncs to the disk, never if None
+    :type fsync_interval: float
+    :param archive: write a compressed archive instead of a text file
+    :type archive: bool
+    :param address: address of the DAQ server
+    :type address: str
+    :param logger: logger object
+    :type logger: logging.Logger
     """
 
-    def __init__(self, logger=None):
+    # time the loop blocks before checking for stop
+    POLL_TIMEOUT = 500  # milliseconds
+
+    def __init__(self, flush_interval=0.25, fsync_interval=None,
+                 archive=False, address=DEFAULT_ADDRESS, logger=None):
         if logger is None:
             logger = logging.getLogger()
         self.logger = logger
 
         self.ctx = zmq.Context()
-        self.sock = self.ctx.socket(zmq.SUB)
-        self.sock.connect("tcp://127.0.0.1:1234")
-        self.sock.subscribe("")  # Subscribe to all topics
+        self.sock = connect_subscriber(self.ctx, address=address)
+        self._stop = threading.Event()
+        self._daemon = None
         self.starttime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        self.outFile = open(self.starttime + "_F.txt", "a")
+        self.archive = None
+        if archive:
+            self.outFile = None
+            self.archive = ArchiveWriter(self.starttime + "_F",
+                                         logger=self.logger)
+            return
+        self.outFile = GroupCommitWriter(self.starttime + "_F.txt", "a",
+                                         flush_interval=flush_interval,
+                                         fsync_interval=fsync_interval,
+                                         logger=self.logger)
 
     def fileWriter(self):
-        while True:
-            msg = self.sock.recv_string()
-            self.outFile.write(msg + '\n')
-            self.outFile.flush()
+        try:
+            while not self._stop.is_set():
+                if not self.sock.poll(self.POLL_TIMEOUT):
+                    continue
+                msg = recv_message(self.sock)
+                self.outFile.write(as_text(msg) + '\n')
+        finally:
+            self.outFile.close()
+
+    def archiveWriter(self):
+        try:
+            while not self._stop.is_set():
+                if not self.sock.poll(self.POLL_TIMEOUT):
+                    continue
+                self.archive.write(recv_records(self.sock))
+        finally:
+            self.archive.close()
 
     def runDaemon(self):
-        writerTask = threading.Thread(target=self.fileWriter).start()
+        target = self.fileWriter if self.archive is None else \
+            self.archiveWriter
+        self._stop.clear()
+        self._daemon = threading.Thread(target=target)
+        self._daemon.start()
+
+    def stop(self):
+        """
+        Make the writer thread return, wait for it to close the file and
+        close the socket.
+
+        :returns: None
+        """
+        self._stop.set()
+        if self._daemon is not None:
+            self._daemon.join()
+            self._daemon = None
+        if self.outFile is not None:
+            self.outFile.close()
+        if self.archive is not None:
+            self.archive.close()
+        self.sock.close(linger=0)
+        self.ctx.term()
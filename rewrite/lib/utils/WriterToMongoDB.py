@@ -1,10 +1,9 @@
-import xmlrpc.client
 import zmq
 import logging
-import jsonpickle
 import numpy as np
 from mongoengine import connect
 from .db.RecordAdapter import RecordAdapter
+from .Stream import connect_subscriber, iter_records
 
 # from ..common.CountRecord import CountRecord
 # from ..common.Record import RecordType, Record
@@ -28,16 +27,12 @@ class WriterToMongoDB():
         self.logger = logger
 
         self.ctx = zmq.Context()
-        self.sock = self.ctx.socket(zmq.SUB)
-        self.sock.connect("tcp://127.0.0.1:1234")
-        self.sock.subscribe("")  # Subscribe to all topics
+        self.sock = connect_subscriber(self.ctx)
         connect('muonic', host='localhost', port=27017,
                 username="root", password="muonic", authentication_source='admin')
 
     def DBWriter(self):
-        while True:
-            msg = self.sock.recv_string()
-            obj = jsonpickle.decode(msg)
+        for obj in iter_records(self.sock):
             record = RecordAdapter.get(obj)
             record.save()
 
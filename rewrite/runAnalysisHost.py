@@ -0,0 +1,20 @@
+import sys
+
+from lib.analyzers.AnalysisHost import AnalysisHost
+
+
+def run():
+    """
+    Runs the analyses given on the command line (default: rates, pulses, decays and archive) on one subscription to the DAQ server
+    """
+    plugins = sys.argv[1:] or ["rates", "pulses", "decays", "archive"]
+    print(f"Starting analyses {', '.join(plugins)}. When done quit with CTRL-C.")
+    with AnalysisHost.from_config(plugins) as host:
+        try:
+            host.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    run()
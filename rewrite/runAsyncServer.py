@@ -0,0 +1,17 @@
+import asyncio
+from lib.daq.AsyncDAQServer import AsyncDAQServer
+
+
+def run():
+    """
+    Starts an instance of the asyncio DAQ server, which serves the control endpoint and publishes the data in a single event loop
+    """
+    print("Starting asyncio DAQ Server. When done quit with CTRL-C.")
+    try:
+        asyncio.run(AsyncDAQServer().serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,17 @@
+from lib.analyzers.PulseService import PulseService
+
+
+def run():
+    """
+    Extracts the pulses of the DAQ server once and publishes them as PULSES records for the analyzers
+    """
+    print("Starting pulse service. When done quit with CTRL-C.")
+    with PulseService() as service:
+        try:
+            service.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    run()
@@ -1,11 +1,18 @@
+import sys
+
 from lib.analyzers.PulseAnalyzer import PulseAnalyzer
+from lib.analyzers.PulseService import PULSE_ADDRESS
 
 
 def run():
     """
     Creates an instance of PulseAnalyzer and runs a simple pulse measurement.
+    With --service the pulses are taken from a running PulseService (see runPulseService.py) instead of being extracted again.
     """
-    r = PulseAnalyzer()
+    if "--service" in sys.argv[1:]:
+        r = PulseAnalyzer(pulse_address=PULSE_ADDRESS)
+    else:
+        r = PulseAnalyzer()
     print("Starting pulse analysis. When done quit with CTRL-C.")
     r.measure_pulses(meastime=1.0)
 
@@ -1,22 +1,13 @@
 from lib.utils.ReaderFromFile import ReaderFromFile
-from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
-
-
-class RequestHandler(SimpleXMLRPCRequestHandler):
-    """
-    Adapter Class for xmlrpc
-    """
-    rpc_paths = ('/RPC2',)
+from lib.utils.Control import ControlServer
 
 
 def run():
     """
-    Starts an instance of the DAQ server with xmlrpc enabled and then enters an infinite loop and provides data on request
+    Starts an instance of the DAQ server with the control endpoint enabled and then enters an infinite loop and provides data on request
     """
     print("Starting Reader from file. When done quit with CTRL-C.")
-    with SimpleXMLRPCServer(('localhost', 5556), requestHandler=RequestHandler, allow_none=True) as server:
-        server.register_introspection_functions()
-        server.register_instance(ReaderFromFile("test_data.txt"))
+    with ControlServer(ReaderFromFile("test_data.txt")) as server:
         server.serve_forever()
 
 
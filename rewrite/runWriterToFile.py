@@ -1,3 +1,6 @@
+import sys
+from time import sleep
+
 from lib.utils.WriterToFile import WriterToFile
 from datetime import datetime
 
@@ -5,11 +8,25 @@ from datetime import datetime
 def run():
     """
     Writes incoming data to a file. Default filename format is: %Y-%m-%d_%H-%M-%S_F.txt 
+    With --archive the data is written to hourly, gzip compressed segments %Y-%m-%d_%H-%M-%S_F_<number>.txt.gz with the index %Y-%m-%d_%H-%M-%S_F.idx
     """
-    w = WriterToFile()
-    print(
-        f'Writing to file {datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}_F.txt\nWhen done quit with CTRL-C.')
+    archive = "--archive" in sys.argv[1:]
+    w = WriterToFile(archive=archive)
+    if archive:
+        print(
+            f'Writing archive {w.starttime}_F_*.txt.gz with index {w.starttime}_F.idx\nWhen done quit with CTRL-C.')
+    else:
+        print(
+            f'Writing to file {datetime.now().strftime("%Y-%m-%d_%H-%M-%S")}_F.txt\nWhen done quit with CTRL-C.')
     w.runDaemon()
+    try:
+        while True:
+            sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # writes the lines still waiting in memory
+        w.stop()
 
 
 if __name__ == "__main__":
@@ -1,21 +1,17 @@
 import zmq
 import time
-import jsonpickle
+from lib.utils.Stream import connect_subscriber, iter_records
 from lib.common.Record import Record
 from lib.common.CountRecord import CountRecord
-import xmlrpc.client
+from lib.utils.Control import ControlProxy
 import threading
 
 
 def reciever_loop():
     ctx = zmq.Context()
-    sock = ctx.socket(zmq.SUB)
-    sock.connect("tcp://127.0.0.1:1234")
-    sock.subscribe("")  # Subscribe to all topics
+    sock = connect_subscriber(ctx)
     print("Starting receiver loop... Quit with CTRL-C")
-    while True:
-        msg = sock.recv_string()
-        obj = jsonpickle.decode(msg)
+    for obj in iter_records(sock):
         #print(f"OBJ type {type(obj)}")
         print(
             f"Type: {obj.type} timestamp: {obj.timestamp} payloads: {repr(obj.payload)}")
@@ -29,9 +25,7 @@ def run():
     t.setDaemon(True)
     t.start()
 
-    # s = xmlrpc.client.ServerProxy("http://localhost:5556")
-
-    # # print(s.system.listMethods())
+    # s = ControlProxy()
 
     # s.setup_channel(True, True, True, True, 'threefold')
 
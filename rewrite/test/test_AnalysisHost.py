@@ -0,0 +1,121 @@
+import logging
+import jsonpickle
+import pytest
+from ..lib.analyzers.AnalysisHost import AnalysisHost
+from ..lib.analyzers.AnalysisPlugins import (AnalysisPlugin, ArchivePlugin,
+                                             DecayPlugin, PulsePlugin,
+                                             load_plugin)
+from ..lib.analyzers.DecaySearch import DecaySearch
+from ..lib.analyzers.PulseExtractor import PulseExtractor
+from ..lib.common.Record import Record, RecordType
+from ..lib.common.DataRecord import DataRecord
+from ..lib.common.TemperatureRecord import TemperatureRecord
+
+
+class Collector(AnalysisPlugin):
+    def __init__(self, record_types=None, name=None):
+        AnalysisPlugin.__init__(self, name)
+        self.record_types = record_types
+        self.batches = []
+        self.ticks = []
+        self.finalized = 0
+
+    def on_batch(self, records):
+        self.batches.append([rec.type for rec in records])
+
+    def on_tick(self, now):
+        self.ticks.append(now)
+
+    def finalize(self):
+        self.finalized += 1
+
+
+class Failing(AnalysisPlugin):
+    def on_batch(self, records):
+        raise RuntimeError("broken plugin")
+
+
+def test_pulses_and_decays_in_one_pass(tmp_path):
+    with open("rewrite/test/data/daq.txt") as f:
+        lines = [line.rstrip("\n") for line in f]
+    expected = DecaySearch().search(PulseExtractor(
+        logging.getLogger(), "unused").extract_many(lines))
+
+    everything = Collector(name="everything")
+    pulses = Collector([RecordType.PULSES], name="pulses")
+    decays = DecayPlugin(str(tmp_path / "decays.txt"))
+    archive = ArchivePlugin(str(tmp_path / "raw.txt"))
+    with AnalysisHost([PulsePlugin(), decays, archive,
+                       everything, pulses, Failing()],
+                      "tcp://127.0.0.1:1") as host:
+        assert host.record_types() is None
+        records = [Record(i, RecordType.DATA, 1.0, DataRecord(line))
+                   for i, line in enumerate(lines)]
+        records.insert(5, Record(None, RecordType.TEMPERATURE, 1.0,
+                                 TemperatureRecord("TH TH=22.9")))
+        for i in range(0, len(records), 100):
+            host.process(records[i:i + 100])
+        host.tick(10.0)
+        with pytest.raises(ValueError):
+            host.add(Collector(name="pulses"))
+    host.server_close()
+
+    assert decays.search.decays == len(expected)
+    assert everything.batches[0].count(RecordType.TEMPERATURE) == 1
+    # the derived PULSES records only reach the plugins naming their type
+    assert sum(len(b) for b in everything.batches) == len(records)
+    assert pulses.batches
+    assert all(batch == [RecordType.PULSES] for batch in pulses.batches)
+    assert everything.ticks == [10.0] and everything.finalized == 1
+    stats = host.stats()
+    assert stats["PulsePlugin"]["records"] == len(lines)
+    assert stats["pulses"]["records"] == len(pulses.batches)
+    assert stats["Failing"]["errors"] == stats["Failing"]["calls"] - 2
+    assert stats["PulsePlugin"]["cpu_time"] > 0
+    cpu_times = [float(line.split()[3])
+                 for line in host.report().splitlines()[1:]]
+    assert cpu_times == sorted(cpu_times, reverse=True)
+    with open(tmp_path / "decays.txt") as f:
+        assert sum(" Decay " in line for line in f) == len(expected)
+    with open(tmp_path / "raw.txt") as f:
+        assert [jsonpickle.decode(line).type for line in f] == \
+            [rec.type for rec in records]
+
+
+def test_load_plugin(tmp_path):
+    archive = load_plugin("archive", filename=str(tmp_path / "raw.txt"))
+    rec = Record(1, RecordType.DATA, 1.0, DataRecord("line"))
+    archive.on_batch([rec])
+    archive.finalize()
+    with open(tmp_path / "raw.txt") as f:
+        assert jsonpickle.decode(f.readline()).payload.msg == "line"
+    plugin = load_plugin("rewrite.test.test_AnalysisHost:Collector",
+                         name="collector")
+    assert plugin.name == "collector"
+    with pytest.raises(ValueError):
+        load_plugin("unknown")
+
+
+def test_pulse_plugin_file(tmp_path, monkeypatch):
+    with open("rewrite/test/data/daq.txt") as f:
+        records = [Record(i, RecordType.DATA, 1.0, DataRecord(line.rstrip()))
+                   for i, line in enumerate(f)]
+    monkeypatch.chdir(tmp_path)
+
+    # without a pulse file nothing is written
+    with AnalysisHost([PulsePlugin()], "tcp://127.0.0.1:1") as host:
+        host.process(records)
+    host.server_close()
+    assert host.stats()["PulsePlugin"]["errors"] == 0
+    assert list(tmp_path.iterdir()) == []
+
+    pulses = Collector([RecordType.PULSES])
+    pulses.on_batch = lambda records: pulses.batches.extend(records)
+    with AnalysisHost([PulsePlugin("pulses_P.txt"), pulses],
+                      "tcp://127.0.0.1:1") as host:
+        host.process(records)
+    host.server_close()
+    assert host.stats()["PulsePlugin"]["errors"] == 0
+    with open(tmp_path / "pulses_P.txt") as f:
+        assert len(f.read().splitlines()) == \
+            sum(rec.payload.events for rec in pulses.batches) > 0
@@ -0,0 +1,54 @@
+import gzip
+import jsonpickle
+import pytest
+from ..lib.common.Record import Record, RecordType
+from ..lib.common.DataRecord import DataRecord
+from ..lib.utils.ArchiveWriter import ArchiveReader, ArchiveWriter
+
+START = 1719223200.0  # a full hour
+
+
+def data(number, timestamp):
+    return Record(number, RecordType.DATA, timestamp,
+                  DataRecord("line %d" % number))
+
+
+def test_rotation_and_index(tmp_path):
+    prefix = str(tmp_path / "run_F")
+    records = [data(i, START + 10 * i) for i in range(720)]
+    with ArchiveWriter(prefix, block_interval=300) as archive:
+        for i in range(0, len(records), 50):
+            archive.write(records[i:i + 50])
+    with pytest.raises(ValueError):
+        archive.write([records[0]])
+    # one segment per hour, blocks of 300 s
+    assert archive.segments == 2
+    reader = ArchiveReader(prefix + ".idx")
+    assert [block["records"] for block in reader.blocks] == [30] * 24
+    assert {block["segment"] for block in reader.blocks} == \
+        {"run_F_0000.txt.gz", "run_F_0001.txt.gz"}
+
+    # the segments are ordinary gzip files
+    with gzip.open(prefix + "_0001.txt.gz", "rt") as f:
+        lines = f.read().splitlines()
+    assert jsonpickle.decode(lines[0]).packageNumber == 360
+
+    selected = list(reader.records(START + 4000, START + 4100))
+    assert [rec.packageNumber for rec in selected] == list(range(400, 410))
+    assert len(reader.find(START + 4000, START + 4100)) == 1
+    block, = reader.find_package(555)
+    assert [rec.payload.msg for rec in reader.read_block(block)][15] == \
+        "line 555"
+
+
+def test_size_rotation_and_truncated_index(tmp_path):
+    prefix = str(tmp_path / "run_F")
+    with ArchiveWriter(prefix, max_segment_size=1, block_size=1000) \
+            as archive:
+        archive.write([data(i, START + i) for i in range(100)])
+    assert archive.segments == len(ArchiveReader(prefix + ".idx").blocks)
+    with open(prefix + ".idx", "a") as f:
+        f.write('{"segment": "run_F_')
+    reader = ArchiveReader(prefix + ".idx")
+    assert [rec.packageNumber for rec in reader.records()] == \
+        list(range(100))
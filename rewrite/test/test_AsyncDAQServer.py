@@ -0,0 +1,112 @@
+import os
+import asyncio
+import zmq
+import zmq.asyncio
+from ..lib.common.Record import RecordType
+from ..lib.common.WireFormat import decode_records
+from ..lib.daq.AsyncDAQServer import AsyncDAQServer
+from ..lib.utils.Control import encode_request, decode_reply
+from ..lib.utils.Stream import subscribe
+from .test_Connection import PipePort
+
+
+class FakeCardPort(PipePort):
+    """
+    Pipe backed serial port answering commands like the DAQ card
+    """
+
+    RESPONSES = {
+        "DS": ["DS S0=00000010 S1=00000020 S2=00000000 S3=00000000 S4=00000005 S5=00000064"],
+        "DC": ["DC C0=00 C1=00 C2=00 C3=00"],
+        "TL": ["TL L0=300 L1=300 L2=300 L3=300"],
+    }
+
+    def __init__(self):
+        PipePort.__init__(self)
+        self.commands = []
+
+    def write(self, data):
+        command = data.decode("ascii").strip()
+        self.commands.append(command)
+        if command == "ST 0" or command.startswith("WC"):
+            # the card answers with one more line, which is not data
+            self.send(command, command + " OK")
+            return
+        self.send(command, *self.RESPONSES.get(command, []))
+
+    def send(self, *lines):
+        os.write(self.wfd, b"".join(l.encode("ascii") + b"\r\n"
+                                    for l in lines))
+
+
+async def run_server(port):
+    server = AsyncDAQServer("tcp://127.0.0.1:*", "tcp://127.0.0.1:*",
+                            batch_size=10, serial_port=port)
+    await server.start()
+    publish_address, control_address = server.bound_addresses()
+    ctx = zmq.asyncio.Context()
+    sub = ctx.socket(zmq.SUB)
+    subscribe(sub)
+    sub.connect(publish_address)
+    control = ctx.socket(zmq.DEALER)
+    control.connect(control_address)
+
+    async def call(request_id, method, *params):
+        await control.send_multipart([b"", encode_request(request_id, method,
+                                                          params)])
+        return decode_reply((await control.recv_multipart())[-1])
+
+    try:
+        # wait for the subscription to reach the publisher
+        while not await sub.poll(50):
+            await call(0, "read_scalars")
+        while await sub.poll(50):
+            await sub.recv_multipart()
+
+        assert await call(1, "read_scalars") == (1, [16, 32, 0, 0, 5], None)
+        rec = decode_records((await sub.recv_multipart())[1])[0]
+        assert rec.type == RecordType.COUNTER
+        assert rec.payload.counts_trigger == 5
+
+        assert await call(2, "setup_channel", True, True) == (2, None, None)
+        assert "WC 00 03" in port.commands
+        _, _, error = await call(3, "shutdown")
+        assert error.startswith("AttributeError")
+
+        # skip the replies to the configuration commands
+        while await sub.poll(50):
+            await sub.recv_multipart()
+        port.send("80EE0049 00 00 00 00 00 00 00 00 01C3D9B9 000000 000000 A 0 0000",
+                  "80EE<\x7f> garbage",
+                  "80EE004A 00 00 00 00 00 00 00 00 01C3D9B9 000000 000000 A 0 0000")
+        records = []
+        while len(records) < 2:
+            records += decode_records((await sub.recv_multipart())[1])
+        # the invalid line is dropped like in the DAQServer
+        assert [r.payload.msg[:8] for r in records] == ["80EE0049", "80EE004A"]
+        assert not await sub.poll(50)
+
+        # records of one read keep the order of the lines
+        port.send("80EE004B 00 00 00 00 00 00 00 00 01C3D9B9 000000 000000 A 0 0000",
+                  FakeCardPort.RESPONSES["DS"][0],
+                  "80EE004C 00 00 00 00 00 00 00 00 01C3D9B9 000000 000000 A 0 0000")
+        records = []
+        while len(records) < 3:
+            records += decode_records((await sub.recv_multipart())[1])
+        assert [r.type for r in records] == \
+            [RecordType.DATA, RecordType.COUNTER, RecordType.DATA]
+        numbers = [r.packageNumber for r in records]
+        assert numbers == list(range(numbers[0], numbers[0] + 3))
+    finally:
+        sub.close(linger=0)
+        control.close(linger=0)
+        ctx.term()
+        await server.close()
+
+
+def test_async_server():
+    port = FakeCardPort()
+    try:
+        asyncio.run(asyncio.wait_for(run_server(port), 10))
+    finally:
+        port.close()
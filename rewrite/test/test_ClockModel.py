@@ -0,0 +1,94 @@
+import calendar
+import random
+import numpy as np
+from ..lib.analyzers.ClockModel import ClockModel
+from ..lib.analyzers.TriggerLines import parse_lines
+
+START = calendar.timegm((2020, 11, 18, 12, 0, 0)) * 10 ** 9
+
+
+def line(trigger_count, one_pps, second, correction=0):
+    """
+    Trigger line of a second after 12:00:00 on 18.11.2020
+    """
+    return "%08X 80 00 00 00 00 00 00 00 %08X %02d%02d%02d.000 181120 A 07 0 %+05d" % (
+        trigger_count % 2 ** 32, one_pps % 2 ** 32, 12 + second // 3600,
+        second // 60 % 60, second % 60, correction)
+
+
+def latches(seconds, frequency=25.0e6, drift=0.0, start=2 ** 32 - 60000000):
+    """
+    1PPS counter values of an oscillator with a linear drift
+    """
+    return [int(round(start + frequency * t + 0.5 * drift * t * t))
+            for t in seconds]
+
+
+def timestamp(clock, text):
+    fields = text.split()
+    return clock.timestamp(int(fields[0], 16), int(fields[9], 16),
+                           fields[10], fields[11], fields[15])
+
+
+def test_fit_with_rollover():
+    clock = ClockModel()
+    for count in latches(range(20), drift=3.0):
+        clock.latch(count % 2 ** 32)
+    assert abs(clock.frequency - (25.0e6 + 3.0 * 19)) < 0.05
+    assert abs(clock.drift - 3.0) < 1e-3
+
+
+def test_missed_latch():
+    clock = ClockModel()
+    seconds = [0, 1, 2, 3, 5, 6, 7, 10]
+    for second, count in zip(seconds, latches(seconds, 41.666667e6)):
+        clock.latch(count % 2 ** 32)
+    assert abs(clock.frequency - 41.666667e6) < 1e-3
+
+
+def test_timestamp():
+    clock = ClockModel()
+    counts = latches(range(3))
+    assert timestamp(clock, line(counts[0] + 100, counts[0], 0)) == \
+        START + 4000
+    assert timestamp(clock, line(counts[1] + 12500000, counts[1], 1, 20)) == \
+        START + 1520000000
+    # the 1PPS counter switches before the GPS time
+    assert timestamp(clock, line(counts[2] + 25, counts[2], 1)) == \
+        START + 2000001000
+    assert timestamp(clock, line(counts[2] + 50, counts[2], 2)) == \
+        START + 2000002000
+
+
+def test_timestamps_same_as_scalar():
+    rnd = random.Random(3)
+    counts = latches(range(60), 25.0e6 + 80, 0.5)
+    text = []
+    for second in range(59):
+        trigger = counts[second]
+        for _ in range(rnd.randrange(5)):
+            trigger += rnd.randrange(1, 8000000)
+            text.append(line(trigger, counts[second], second,
+                             rnd.randrange(-20, 20)))
+    scalar = ClockModel()
+    expected = [timestamp(scalar, t) for t in text]
+    batch = ClockModel()
+    parsed = parse_lines([t.encode("ascii") for t in text])
+    ns = np.concatenate([batch.timestamps(parsed[i:i + 7])[0]
+                         for i in range(0, len(parsed), 7)])
+    assert ns.tolist() == expected
+    assert batch.frequency == scalar.frequency
+
+
+def test_rollover_without_gps():
+    clock = ClockModel()
+    counts = [2 ** 32 - 1000, 2 ** 32 - 500, 500, 2 ** 32 - 250, 100]
+    text = ["%08X 80 00 00 00 00 00 00 00 00000002 000000.000 000000 V 00 0 +0000"
+            % count for count in counts]
+    expected = [round((count - 2 + 2 ** 32 * wraps) / 25.0e6 * 1e9)
+                for count, wraps in zip(counts, [0, 0, 1, 1, 2])]
+    assert [timestamp(clock, t) for t in text] == expected
+    batch = ClockModel()
+    parsed = parse_lines([t.encode("ascii") for t in text])
+    assert batch.timestamps(parsed[:3])[0].tolist() + \
+        batch.timestamps(parsed[3:])[0].tolist() == expected
@@ -0,0 +1,84 @@
+import random
+import numpy as np
+from ..lib.analyzers.Coincidence import (CoincidenceFinder, find_coincidences,
+                                         channel_mask)
+from ..analysis_scripts.simple_reader import analyze_files
+
+
+def random_pulses(n, seed):
+    rnd = random.Random(seed)
+    times = [[] for _ in range(4)]
+    t = 0.0
+    for _ in range(n):
+        t += rnd.choice([0.0, 10.0, 150.0, 199.0, 250.0, 5000.0])
+        times[rnd.randrange(4)].append(t)
+    return [np.array(t) for t in times]
+
+
+def test_clusters():
+    times = [np.array([0.0, 1000.0, 1100.0, 5000.0]),
+             np.array([150.0, 1250.0]),
+             np.array([340.0, 1500.0, 5000.0]),
+             np.array([])]
+    found = find_coincidences(times, window=200.0, fold=3)
+    assert found.tolist() == [(0.0, channel_mask((0, 1, 2)), 3)]
+    found = find_coincidences(times, [(0, 2)], window=200.0)
+    assert found.tolist() == [(0.0, 0b111, 3), (5000.0, 0b101, 2)]
+    found = find_coincidences(times, [(0,), (1,)], window=200.0)
+    assert found.tolist() == [(0.0, 0b111, 3), (1000.0, 0b11, 3),
+                              (5000.0, 0b101, 2)]
+
+
+def test_streaming_same_as_batch():
+    times = random_pulses(3000, 1)
+    expected = find_coincidences(times, window=200.0).tolist()
+
+    finder = CoincidenceFinder(window=200.0)
+    merged = sorted((t, ch) for ch in range(4) for t in times[ch])
+    found = [finder.add(ch, t) for t, ch in merged] + [finder.flush()]
+    assert [c for c in found if c is not None] == expected
+
+    finder = CoincidenceFinder(window=200.0)
+    found = []
+    for start in range(0, int(merged[-1][0]) + 700, 700):
+        found += finder.process([t[(t >= start) & (t < start + 700)]
+                                 for t in times]).tolist()
+    found.append(finder.flush())
+    assert [c for c in found if c is not None] == expected
+
+
+def test_strict_order():
+    times = [np.array([0.0, 1000.0]), np.array([0.0, 990.0])]
+    assert find_coincidences(times, [(0, 1)]).tolist() == \
+        [(0.0, 0b11, 2), (990.0, 0b11, 2)]
+    # equal and out of order times split the clusters
+    assert find_coincidences(times, [(0, 1)], strict_order=True).tolist() == \
+        [(990.0, 0b11, 2)]
+
+    times = random_pulses(3000, 2)
+    expected = find_coincidences(times, strict_order=True).tolist()
+    finder = CoincidenceFinder(strict_order=True)
+    merged = sorted((t, ch) for ch in range(4) for t in times[ch])
+    found = [finder.add(ch, t) for t, ch in merged] + [finder.flush()]
+    assert [c for c in found if c is not None] == expected
+
+
+def count_muons(**options):
+    muons = []
+    analyze_files(["rewrite/test/data/daq.txt"], muons.append,
+                  muon=[(0, 1)], **options)
+    return len(muons)
+
+
+def test_bundled_data():
+    assert count_muons() == 336
+    # the former simple_reader found 161 muons, every difference to it can
+    # be switched back
+    assert count_muons(legacy_clock=True, strict_order=True,
+                       flush=False) == 161
+    # pulses with the same time in both channels were split
+    assert count_muons(strict_order=True) == 162
+    # the last cluster was never reported
+    assert count_muons(flush=False) == 335
+    # the clock of the former version gives the same clusters on this file
+    assert count_muons(legacy_clock=True) == 336
@@ -0,0 +1,117 @@
+import queue
+import threading
+import pytest
+from ..lib.daq.CommandEngine import CommandEngine, spec_for, PendingCommand
+from ..lib.daq.Exceptions import DAQTimeoutError
+from ..lib.daq.Provider import ReceivedLine
+
+BA_RESPONSE = ["BA 1495", "calibrate pressure",
+               "mBar now reads  = 1015.0  (use cmd 'SA' when done)"]
+DG_RESPONSE = ["Date+Time: 19/04/14 08:59:25.000", "Status:    A (valid)",
+               "PosFix:    1", "Latitude:  52:27.137 N",
+               "Longitude: 013:17.879 E", "Altitude:  58.2m",
+               "Sats used: 8", "PPS delay: 50 msec", "FPGA time: E3B2D65A",
+               "ChkSumErr: 0"]
+
+
+class FakeCard(object):
+    """
+    Answers commands like the DAQ card: echo followed by the response
+    """
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.lines = queue.Queue()
+
+    def put(self, command):
+        self.lines.put(command.encode("ascii"))
+        for line in self.responses.get(command, []):
+            self.lines.put(line.encode("ascii"))
+
+    def receive(self, timeout=None):
+        try:
+            return [ReceivedLine(self.lines.get(True, timeout), None, None)]
+        except queue.Empty:
+            return []
+
+
+def test_query_response():
+    card = FakeCard({
+        "DC": ["DC C0=0F C1=00 C2=0A C3=00"],
+        "BA": ["BA 1495", "calibrate pressure", "mBar now reads  = 1015.0"],
+        "TL 0 300": [],
+        "WC 00 0F": ["TL L0=300 L1=300 L2=300 L3=300"],
+    })
+    engine = CommandEngine(card)
+    assert engine.execute("DC", 1.0) == ["DC C0=0F C1=00 C2=0A C3=00"]
+    assert engine.execute("TL 0 300", 1.0) == []
+    # the line after the echo of a register write is part of the command
+    assert engine.execute("WC 00 0F", 1.0) == \
+        ["TL L0=300 L1=300 L2=300 L3=300"]
+    assert engine.execute("BA", 1.0)[-1].startswith("mBar")
+    assert not engine.pending
+
+
+def test_timeout():
+    engine = CommandEngine(FakeCard({}))
+    engine.client.put = lambda command: None
+    with pytest.raises(DAQTimeoutError):
+        engine.execute("TH", 0.1)
+    assert not engine.pending
+
+
+def test_offered_lines():
+    card = FakeCard({})
+    engine = CommandEngine(card)
+    engine.fed = True
+    result = []
+    sent = threading.Event()
+    card.put = lambda command: sent.set()
+    t = threading.Thread(target=lambda: result.append(
+        engine.execute("TH", 2.0)))
+    t.start()
+    assert sent.wait(2.0)
+    assert engine.offer("75E75C33 A9 00 2A 00 00") is None
+    assert engine.offer("TH") == "echo"
+    assert engine.offer("TH TH=22.9") == "response"
+    t.join()
+    assert result == [["TH TH=22.9"]]
+
+    sent.clear()
+    t = threading.Thread(target=lambda: result.append(
+        engine.execute("ST 0", 2.0)))
+    t.start()
+    assert sent.wait(2.0)
+    assert engine.offer("ST 0") == "echo"
+    assert engine.offer("ST 0 done") == "consumed"
+    t.join()
+    assert result[-1] == ["ST 0 done"]
+
+
+def test_spec():
+    assert spec_for("TL").pattern is not None
+    assert spec_for("TL 0 300").pattern is None
+    pending = PendingCommand("DG", spec_for("DG"))
+    assert pending.feed("DG") == "echo"
+    assert pending.feed("Status: A (valid)") is None
+    for i, line in enumerate(DG_RESPONSE):
+        assert pending.feed(line) == "response"
+        # trigger lines and other records are never part of the response
+        assert pending.feed("80EE0049 80 01 00 01 00 01 00 01 2AC0F6A3 "
+                            "085925.157 190414 A 08 0 +0000") is None
+        assert pending.feed("DS S0=00000001 S1=00000002") is None
+        assert pending.done.is_set() == (i == len(DG_RESPONSE) - 1)
+
+
+def test_data_lines_within_response():
+    for command, response in (("BA", BA_RESPONSE), ("ST 0", ["ST 0 done"]),
+                              ("WC 00 0F", ["TL L0=300 L1=300"])):
+        pending = PendingCommand(command, spec_for(command),
+                                 passthrough=False)
+        assert pending.feed(command) == "echo"
+        for line in response:
+            assert pending.feed("80EE0049 00 01 00 01 00 01 00 01 2AC0F6A3 "
+                                "085925.157 190414 A 08 0 +0000") is None
+            assert pending.feed(line) == "consumed"
+        assert pending.done.is_set()
+        assert pending.response == response
@@ -0,0 +1,110 @@
+import os
+import fcntl
+import struct
+import termios
+import threading
+import queue
+import logging
+import pytest
+from time import time, monotonic
+from ..lib.daq.Connection import (DAQConnection, ReadStatistics,
+                                  LatencyStatistics, decode_chunk)
+
+
+class PipePort(object):
+    """
+    Minimal stand-in for serial.Serial backed by a pipe.
+    """
+
+    def __init__(self):
+        self.rfd, self.wfd = os.pipe()
+
+    def fileno(self):
+        return self.rfd
+
+    @property
+    def in_waiting(self):
+        buf = fcntl.ioctl(self.rfd, termios.FIONREAD, struct.pack("i", 0))
+        return struct.unpack("i", buf)[0]
+
+    def read(self, size):
+        return os.read(self.rfd, size)
+
+    def close(self):
+        os.close(self.rfd)
+        os.close(self.wfd)
+
+
+def test_read_select_splits_chunks():
+    port = PipePort()
+    out = queue.Queue()
+    conn = DAQConnection(queue.Queue(), out, serial_port=port)
+    reader = threading.Thread(target=conn.read)
+    reader.start()
+    before = (time(), monotonic())
+    os.write(port.wfd, b"DS S0=00000001\r\nTH TH=2")
+    os.write(port.wfd, b"2.9\r\n\r\n80 01 00\r\n")
+    lines = []
+    while len(lines) < 3:
+        received, received_monotonic, chunk = decode_chunk(
+            out.get(timeout=2))
+        assert received >= before[0] and received_monotonic >= before[1]
+        lines.extend(chunk)
+    conn.running = 0
+    reader.join()
+    port.close()
+    assert lines == [b"DS S0=00000001", b"TH TH=22.9", b"80 01 00"]
+    assert conn.statistics.total_lines == 3
+    assert conn.statistics.total_bytes == 40
+
+
+def test_write_without_delay():
+    written = queue.Queue()
+
+    class WritePort(object):
+        def write(self, data):
+            written.put((monotonic(), data))
+
+    commands = queue.Queue()
+    conn = DAQConnection(commands, queue.Queue(), serial_port=WritePort())
+    writer = threading.Thread(target=conn.write)
+    writer.start()
+    try:
+        for command in ("TH", "DS"):
+            sent = monotonic()
+            commands.put(command)
+            when, data = written.get(timeout=2)
+            assert data == command.encode("ascii") + b"\r"
+            # the old writer checked the queue every 0.1 s
+            assert when - sent < 0.05
+    finally:
+        conn.running = 0
+        writer.join()
+
+
+def test_read_statistics_rates():
+    stats = ReadStatistics(logging.getLogger(), interval=2.0)
+    stats._since = 0.0
+    stats.add(1000, 10)
+    assert not stats.report(now=1.0)
+    assert stats.report(now=2.0)
+    assert stats.bytes_per_second == 500.0
+    assert stats.lines_per_second == 5.0
+
+
+def test_latency_statistics():
+    stats = LatencyStatistics(logging.getLogger(), interval=2.0)
+    stats._since = 0.0
+    stats.add(0.001)
+    stats.add(0.003)
+    assert not stats.report(now=1.0)
+    assert stats.report(now=2.0)
+    assert stats.mean == pytest.approx(0.002)
+    assert stats.maximum == 0.003
+    assert stats.count == 2
+
+
+def test_unknown_read_mode():
+    with pytest.raises(ValueError):
+        DAQConnection(queue.Queue(), queue.Queue(), read_mode="foo",
+                      serial_port=PipePort())
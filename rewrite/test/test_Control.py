@@ -0,0 +1,75 @@
+import threading
+import pytest
+from time import sleep
+from ..lib.utils.Control import (CONTROL_METHODS, ControlServer,
+                                 ControlProxy, ControlError,
+                                 ControlTimeoutError, encode_request,
+                                 decode_request, encode_reply, decode_reply)
+
+
+class Card(object):
+
+    def __init__(self):
+        self.thresholds = None
+
+    def set_threashold(self, th_0, th_1, th_2, th_3):
+        self.thresholds = [th_0, th_1, th_2, th_3]
+
+    def read_scalars(self):
+        return (1, 2, 3, 4, 5)
+
+    def get_gps_info(self):
+        sleep(0.5)
+        return "gps"
+
+    def fail(self):
+        raise ValueError("broken")
+
+    def _private(self):
+        pass
+
+    def run(self):
+        raise AssertionError("internal method called")
+
+
+def test_protocol():
+    assert decode_request(encode_request(3, "do", ["TL"])) == (3, "do", ["TL"])
+    assert decode_reply(encode_reply(3, [1, 2])) == (3, [1, 2], None)
+    assert decode_reply(encode_reply(3, error="x")) == (3, None, "x")
+    _, _, error = decode_reply(encode_reply(3, object()))
+    assert error.startswith("Cannot encode")
+    with pytest.raises(ValueError):
+        decode_request(b"[1, 2]")
+
+
+def test_server_and_proxy():
+    card = Card()
+    server = ControlServer(card, "tcp://127.0.0.1:*",
+                           methods=CONTROL_METHODS + ("fail",))
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    proxy = ControlProxy(server.address, timeout=5.0)
+    try:
+        assert proxy.read_scalars() == [1, 2, 3, 4, 5]
+        assert proxy.set_threashold(110, 110, 180, 110) is None
+        assert card.thresholds == [110, 110, 180, 110]
+        with pytest.raises(ControlError, match="ValueError: broken"):
+            proxy.fail()
+        with pytest.raises(ControlError, match="AttributeError"):
+            proxy.submit("_private").result()
+        # public methods which are not whitelisted are rejected as well
+        with pytest.raises(ControlError, match="AttributeError"):
+            proxy.run()
+
+        # a slow call does not hold back the calls sent after it
+        slow = proxy.submit("get_gps_info")
+        assert proxy.read_scalars() == [1, 2, 3, 4, 5]
+        with pytest.raises(ControlTimeoutError):
+            slow.result(0.01)
+        assert proxy.submit("get_gps_info").result() == "gps"
+        assert not proxy._replies
+    finally:
+        proxy.close()
+        server.shutdown()
+        thread.join()
+        server.server_close()
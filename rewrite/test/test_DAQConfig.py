@@ -0,0 +1,41 @@
+import pytest
+from ..lib.daq.DAQConfig import DAQConfiguration, channel_register
+
+
+def test_replies():
+    config = DAQConfiguration()
+    assert not config.known
+    assert config.update_from_response("DC C0=2F C1=00 C2=0A C3=04")
+    assert config.update_from_response("TL L0=110 L1=110 L2=180 L3=110")
+    assert not config.update_from_response("TH TH=22.9")
+    assert config.known
+    assert config.channel_mask == 0x0F
+    assert config.coincidence == "threefold"
+    assert config.thresholds == [110, 110, 180, 110]
+
+
+def test_commands_for_changes_only():
+    config = DAQConfiguration()
+    config.update_from_response("DC C0=2F C1=00 C2=0A C3=04")
+    config.update_from_response("TL L0=110 L1=110 L2=180 L3=110")
+    register = channel_register(True, True, True, True, "threefold")
+    assert config.commands_for({0: register, 2: 0x0A},
+                               [110, 110, 180, 110]) == []
+    assert config.commands_for({3: 0x00}, [110, 120, None, 110]) == \
+        ["WC 03 00", "TL 1 120"]
+
+
+def test_commands_update_model():
+    config = DAQConfiguration()
+    config.update_from_command("WC 00 1A")
+    config.update_from_command("TL 4 300")
+    config.update_from_command("TL 2 200")
+    assert config.channel_mask == 0x0A
+    assert config.coincidence == "twofold"
+    assert config.thresholds == [300, 300, 200, 300]
+
+
+def test_channel_register():
+    assert channel_register(True, False, True, False, "twofold") == 0x15
+    with pytest.raises(ValueError):
+        channel_register(coincidence="sixfold")
@@ -0,0 +1,76 @@
+import random
+import numpy as np
+from ..lib.analyzers.DecayDetector import DecayDetector
+from ..lib.analyzers.PulseExtractor import PULSE_DTYPE
+
+START = 1605700800 * 10 ** 9
+
+
+def pulses(rows):
+    """
+    PULSE_DTYPE rows from event id, channel, rising and width, events are
+    10 us apart
+    """
+    return np.array([(event_id, channel, rising, rising + width,
+                      START + event_id * 10000)
+                     for event_id, channel, rising, width in rows],
+                    dtype=PULSE_DTYPE)
+
+
+def test_decay_across_triggers():
+    batch = pulses([(0, 1, 9000.0, 20.0),  # stopped muon
+                    (1, 1, 500.0, 20.0),  # its decay in the next event
+                    (2, 1, 100.0, 20.0),  # muon which does not decay
+                    (5, 1, 100.0, 20.0),  # too late, a new muon
+                    (5, 3, 150.0, 20.0),  # and vetoed
+                    (6, 1, 0.0, 20.0)])  # no muon left
+    detector = DecayDetector(veto_channel=3)
+    found = np.concatenate([detector.process(batch[:1]),
+                            detector.process(batch[1:])])
+    assert found.tolist() == [(0, 1, START + 9000, 1500.0)]
+    assert detector.decays == 1
+    assert detector.expired == 1
+    assert detector.vetoed == 1
+    assert len(detector) == 1
+
+
+def test_same_as_linear_search():
+    rnd = random.Random(3)
+    rows = []
+    for event_id in range(3000):
+        for channel in (1, 1, 1, 3):
+            for _ in range(rnd.choice([0, 0, 1, 2])):
+                rows.append((event_id, channel,
+                             float(rnd.randrange(0, 10000, 25)),
+                             rnd.choice([20.0, 20.0, 9000.0])))
+    batch = pulses(rows)
+    batch.sort(order=["event_id", "channel", "rising"])
+
+    # all waiting muons in a plain list
+    expected, muons, last_veto = [], [], -np.inf
+    for event_id, channel, rising, width in sorted(
+            rows, key=lambda r: r[0] * 10000 + r[2]):
+        time = event_id * 10000 + rising
+        if channel == 3:
+            muons = [m for m in muons if m[1] < time - 100]
+            last_veto = time
+            continue
+        if width > 8000 or time - last_veto < 100:
+            continue
+        muons = [m for m in muons if time - m[1] < 20000]
+        decays = [m for m in muons if time - m[1] > 3000]
+        if decays:
+            muons.remove(decays[-1])
+            expected.append((decays[-1][0], event_id,
+                             START + int(decays[-1][1]),
+                             time - decays[-1][1]))
+        else:
+            muons = (muons + [(event_id, time)])[-3:]
+
+    detector = DecayDetector(veto_channel=3, min_decay_time=3000,
+                             max_pulse_width=8000, capacity=3)
+    first = batch["event_id"] < 1234
+    found = np.concatenate([detector.process(batch[first]),
+                            detector.process(batch[~first])])
+    assert found.tolist() == expected
+    assert detector.dropped
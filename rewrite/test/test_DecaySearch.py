@@ -0,0 +1,52 @@
+import logging
+import random
+import numpy as np
+from ..lib.analyzers.DecaySearch import DecaySearch, REJECTION_REASONS
+from ..lib.analyzers.DecayTrigger import DecayTriggerThorough
+from ..lib.analyzers.PulseExtractor import PULSE_DTYPE
+
+
+def random_events(n, seed):
+    """
+    Events as returned by PulseExtractor.extract and as PULSE_DTYPE rows
+    """
+    rnd = random.Random(seed)
+    events, rows = [], []
+    for event_id in range(n):
+        event = ["2020-11-18 12:00:00"]
+        for channel in range(4):
+            pulses = sorted(
+                (float(re), float(re + rnd.choice([5, 20, 40, 9000])))
+                for re in rnd.sample(range(0, 10000, 25),
+                                     rnd.choice([0, 0, 1, 1, 2, 3])))
+            event.append(pulses)
+            rows += [(event_id, channel, re, fe, event_id * 1000)
+                     for re, fe in pulses]
+        events.append(event)
+    return events, np.array(rows, dtype=PULSE_DTYPE)
+
+
+def test_same_as_decay_trigger():
+    events, pulses = random_events(3000, 2)
+    trigger = DecayTriggerThorough(logging.getLogger())
+    for single, double, veto in ((1, 2, 3), (2, 2, 0), (0, 1, 2)):
+        options = dict(min_decay_time=100, min_single_pulse_width=10,
+                       max_single_pulse_width=8000,
+                       min_double_pulse_width=10,
+                       max_double_pulse_width=8000)
+        expected = []
+        for event_id, event in enumerate(events):
+            decay = trigger.trigger(event, single + 1, double + 1, veto + 1,
+                                    **options)
+            if decay is not None:
+                expected.append((event_id, event_id * 1000, decay))
+        search = DecaySearch(single, double, veto, **options)
+        first = pulses["event_id"] < 1500
+        found = np.concatenate([search.search(pulses[first]),
+                                search.search(pulses[~first])])
+        assert found.tolist() == expected
+        assert search.decays == len(expected)
+        assert search.events == len(np.unique(pulses["event_id"]))
+        assert search.decays + sum(search.rejected[r]
+                                   for r in REJECTION_REASONS) == \
+            search.events
@@ -0,0 +1,43 @@
+import time
+import pytest
+from ..lib.utils.GroupCommitWriter import GroupCommitWriter
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_writes_in_groups(tmp_path):
+    path = tmp_path / "raw.txt"
+    writer = GroupCommitWriter(str(path), "w", flush_interval=60,
+                               buffer_size=10, fsync_interval=0)
+    writer.write("line 1\n")
+    assert read(path) == ""
+    # the buffer size is reached, the thread writes without waiting
+    writer.write("line 2\n")
+    deadline = time.monotonic() + 5
+    while read(path) != "line 1\nline 2\n" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert read(path) == "line 1\nline 2\n"
+    writer.write("line 3\n")
+    writer.close()
+    assert read(path) == "line 1\nline 2\nline 3\n"
+    assert (writer.writes, writer.fsyncs) == (2, 2)
+    with pytest.raises(ValueError):
+        writer.write("line 4\n")
+
+
+def test_flush_interval_and_durability(tmp_path):
+    path = tmp_path / "raw.txt"
+    with GroupCommitWriter(str(path), flush_interval=0.05) as writer:
+        writer.write("line 1\n")
+        deadline = time.monotonic() + 5
+        while not read(path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert read(path) == "line 1\n"
+        assert "everything the system did not write" in writer.durability
+    assert writer.fsyncs == 0
+    synced = GroupCommitWriter(str(path), fsync_interval=5)
+    synced.close()
+    assert "at most the last 5 s" in synced.durability
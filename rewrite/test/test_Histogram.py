@@ -0,0 +1,33 @@
+import json
+import numpy as np
+import pytest
+from ..lib.analyzers.Histogram import Histogram
+
+
+def test_fill_like_numpy():
+    edges = np.linspace(0, 10, 21)
+    values = np.random.default_rng(1).normal(5, 4, 10000)
+    values[:3] = [0.0, 10.0, np.nan]
+    histogram = Histogram(edges)
+    for chunk in np.array_split(values, 7):
+        histogram.fill(chunk)
+    assert histogram.counts.tolist() == \
+        np.histogram(values[~np.isnan(values)], edges)[0].tolist()
+    assert histogram.underflow == np.count_nonzero(values < 0)
+    assert histogram.overflow == np.count_nonzero(values > 10) + 1
+    assert histogram.entries == len(values)
+
+
+def test_merge_and_serialize():
+    first = Histogram([0, 1, 2, 4])
+    first.fill([-1, 0.5, 1, 3, 3.5, 5])
+    second = Histogram.from_dict(json.loads(json.dumps(first.to_dict())))
+    assert second.to_dict() == first.to_dict()
+    second.fill(2)
+    first.merge(second)
+    assert first.counts.tolist() == [2, 2, 5]
+    assert (first.underflow, first.overflow) == (2, 2)
+    with pytest.raises(ValueError):
+        first.merge(Histogram([0, 1, 2, 3]))
+    with pytest.raises(ValueError):
+        Histogram([0, 2, 1])
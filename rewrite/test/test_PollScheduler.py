@@ -0,0 +1,99 @@
+import queue
+import threading
+from ..lib.common.Record import RecordType
+from ..lib.daq.CommandEngine import CommandEngine
+from ..lib.daq.DAQServer import record_for_line
+from ..lib.daq.PollScheduler import PollScheduler
+from .test_CommandEngine import FakeCard
+
+TRIGGER_LINE = ("80EE0049 80 01 00 01 00 01 00 01 2AC0F6A3 085925.157 "
+                "190414 A 08 0 +0000")
+
+
+class FakeServer(object):
+    COMMAND_TIMEOUT = 1.0
+
+    def __init__(self):
+        self.commands = CommandEngine(FakeCard({
+            "DS": ["DS S0=0000005F S1=00000000 S2=00000039 S3=00000000 S4=00000001 S5=271189CF"],
+            "TH": ["TH TH=22.9"],
+            "BA": ["BA 1495", "calibrate pressure",
+                   "mBar now reads  = 1015.0  (use cmd 'SA' when done)"],
+        }))
+        self.published = []
+        self.counters = 0
+        # set after the fourth COUNTER record
+        self.polled = threading.Event()
+
+    def publish(self, rec_type, payload, timestamp=None,
+                received_monotonic=None):
+        self.published.append((rec_type, payload, timestamp))
+        if rec_type == RecordType.COUNTER:
+            self.counters += 1
+            if self.counters >= 4:
+                self.polled.set()
+
+
+def test_poll_publishes_intervals():
+    server = FakeServer()
+    poller = PollScheduler(server, interval=0.05, environment_every=2)
+    poller.start()
+    try:
+        assert server.polled.wait(5.0)
+    finally:
+        poller.stop()
+    assert not poller.running
+    counters = [p for p in server.published if p[0] == RecordType.COUNTER]
+    assert counters[0][1].delta_time is None
+    for _, payload, timestamp in counters[1:]:
+        assert payload.counts_ch0 == 95
+        assert 0.03 < payload.delta_time < 0.2
+        assert timestamp is not None
+    types = [p[0] for p in server.published[:5]]
+    assert types == [RecordType.COUNTER, RecordType.TEMPERATURE,
+                     RecordType.PRESSURE, RecordType.PRESSURE,
+                     RecordType.COUNTER]
+    assert server.published[3][1].pressure == "1015.0"
+
+
+def test_poll_keeps_data_lines_within_responses():
+    server = FakeServer()
+    card = server.commands.client
+    # trigger lines arrive between the lines of every response
+    card.responses = {command: [line for response_line in lines
+                                for line in (TRIGGER_LINE, response_line)]
+                      for command, lines in card.responses.items()}
+    engine = server.commands
+    engine.fed = True
+    running = True
+
+    def feed():
+        # passes the lines to the engine like DAQServer.process_incoming
+        while running:
+            try:
+                line = card.lines.get(timeout=0.05).decode("ascii")
+            except queue.Empty:
+                continue
+            if engine.offer(line) in (None, "response"):
+                record = record_for_line(line)
+                if record is not None:
+                    server.publish(*record)
+
+    feeder = threading.Thread(target=feed)
+    feeder.start()
+    poller = PollScheduler(server, interval=0.05, environment_every=1)
+    poller.start()
+    try:
+        assert server.polled.wait(5.0)
+    finally:
+        poller.stop()
+        running = False
+        feeder.join()
+    data = [p for p in server.published if p[0] == RecordType.DATA]
+    # one trigger line before every line of DS, TH and the three of BA
+    polls = sum(p[0] == RecordType.COUNTER for p in server.published)
+    assert len(data) >= 5 * polls - 4
+    assert all(p[1].msg == TRIGGER_LINE for p in data)
+    pressures = [p[1] for p in server.published
+                 if p[0] == RecordType.PRESSURE]
+    assert pressures and pressures[1].pressure == "1015.0"
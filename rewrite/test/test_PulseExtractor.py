@@ -0,0 +1,98 @@
+import logging
+import random
+import numpy as np
+from ..lib.analyzers.PulseExtractor import PulseExtractor, EdgeBuffer
+
+
+def extract_one_by_one(pe, lines):
+    """
+    Run the scalar path and collect the pulses like extract_many
+    """
+    pulses = []
+    event_id = 0
+    for line in lines:
+        event_time = pe.last_trigger_time
+        event = pe.extract(line)
+        if event is None:
+            continue
+        for channel in range(4):
+            for re, fe in event[channel + 1]:
+                pulses.append((event_id, channel, re, fe, event_time))
+        event_id += 1
+    return pulses
+
+
+def synthetic_lines(n, seed):
+    """
+    Trigger lines with counter rollovers, 1PPS switches and odd
+    frequencies
+    """
+    rnd = random.Random(seed)
+    count = rnd.randrange(2 ** 32)
+    one_pps = rnd.randrange(2 ** 32)
+    seconds = rnd.randrange(80000)
+    lines = []
+    for _ in range(n):
+        count = (count + rnd.choice([1, 50, 3000000, 30000000])) % 2 ** 32
+        if rnd.random() < 0.2:
+            one_pps = (one_pps + rnd.choice([25000000, 41000000,
+                                             2 ** 31])) % 2 ** 32
+            seconds += rnd.random() < 0.7
+        edges = [0x20 | rnd.randrange(32) if rnd.random() < 0.3 else 0
+                 for _ in range(8)]
+        if rnd.random() < 0.3:
+            edges[0] |= 0x80
+        lines.append("%08X %s %08X %06d.%03d 181120 A 07 0 +%04d" % (
+            count, " ".join("%02X" % e for e in edges), one_pps,
+            seconds % 240000, rnd.randrange(1000), rnd.randrange(50)))
+    return lines
+
+
+def check_same_as_scalar(lines, batch_size,
+                         vector_min_lines=PulseExtractor.VECTOR_MIN_LINES):
+    scalar = PulseExtractor(logging.getLogger(), "unused")
+    batch = PulseExtractor(logging.getLogger(), "unused")
+    batch.VECTOR_MIN_LINES = vector_min_lines
+    expected = extract_one_by_one(scalar, lines)
+    pulses = np.concatenate([batch.extract_many(lines[i:i + batch_size])
+                             for i in range(0, len(lines), batch_size)])
+    assert pulses.tolist() == expected
+    assert batch.event_count == scalar.event_count
+    for name in ("last_trigger_count", "last_trigger_time", "ini"):
+        assert getattr(batch, name) == getattr(scalar, name), name
+    for name in ("one_pps", "frequency", "drift"):
+        assert getattr(batch.clock, name) == getattr(scalar.clock, name), name
+    for name in ("re", "fe"):
+        assert [getattr(batch, name).get(channel) for channel in range(4)] == \
+            [getattr(scalar, name).get(channel) for channel in range(4)], name
+
+
+def test_extract_many_recorded():
+    with open("rewrite/test/data/daq.txt") as f:
+        lines = f.read().splitlines()
+    check_same_as_scalar(lines, 1000)
+    check_same_as_scalar(lines, 37)
+    check_same_as_scalar(lines, 37, vector_min_lines=1)
+
+
+def test_extract_many_rollover():
+    lines = synthetic_lines(2000, 1)
+    check_same_as_scalar(lines, 2000)
+    check_same_as_scalar(lines, 3)
+    check_same_as_scalar(lines, 3, vector_min_lines=1)
+
+
+def test_edge_buffer():
+    buffer = EdgeBuffer(capacity=2)
+    for i in range(5):
+        buffer.append(1, i * 1.25)
+    buffer.append(3, 7.5)
+    assert buffer.capacity == 8
+    assert buffer.get(0) == []
+    assert buffer.get(1) == [0.0, 1.25, 2.5, 3.75, 5.0]
+    assert buffer.get(3) == [7.5]
+    assert len(buffer) == 6
+    buffer.clear()
+    assert len(buffer) == 0 and buffer.capacity == 8
+    buffer.set(2, [1.0, 2.0])
+    assert buffer.get(2) == [1.0, 2.0]
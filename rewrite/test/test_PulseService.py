@@ -0,0 +1,126 @@
+import logging
+from time import monotonic
+import zmq
+from ..lib.analyzers.PulseAnalyzer import PulseAnalyzer
+from ..lib.analyzers.PulseExtractor import PulseExtractor
+from ..lib.analyzers.PulseService import PulseService
+from ..lib.common.Record import Record, RecordType
+from ..lib.common.DataRecord import DataRecord
+from ..lib.common.TemperatureRecord import TemperatureRecord
+from ..lib.utils.Stream import (connect_subscriber, publish_record,
+                                recv_record, recv_waiting)
+
+
+def test_publishes_pulses_of_data_records():
+    with open("rewrite/test/data/daq.txt") as f:
+        lines = [line.rstrip("\n") for line in f]
+    expected = PulseExtractor(logging.getLogger(), "unused").extract_many(
+        lines)
+
+    with PulseService("tcp://127.0.0.1:1", "tcp://127.0.0.1:*") as service:
+        sub = connect_subscriber(zmq.Context.instance(), [RecordType.PULSES],
+                                 service.address)
+        sub.setsockopt(zmq.RCVTIMEO, 2000)
+        try:
+            assert service.process([Record(0, RecordType.TEMPERATURE, 1.0,
+                                           TemperatureRecord("TH TH=22.9"))]) \
+                is None
+            # wait for the subscription to reach the publisher
+            probe = Record(None, RecordType.PULSES, None, None)
+            while not sub.poll(50):
+                publish_record(service.socket, probe)
+            while sub.poll(50):
+                recv_record(sub)
+
+            records = [Record(i, RecordType.DATA, 1.0, DataRecord(line))
+                       for i, line in enumerate(lines)]
+            published = [service.process(records[i:i + 100])
+                         for i in range(0, len(records), 100)]
+            published = [rec for rec in published if rec is not None]
+            received = [recv_record(sub) for _ in published]
+        finally:
+            sub.close(linger=0)
+
+    events = 0
+    pulses = []
+    for rec in received:
+        assert rec.type == RecordType.PULSES
+        assert rec.payload.first_event == events
+        events += rec.payload.events
+        pulses += rec.payload.pulses.tolist()
+    assert pulses == expected.tolist()
+
+
+def test_throughput_of_single_line_messages():
+    with open("rewrite/test/data/daq.txt") as f:
+        lines = [line.rstrip("\n") for line in f] * 5
+    expected = PulseExtractor(logging.getLogger(), "unused").extract_many(
+        lines)
+
+    ctx = zmq.Context.instance()
+    pub = ctx.socket(zmq.PUB)
+    pub.setsockopt(zmq.SNDHWM, 0)
+    pub.bind("tcp://127.0.0.1:*")
+    sub = connect_subscriber(ctx, [RecordType.DATA],
+                             pub.getsockopt(zmq.LAST_ENDPOINT).decode())
+    sub.setsockopt(zmq.RCVHWM, 0)
+    try:
+        # wait for the subscription, invalid lines have no pulses
+        probe = Record(None, RecordType.DATA, 1.0, DataRecord("probe"))
+        while not sub.poll(50):
+            publish_record(pub, probe)
+        while sub.poll(50):
+            recv_record(sub)
+        for i, line in enumerate(lines):
+            publish_record(pub, Record(i, RecordType.DATA, 1.0,
+                                       DataRecord(line)))
+
+        with PulseService("tcp://127.0.0.1:1",
+                          "tcp://127.0.0.1:*") as service:
+            received = 0
+            pulses = []
+            start = monotonic()
+            while received < len(lines):
+                assert sub.poll(2000)
+                records = recv_waiting(sub, service.MAX_BATCH,
+                                       service.MAX_DELAY)
+                received += len(records)
+                rec = service.process(records)
+                if rec is not None:
+                    pulses += rec.payload.pulses.tolist()
+            elapsed = monotonic() - start
+    finally:
+        sub.close(linger=0)
+        pub.close(linger=0)
+
+    assert pulses == expected.tolist()
+    # a message at a time managed about 1200 lines per second
+    assert len(lines) / elapsed > 10000
+
+
+def test_pulse_file_and_analyzer(tmp_path):
+    with open("rewrite/test/data/daq.txt") as f:
+        lines = [line.rstrip("\n") for line in f]
+    pe = PulseExtractor(logging.getLogger())
+    expected = [event[1:] for event in map(pe.extract, lines)
+                if event is not None]
+
+    pulse_file = tmp_path / "pulses_P.txt"
+    service = PulseService("tcp://127.0.0.1:1", "tcp://127.0.0.1:*",
+                           str(pulse_file))
+    rec = service.process([Record(i, RecordType.DATA, 1.0, DataRecord(line))
+                           for i, line in enumerate(lines)])
+    service.server_close()
+    assert service.socket.closed
+    with open(pulse_file) as f:
+        written = f.read().splitlines()
+    assert len(written) == len(expected) == rec.payload.events
+
+    # an analyzer can take the events from the service
+    analyzer = PulseAnalyzer(headless=False,
+                             pulse_address="tcp://127.0.0.1:1")
+    try:
+        events = analyzer._events(None, [rec])
+    finally:
+        analyzer.sock.close(linger=0)
+    assert [event[1:] for event in events] == expected
@@ -0,0 +1,72 @@
+import zmq
+from ..lib.common.Record import Record, RecordType
+from ..lib.common.DataRecord import DataRecord
+from ..lib.common.TemperatureRecord import TemperatureRecord
+from ..lib.utils.RecordDispatcher import RecordDispatcher
+from ..lib.utils.Stream import publish_record
+
+
+def data(number):
+    return Record(number, RecordType.DATA, 1.0, DataRecord("line %d" % number))
+
+
+def test_fan_out_and_drops():
+    dispatcher = RecordDispatcher()
+    everything = dispatcher.register(name="everything")
+    slow = dispatcher.register([RecordType.DATA], queue_size=2, name="slow")
+    received = []
+    callback = dispatcher.register([RecordType.DATA], received.append)
+
+    temperature = Record(0, RecordType.TEMPERATURE, 1.0,
+                         TemperatureRecord("TH TH=22.9"))
+    dispatcher.dispatch([temperature] + [data(i) for i in range(1, 5)])
+    assert [r.packageNumber for r in everything.get_many()] == \
+        [0, 1, 2, 3, 4]
+    assert [r.packageNumber for r in slow.get_many()] == [1, 2]
+    stats = dispatcher.stats()
+    assert stats["slow"] == {"delivered": 2, "dropped": 2, "queued": 0}
+    assert stats["everything"]["dropped"] == 0
+
+    dispatcher.unregister(callback)
+    assert [r.packageNumber for r in received] == [1, 2, 3, 4]
+    dispatcher.dispatch([data(5)])
+    assert len(received) == 4
+    dispatcher.stop()
+    # the records queued before stopping are still delivered
+    assert [r.packageNumber for r in everything] == [5]
+    assert everything.closed
+    # the close marker stays for every later call
+    assert [r.packageNumber for r in slow.get_many()] == [5]
+    assert slow.get_many() == []
+    assert slow.get_many() == []
+    assert slow.get() is None
+    assert list(slow) == []
+
+
+def test_receives_subscribed_types():
+    ctx = zmq.Context()
+    pub = ctx.socket(zmq.PUB)
+    port = pub.bind_to_random_port("tcp://127.0.0.1")
+    dispatcher = RecordDispatcher(f"tcp://127.0.0.1:{port}", ctx)
+    consumer = dispatcher.register([RecordType.TEMPERATURE])
+    dispatcher.start()
+    try:
+        # wait for the subscription to reach the publisher
+        temperature = Record(0, RecordType.TEMPERATURE, 1.0,
+                             TemperatureRecord("TH TH=22.9"))
+        while not consumer.get_many(0.05):
+            publish_record(pub, temperature)
+        while consumer.get_many(0.05):
+            pass
+
+        publish_record(pub, data(1))
+        publish_record(pub, Record(2, RecordType.TEMPERATURE, 1.0,
+                                   TemperatureRecord("TH TH=23.0")))
+        rec = consumer.get(2.0)
+        assert rec.packageNumber == 2
+        assert rec.payload.temperature == 23.0
+    finally:
+        dispatcher.stop()
+        pub.close(linger=0)
+        ctx.term()
+    assert consumer.closed
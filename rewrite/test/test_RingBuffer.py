@@ -0,0 +1,59 @@
+import multiprocessing as mp
+import queue
+import pytest
+from ..lib.daq.RingBuffer import SharedRingBuffer, shared_memory
+
+# multiprocessing.shared_memory is new in Python 3.8
+pytestmark = pytest.mark.skipif(shared_memory is None,
+                                reason="needs multiprocessing.shared_memory")
+
+
+def producer(buf, n):
+    for i in range(0, n, 10):
+        buf.put_many([b"line %d" % j for j in range(i, i + 10)])
+
+
+def test_put_get():
+    buf = SharedRingBuffer(64)
+    try:
+        buf.put(b"foo")
+        buf.put_many([b"bar", b"baz"])
+        assert buf.qsize() == 3
+        assert buf.get() == b"foo"
+        assert buf.get_many() == [b"bar", b"baz"]
+        assert buf.empty()
+        with pytest.raises(queue.Empty):
+            buf.get(False)
+        assert buf.get_many(timeout=0.01) == []
+    finally:
+        buf.close()
+
+
+def test_wrap_around():
+    buf = SharedRingBuffer(32)
+    try:
+        for i in range(20):
+            line = b"x" * (i % 7) + b"%d" % i
+            buf.put(line)
+            assert buf.get_many(max_items=5) == [line]
+        with pytest.raises(ValueError):
+            buf.put(b"y" * 40)
+        buf.put(b"a" * 20)
+        with pytest.raises(queue.Full):
+            buf.put(b"b" * 20, timeout=0.01)
+    finally:
+        buf.close()
+
+
+def test_across_processes():
+    buf = SharedRingBuffer(256)
+    try:
+        p = mp.Process(target=producer, args=(buf, 1000))
+        p.start()
+        lines = []
+        while len(lines) < 1000:
+            lines.extend(buf.get_many(timeout=5))
+        p.join()
+        assert lines == [b"line %d" % i for i in range(1000)]
+    finally:
+        buf.close()
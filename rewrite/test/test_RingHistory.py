@@ -0,0 +1,18 @@
+import numpy as np
+from ..lib.utils.RingHistory import RingHistory
+
+
+def test_keeps_last_rows_in_order():
+    history = RingHistory(2, 5)
+    assert history.view().shape == (2, 0)
+    buffer = history.view().base
+    for i in range(12):
+        history.append((i, 10 * i))
+        rows = list(range(max(0, i - 4), i + 1))
+        assert history.view().tolist() == [rows, [10 * r for r in rows]]
+        assert history.view().base is buffer
+    assert len(history) == 5
+    history.clear()
+    assert len(history) == 0
+    history.append(np.array([1.0, 2.0]))
+    assert history.view().tolist() == [[1.0], [2.0]]
@@ -0,0 +1,44 @@
+import zmq
+from ..lib.common.Record import Record, RecordType
+from ..lib.common.DataRecord import DataRecord
+from ..lib.common.TemperatureRecord import TemperatureRecord
+from ..lib.utils.Stream import (topic, publish_record, connect_subscriber,
+                                recv_record)
+
+
+def test_topics_are_unique_prefixes():
+    topics = [topic(t) for t in RecordType] + [topic(None)]
+    for a in topics:
+        for b in topics:
+            assert a == b or not b.startswith(a)
+
+
+def test_subscriber_filters_by_type():
+    ctx = zmq.Context()
+    pub = ctx.socket(zmq.PUB)
+    port = pub.bind_to_random_port("tcp://127.0.0.1")
+    sub = connect_subscriber(ctx, [RecordType.TEMPERATURE],
+                             address=f"tcp://127.0.0.1:{port}")
+    sub.setsockopt(zmq.RCVTIMEO, 2000)
+    try:
+        # wait for the subscription to reach the publisher
+        temperature = Record(0, RecordType.TEMPERATURE, 1.0,
+                             TemperatureRecord("TH TH=22.9"))
+        poller = zmq.Poller()
+        poller.register(sub, zmq.POLLIN)
+        while not poller.poll(50):
+            publish_record(pub, temperature)
+        recv_record(sub)
+        while poller.poll(50):
+            recv_record(sub)
+
+        publish_record(pub, Record(1, RecordType.DATA, 1.0, DataRecord("x")))
+        publish_record(pub, Record(2, RecordType.TEMPERATURE, 1.0,
+                                   TemperatureRecord("TH TH=23.0")))
+        rec = recv_record(sub)
+        assert rec.packageNumber == 2
+        assert rec.payload.temperature == 23.0
+    finally:
+        sub.close(linger=0)
+        pub.close(linger=0)
+        ctx.term()
@@ -0,0 +1,46 @@
+import io
+import numpy as np
+from ..lib.analyzers.TriggerLines import (parse_block, parse_lines, parse_line,
+                                          iter_file, gps_seconds,
+                                          TRIGGER_DTYPE)
+
+LINES = [
+    b"B9C05556 00 27 00 00 00 00 00 00 00000002 000000.000 000000 V 00 8 +0000",
+    b"DS 00005E61 00007E94 00000000 00000000 00001C3A",
+    b"3A1F0C20 A3 00 2B 00 00 00 00 00 39A1B2C3 123456.789 181120 A 07 0 -0015",
+    # not in the fixed layout, but valid for the scripts
+    b"3A1F0C21 00 3C 00 00 00 00 00 00 39A1B2C3 123456.789 181120 A 7 0 15",
+    b"3A1F0C22 00 3C 00 00 00 00 00 00 39A1B2C3 123456.789 181120 A 07 0 +00x5",
+    b"3A1F0C2 00 3C 00 00 00 00 00 00 39A1B2C3 123456.789 181120 A 07 0 +0015",
+    b"3A1F0C23 00 3C 00 00 00 00 00 00 39A1B2C3 123456.789 A 07 0 +0015",
+    b"",
+]
+
+
+def test_parse():
+    lines = parse_block(b"\r\n".join(LINES))
+    assert lines.dtype == TRIGGER_DTYPE
+    assert list(lines["trigger_count"]) == [0xB9C05556, 0x3A1F0C20, 0x3A1F0C21]
+    assert list(lines["edges"][1]) == [0xA3, 0, 0x2B, 0, 0, 0, 0, 0]
+    assert lines["one_pps"][1] == 0x39A1B2C3
+    assert lines["gps_time"][1] == 12 * 3600 + 34 * 60 + 56 + 0.789
+    assert list(lines["date"]) == [0, 181120, 181120]
+    assert list(lines["valid"]) == [False, True, True]
+    assert list(lines["satellites"]) == [0, 7, 7]
+    assert list(lines["status"]) == [8, 0, 0]
+    assert list(lines["correction"]) == [0, -15, 15]
+    assert np.allclose(gps_seconds(lines)[1], 45296.789 - 0.015)
+
+
+def test_fast_and_slow_path_agree():
+    fields = [parse_line(line) for line in LINES]
+    expected = np.array([f for f in fields if f is not None],
+                        dtype=TRIGGER_DTYPE)
+    assert (parse_lines(LINES) == expected).all()
+
+
+def test_iter_file():
+    data = b"\n".join(LINES * 50)
+    lines = np.concatenate(list(iter_file(io.BytesIO(data), 100)))
+    assert (lines == parse_block(data)).all()
+    assert len(lines) == 150
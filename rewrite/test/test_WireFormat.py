@@ -0,0 +1,125 @@
+import numpy as np
+import pytest
+from ..lib.common.Record import Record, RecordType
+from ..lib.common.DataRecord import DataRecord
+from ..lib.common.CountRecord import CountRecord
+from ..lib.common.TemperatureRecord import TemperatureRecord
+from ..lib.common.PressureRecord import PressureRecord, PressureType
+from ..lib.common.PulseRecord import PulseRecord, PULSE_DTYPE
+from ..lib.common.WireFormat import (encode_record, decode_record, is_binary,
+                                     as_text, WireFormatError,
+                                     encode_data_batch, decode_records)
+
+
+def roundtrip(rec):
+    data = encode_record(rec)
+    assert is_binary(data)
+    return decode_record(data)
+
+
+def test_data_record():
+    msg = "75E75C33 A9 00 2A 00 00 00 00 00 7545B6DD 020929.026 060180 V 08 0 +0059"
+    rec = roundtrip(Record(17, RecordType.DATA, 1603983532.475, DataRecord(msg)))
+    assert rec.packageNumber == 17
+    assert rec.type == RecordType.DATA
+    assert rec.timestamp == 1603983532.475
+    assert rec.payload.msg == msg
+
+
+def test_count_record():
+    cnt = CountRecord(
+        "DS S0=0000005F S1=00000000 S2=00000039 S3=00000000 S4=00000001 S5=271189CF")
+    rec = roundtrip(Record(1, RecordType.COUNTER, 1.5, cnt))
+    assert rec.payload.valid
+    assert (rec.payload.counts_ch0, rec.payload.counts_ch2,
+            rec.payload.counts_trigger) == (95, 57, 1)
+    assert rec.payload.counters_time == 655460815.0
+    assert rec.payload.delta_time is None
+    assert not roundtrip(Record(2, RecordType.COUNTER, 1.5,
+                                CountRecord("foo"))).payload.valid
+    cnt.delta_time = 5.000125
+    assert roundtrip(Record(1, RecordType.COUNTER, 1.5,
+                            cnt)).payload.delta_time == 5.000125
+
+
+def test_count_record_version_1():
+    cnt = CountRecord(
+        "DS S0=0000005F S1=00000000 S2=00000039 S3=00000000 S4=00000001 S5=271189CF")
+    data = bytearray(encode_record(Record(1, RecordType.COUNTER, 1.5, cnt)))
+    # version 1 had no poll interval
+    data[3] = 1
+    rec = decode_record(bytes(data[:-8]))
+    assert rec.payload.counts_ch0 == 95
+    assert rec.payload.delta_time is None
+
+
+def test_temperature_and_pressure_records():
+    rec = roundtrip(Record(3, RecordType.TEMPERATURE, 2.0,
+                           TemperatureRecord("TH TH=22.9")))
+    assert rec.payload.valid and rec.payload.temperature == 22.9
+    rec = roundtrip(Record(4, RecordType.PRESSURE, 2.0, PressureRecord(
+        "mBar now reads  = 1015.0  (use cmd 'SA' when done)")))
+    assert rec.payload.pressure == "1015.0"
+    assert rec.payload.pressure_type == PressureType.MBAR
+    assert str(rec.payload) == "1015.0 MBAR"
+
+
+def test_pulse_record():
+    pulses = np.array([(7, 0, 12.5, 40.0, 1605700800 * 10 ** 9),
+                       (8, 3, 0.0, 9960.0, 1605700801 * 10 ** 9)],
+                      dtype=PULSE_DTYPE)
+    rec = roundtrip(Record(5, RecordType.PULSES, 2.0,
+                           PulseRecord(pulses, 7, 3)))
+    assert rec.payload.pulses.dtype == PULSE_DTYPE
+    assert rec.payload.pulses.tolist() == pulses.tolist()
+    assert (rec.payload.first_event, rec.payload.events) == (7, 3)
+    assert str(rec.payload) == "2 pulses in events 7 to 9"
+
+
+def test_empty_record():
+    rec = roundtrip(Record(None, None, None, None))
+    assert rec.packageNumber is None and rec.type is None
+    assert rec.timestamp is None and rec.payload is None
+
+
+def test_unknown_version():
+    data = bytearray(encode_record(Record(1, RecordType.DATA, 1.0,
+                                          DataRecord("x"))))
+    data[3] = 99
+    with pytest.raises(WireFormatError):
+        decode_record(bytes(data))
+
+
+def test_data_batch():
+    lines = ["75E75C33 A9 00 2A 00 00 00 00 00 7545B6DD 020929.026 060180 V 08 0 +0059",
+             "75E75C34 00 00 00 3F 00 00 00 00 7545B6DD 020929.026 060180 V 08 0 +0059",
+             ""]
+    data = encode_data_batch(40, [1.0, 1.5, 2.0], lines)
+    assert not is_binary(data)
+    with pytest.raises(WireFormatError):
+        decode_record(data)
+    records = decode_records(data)
+    assert [r.packageNumber for r in records] == [40, 41, 42]
+    assert [r.timestamp for r in records] == [1.0, 1.5, 2.0]
+    assert [r.payload.msg for r in records] == lines
+    assert all(r.type == RecordType.DATA for r in records)
+    assert len(as_text(data).split("\n")) == 3
+    # single records give a list with one element
+    single = encode_record(Record(3, RecordType.DATA, 1.0, DataRecord("x")))
+    assert decode_records(single)[0].packageNumber == 3
+
+
+def test_legacy_jsonpickle(monkeypatch):
+    # legacy files reference the classes as lib.common.*
+    monkeypatch.syspath_prepend("rewrite")
+    with open("rewrite/test/data/raw.txt") as f:
+        lines = f.readlines()
+    line = lines[499]
+    rec = decode_record(line)
+    assert rec.packageNumber == 278
+    assert rec.payload.msg.startswith("373AAAD3 B3")
+    assert decode_record(line.encode("utf-8")).packageNumber == 278
+    assert as_text(line) == line
+    # binary messages can be converted back into jsonpickle lines
+    assert decode_record(as_text(encode_record(rec))).payload.msg == \
+        rec.payload.msg
@@ -0,0 +1,73 @@
+import gzip
+import time
+import zmq
+from ..lib.common.Record import Record, RecordType
+from ..lib.common.DataRecord import DataRecord
+from ..lib.utils.ArchiveWriter import ArchiveReader
+from ..lib.utils.Stream import publish_record
+from ..lib.utils.WriterToFile import WriterToFile
+
+
+def publish_until(pub, received, deadline=5.0):
+    """
+    Publish DATA records until received() is true
+    """
+    end = time.monotonic() + deadline
+    i = 0
+    while not received() and time.monotonic() < end:
+        publish_record(pub, Record(i, RecordType.DATA, 1000.0 + i,
+                                   DataRecord("line %d" % i)))
+        i += 1
+        time.sleep(0.01)
+    assert received()
+
+
+def test_stop_writes_waiting_lines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pub = zmq.Context.instance().socket(zmq.PUB)
+    pub.bind("tcp://127.0.0.1:*")
+    try:
+        writer = WriterToFile(
+            flush_interval=60,
+            address=pub.getsockopt(zmq.LAST_ENDPOINT).decode())
+        writer.runDaemon()
+        # the lines only wait in memory, nothing is written before stop
+        publish_until(pub, lambda: writer.outFile._size > 0)
+        writer.stop()
+    finally:
+        pub.close(linger=0)
+
+    assert writer.outFile.closed
+    with open(tmp_path / (writer.starttime + "_F.txt")) as f:
+        lines = f.read().splitlines()
+    assert lines and all(line.startswith("{") for line in lines)
+
+
+def test_stop_writes_open_archive_block(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pub = zmq.Context.instance().socket(zmq.PUB)
+    pub.bind("tcp://127.0.0.1:*")
+    try:
+        writer = WriterToFile(
+            archive=True, address=pub.getsockopt(zmq.LAST_ENDPOINT).decode())
+        writer.runDaemon()
+        # the block is neither full nor old enough to be written
+        publish_until(pub, lambda: len(writer.archive._lines) >= 5)
+        assert writer.archive.segments == 0
+        writer.stop()
+    finally:
+        pub.close(linger=0)
+
+    assert writer.archive.closed
+    reader = ArchiveReader(writer.starttime + "_F.idx")
+    assert len(reader.blocks) == 1
+    block = reader.blocks[0]
+    records = reader.read_block(block)
+    assert block["segment"] == writer.starttime + "_F_0000.txt.gz"
+    with gzip.open(block["segment"], "rt") as f:
+        assert len(f.read().splitlines()) == block["records"]
+    assert len(records) == block["records"] >= 5
+    assert (records[0].packageNumber, records[-1].packageNumber) == \
+        (block["first_package"], block["last_package"])
+    assert (records[0].timestamp, records[-1].timestamp) == \
+        (block["first_time"], block["last_time"])